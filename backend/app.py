@@ -1,138 +1,235 @@
-from flask import Flask, send_from_directory, jsonify, request
-from flask_cors import CORS
-from flask_wtf.csrf import CSRFProtect
-from config import Config
-from routes.auth import auth_bp
-from routes.system_calls import system_calls_bp
-from routes.logs import logs_bp
-from routes.file_manager import file_manager_bp
-from routes.recycle_bin import recycle_bin_bp
-import os
-
-# Get absolute paths
-BASE_DIR = os.path.dirname(os.path.abspath(__file__))
-FRONTEND_DIR = os.path.join(os.path.dirname(BASE_DIR), 'frontend')
-
-app = Flask(__name__, static_folder=FRONTEND_DIR, static_url_path='')
-app.config.from_object(Config)
-
-# =========================
-# SECURITY CONFIGURATION
-# =========================
-
-# Initialize CSRF protection
-csrf = CSRFProtect(app)
-
-# Enable CORS with credential support for CSRF-protected endpoints
-CORS(app, resources={r"/api/*": {"origins": "*"}}, supports_credentials=True)
-
-# Limit request size (5MB)
-app.config['MAX_CONTENT_LENGTH'] = 5 * 1024 * 1024
-
-
-# =========================
-# GLOBAL VALIDATION MIDDLEWARE
-# =========================
-@app.before_request
-def validate_requests():
-
-    # Allow frontend + static files
-    if not request.path.startswith("/api"):
-        return
-
-    # Allow test route
-    if request.path == "/api/test":
-        return
-
-    # Block empty POST/PUT/DELETE requests
-    if request.method in ["POST", "PUT", "DELETE"]:
-        if not request.data:
-            return jsonify({"error": "Empty request body not allowed"}), 400
-
-    # Validate JSON requests
-    if request.is_json:
-        data = request.get_json(silent=True)
-
-        if data is None:
-            return jsonify({"error": "Invalid JSON format"}), 400
-
-        if isinstance(data, dict) and len(data) == 0:
-            return jsonify({"error": "Empty JSON payload not allowed"}), 400
-
-
-# =========================
-# REGISTER BLUEPRINTS
-# =========================
-app.register_blueprint(auth_bp, url_prefix='/api/auth')
-app.register_blueprint(system_calls_bp, url_prefix='/api/system')
-app.register_blueprint(logs_bp, url_prefix='/api')
-app.register_blueprint(file_manager_bp, url_prefix='/api/files')
-app.register_blueprint(recycle_bin_bp, url_prefix='/api/recycle-bin')
-
-
-# =========================
-# TEST ENDPOINT
-# =========================
-@app.route('/api/test', methods=['GET'])
-def test():
-    return jsonify({
-        "ok": True,
-        "message": "API is working!",
-        "frontend_dir": FRONTEND_DIR
-    })
-
-
-# =========================
-# SERVE FRONTEND
-# =========================
-@app.route('/')
-def index():
-    return send_from_directory(FRONTEND_DIR, 'index.html')
-
-
-@app.route('/<path:path>')
-def serve_static(path):
-    full_path = os.path.join(FRONTEND_DIR, path)
-    if os.path.exists(full_path):
-        return send_from_directory(FRONTEND_DIR, path)
-    return send_from_directory(FRONTEND_DIR, 'index.html')
-
-
-# =========================
-# ERROR HANDLERS
-# =========================
-import logging
-import traceback
-
-logger = logging.getLogger(__name__)
-
-@app.errorhandler(404)
-def not_found(e):
-    return jsonify({'error': 'Resource not found', 'success': False}), 404
-
-
-@app.errorhandler(500)
-def internal_error(e):
-    return jsonify({'error': 'Internal server error', 'success': False}), 500
-
-
-@app.errorhandler(Exception)
-def handle_exception(e):
-    """Catch all unhandled exceptions, log them internally, and return generic error"""
-    logger.error("Unhandled exception: %s", traceback.format_exc())
-    return jsonify({'error': 'An internal error occurred', 'success': False}), 500
-
-
-# =========================
-# RUN SERVER
-# =========================
-if __name__ == '__main__':
-    print(">>> Starting System Call Interface Server...")
-    print(f">>> Server running at: http://localhost:5000")
-    print(f">>> Security features enabled")
-    print(f">>> Allowed commands: {', '.join(Config.ALLOWED_COMMANDS)}")
-    print(f">>> Frontend directory: {FRONTEND_DIR}")
-    print(f">>> Test endpoint: http://localhost:5000/api/test")
-
-    debug_mode = os.environ.get('FLASK_DEBUG', 'false').lower() == 'true'
-    app.run(debug=debug_mode, host='0.0.0.0', port=5000)
\ No newline at end of file
+from flask import Flask, Blueprint, Request, send_from_directory, jsonify, request
+from config import Config
+import os
+import logging
+import traceback
+
+# Get absolute paths
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+FRONTEND_DIR = os.path.join(os.path.dirname(BASE_DIR), 'frontend')
+
+logger = logging.getLogger(__name__)
+
+# Only light imports at module level: processes spawned by the key
+# derivation pool re-run this file (as __mp_main__) when it is the main
+# script, and must not open the database or start background tasks. The
+# app itself is built by create_app().
+
+
+class SandboxRequest(Request):
+    """Request whose body limit depends on the endpoint"""
+
+    # Streamed to disk, so allowed past MAX_CONTENT_LENGTH
+    UPLOAD_LIMITS = {
+        'file_manager.upload_file': Config.MAX_UPLOAD_SIZE,
+        'uploads.put_chunk': Config.RESUMABLE_MAX_CHUNK_SIZE,
+    }
+
+    @property
+    def max_content_length(self):
+        return self.UPLOAD_LIMITS.get(self.endpoint, Config.MAX_CONTENT_LENGTH)
+
+
+# =========================
+# GLOBAL VALIDATION MIDDLEWARE
+# =========================
+
+# Actions whose options all have defaults, so they may be sent without a body
+BODY_OPTIONAL_ENDPOINTS = {'uploads.complete_upload'}
+
+
+def validate_requests():
+
+    # Allow frontend + static files
+    if not request.path.startswith("/api"):
+        return
+
+    # Allow test route
+    if request.path == "/api/test":
+        return
+
+    # Block empty POST/PUT/DELETE requests
+    # (check the declared length; request.data would buffer the whole body
+    # and is always empty for multipart uploads; chunked bodies declare none)
+    body_optional = request.endpoint in BODY_OPTIONAL_ENDPOINTS
+    chunked = 'chunked' in request.headers.get('Transfer-Encoding', '').lower()
+    if request.method in ["POST", "PUT", "DELETE"] and not body_optional:
+        if not request.content_length and not chunked:
+            return jsonify({"error": "Empty request body not allowed"}), 400
+
+    # Validate JSON requests
+    if request.is_json and (request.content_length or chunked or not body_optional):
+        data = request.get_json(silent=True)
+
+        if data is None:
+            return jsonify({"error": "Invalid JSON format"}), 400
+
+        if isinstance(data, dict) and len(data) == 0 and not body_optional:
+            return jsonify({"error": "Empty JSON payload not allowed"}), 400
+
+
+# =========================
+# TEST ENDPOINT AND FRONTEND
+# =========================
+frontend_bp = Blueprint('frontend', __name__)
+
+
+@frontend_bp.route('/api/test', methods=['GET'])
+def test():
+    return jsonify({
+        "ok": True,
+        "message": "API is working!",
+        "frontend_dir": FRONTEND_DIR
+    })
+
+
+@frontend_bp.route('/')
+def index():
+    return send_from_directory(FRONTEND_DIR, 'index.html')
+
+
+@frontend_bp.route('/<path:path>')
+def serve_static(path):
+    full_path = os.path.join(FRONTEND_DIR, path)
+    if os.path.exists(full_path):
+        return send_from_directory(FRONTEND_DIR, path)
+    return send_from_directory(FRONTEND_DIR, 'index.html')
+
+
+# =========================
+# ERROR HANDLERS
+# =========================
+def not_found(e):
+    return jsonify({'error': 'Resource not found', 'success': False}), 404
+
+
+def too_large(e):
+    return jsonify({'error': 'Request body too large', 'success': False}), 413
+
+
+def internal_error(e):
+    return jsonify({'error': 'Internal server error', 'success': False}), 500
+
+
+def handle_exception(e):
+    """Catch all unhandled exceptions, log them internally, and return generic error"""
+    logger.error("Unhandled exception: %s", traceback.format_exc())
+    return jsonify({'error': 'An internal error occurred', 'success': False}), 500
+
+
+def create_app():
+    """Build the app: security, blueprints, error handlers and background tasks"""
+    from flask_cors import CORS
+    from flask_wtf.csrf import CSRFProtect
+    from routes.auth import auth_bp
+    from routes.system_calls import system_calls_bp
+    from routes.logs import logs_bp
+    from routes.file_manager import file_manager_bp
+    from routes.recycle_bin import recycle_bin_bp
+    from routes.uploads import uploads_bp, reap_stale_uploads
+    from routes.bulk_ops import bulk_ops_bp
+    from routes.quotas import quotas_bp
+    from routes.integrity import integrity_bp
+    from routes.metrics import metrics_bp
+    from routes.profiling import profiling_bp
+    from utils.background import start_periodic_task
+    from utils.blob_store import collect_garbage
+    from utils.recycle_store import reaper as recycle_reaper, RECYCLE_BIN_DIR
+    from utils.recycle_jobs import resume_stale_jobs
+    from utils.files_index import reconcile as reconcile_files_index, pending_reconciler as files_index_events
+    from utils.integrity import verify_batch as verify_integrity
+    from utils.fs_watcher import watcher as fs_watcher
+    from utils import metrics, profiling
+    from utils.secure_ops import SANDBOX_DIR
+
+    app = Flask(__name__, static_folder=FRONTEND_DIR, static_url_path='')
+    app.request_class = SandboxRequest
+    app.config.from_object(Config)
+
+    # =========================
+    # SECURITY CONFIGURATION
+    # =========================
+
+    # Initialize CSRF protection
+    CSRFProtect(app)
+
+    # Enable CORS with credential support for CSRF-protected endpoints
+    CORS(app, resources={r"/api/*": {"origins": "*"}}, supports_credentials=True)
+
+    # Limit request size (uploads have their own limits, see SandboxRequest)
+    app.config['MAX_CONTENT_LENGTH'] = Config.MAX_CONTENT_LENGTH
+
+    app.before_request(validate_requests)
+
+    # =========================
+    # REGISTER BLUEPRINTS
+    # =========================
+    app.register_blueprint(auth_bp, url_prefix='/api/auth')
+    app.register_blueprint(system_calls_bp, url_prefix='/api/system')
+    app.register_blueprint(logs_bp, url_prefix='/api')
+    app.register_blueprint(file_manager_bp, url_prefix='/api/files')
+    app.register_blueprint(recycle_bin_bp, url_prefix='/api/recycle-bin')
+    app.register_blueprint(uploads_bp, url_prefix='/api/files/uploads')
+    app.register_blueprint(bulk_ops_bp, url_prefix='/api/files/bulk')
+    app.register_blueprint(quotas_bp, url_prefix='/api/quotas')
+    app.register_blueprint(integrity_bp, url_prefix='/api/integrity')
+    if metrics.install(app):
+        app.register_blueprint(metrics_bp, url_prefix='/api')
+    if profiling.install(app):
+        app.register_blueprint(profiling_bp, url_prefix='/api/profiling')
+    # Last: its catch-all route serves the frontend
+    app.register_blueprint(frontend_bp)
+
+    app.register_error_handler(404, not_found)
+    app.register_error_handler(413, too_large)
+    app.register_error_handler(500, internal_error)
+    app.register_error_handler(Exception, handle_exception)
+
+    # =========================
+    # BACKGROUND TASKS
+    # =========================
+    start_periodic_task('upload-reaper', Config.UPLOAD_REAPER_INTERVAL, reap_stale_uploads)
+    start_periodic_task('blob-gc', Config.BLOB_GC_INTERVAL, collect_garbage)
+    recycle_reaper.start()
+    recycle_reaper.schedule(0)  # purge anything that expired while the server was down
+    start_periodic_task('recycle-jobs', Config.RECYCLE_JOB_STALE_AFTER, resume_stale_jobs)
+    start_periodic_task('files-reconciler', Config.FILES_RECONCILE_INTERVAL, reconcile_files_index)
+    if Config.INTEGRITY_VERIFY_ENABLED:
+        start_periodic_task('integrity-verifier', Config.INTEGRITY_VERIFY_INTERVAL, verify_integrity)
+    if Config.FS_WATCH_ENABLED:
+        fs_watcher.watch(SANDBOX_DIR)
+        fs_watcher.watch(RECYCLE_BIN_DIR)
+        fs_watcher.start()
+        files_index_events.start()
+
+    return app
+
+
+_app = None
+
+
+def __getattr__(name):
+    """Build the app on first access to app.app (WSGI servers, from app import app)"""
+    global _app
+    if name == 'app':
+        if _app is None:
+            _app = create_app()
+        return _app
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+# =========================
+# RUN SERVER
+# =========================
+if __name__ == '__main__':
+    app = create_app()
+
+    print(">>> Starting System Call Interface Server...")
+    print(f">>> Server running at: http://localhost:5000")
+    print(f">>> Security features enabled")
+    print(f">>> Allowed commands: {', '.join(Config.ALLOWED_COMMANDS)}")
+    print(f">>> Frontend directory: {FRONTEND_DIR}")
+    print(f">>> Test endpoint: http://localhost:5000/api/test")
+
+    debug_mode = os.environ.get('FLASK_DEBUG', 'false').lower() == 'true'
+    app.run(debug=debug_mode, host='0.0.0.0', port=5000)
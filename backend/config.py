@@ -1,39 +1,150 @@
-import os
-import sys
-from dotenv import load_dotenv
-
-load_dotenv()
-
-def _validate_secret_key(key_name: str) -> str:
-    """Validate that a secret key is set and meets minimum security requirements."""
-    value = os.getenv(key_name)
-    if not value:
-        print(f"FATAL: {key_name} environment variable is not set.", file=sys.stderr)
-        sys.exit(1)
-    if len(value) < 32:
-        print(f"FATAL: {key_name} must be at least 32 characters.", file=sys.stderr)
-        sys.exit(1)
-    return value
-
-class Config:
-    SECRET_KEY = _validate_secret_key('SECRET_KEY')
-    JWT_SECRET_KEY = _validate_secret_key('JWT_SECRET_KEY')
-    DATABASE_PATH = os.getenv('DATABASE_PATH', 'database/database.db')
-    ENCRYPTION_KEY = _validate_secret_key('ENCRYPTION_KEY')
-    
-    # JWT Configuration
-    JWT_ACCESS_TOKEN_EXPIRES = 3600  # 1 hour
-    JWT_REFRESH_TOKEN_EXPIRES = 2592000  # 30 days
-    
-    # Security Settings
-    ALLOWED_COMMANDS = [
-        'ls', 'dir', 'pwd', 'whoami', 'date', 'echo',
-        'ipconfig', 'hostname', 'systeminfo', 'tasklist'
-    ]
-    
-    # Rate Limiting
-    RATE_LIMIT_ENABLED = True
-    MAX_REQUESTS_PER_MINUTE = 60
-    
-    # CORS Settings
-    CORS_ORIGINS = ['http://localhost:5000', 'http://127.0.0.1:5000']
+import os
+import sys
+from dotenv import load_dotenv
+
+load_dotenv()
+
+def _validate_secret_key(key_name: str) -> str:
+    """Validate that a secret key is set and meets minimum security requirements."""
+    value = os.getenv(key_name)
+    if not value:
+        print(f"FATAL: {key_name} environment variable is not set.", file=sys.stderr)
+        sys.exit(1)
+    if len(value) < 32:
+        print(f"FATAL: {key_name} must be at least 32 characters.", file=sys.stderr)
+        sys.exit(1)
+    return value
+
+class Config:
+    SECRET_KEY = _validate_secret_key('SECRET_KEY')
+    JWT_SECRET_KEY = _validate_secret_key('JWT_SECRET_KEY')
+    DATABASE_PATH = os.getenv('DATABASE_PATH', 'database/database.db')
+    ENCRYPTION_KEY = _validate_secret_key('ENCRYPTION_KEY')
+    
+    # JWT Configuration
+    JWT_ACCESS_TOKEN_EXPIRES = 3600  # 1 hour
+    JWT_REFRESH_TOKEN_EXPIRES = 2592000  # 30 days
+    UNLOCK_TOKEN_EXPIRES = 900  # AppLock unlock tokens: 15 minutes
+    
+    # Security Settings
+    ALLOWED_COMMANDS = [
+        'ls', 'dir', 'pwd', 'whoami', 'date', 'echo',
+        'ipconfig', 'hostname', 'systeminfo', 'tasklist'
+    ]
+    
+    # Rate Limiting
+    RATE_LIMIT_ENABLED = True
+    MAX_REQUESTS_PER_MINUTE = 60
+    
+    # Request bodies are capped at MAX_CONTENT_LENGTH, except uploads: they
+    # are streamed to disk, so their cap only bounds disk use
+    MAX_CONTENT_LENGTH = int(os.getenv('MAX_REQUEST_SIZE', 16 * 1024 * 1024))  # 16MB
+    MAX_UPLOAD_SIZE = int(os.getenv('MAX_UPLOAD_SIZE', 512 * 1024 * 1024))  # 512MB
+    UPLOAD_CHUNK_SIZE = 64 * 1024
+    
+    # Compression at rest: 'auto' compresses uploads that shrink enough,
+    # 'off' only when the upload asks for it
+    COMPRESSION_POLICY = os.getenv('COMPRESSION_POLICY', 'off')
+    COMPRESSION_MIN_RATIO = 0.9  # compressed/original, measured on a sample
+    COMPRESSION_MIN_SIZE = 4096
+    
+    # Resumable uploads: chunks are staged outside the sandbox until finalize
+    UPLOAD_STAGING_DIR = os.getenv('UPLOAD_STAGING_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'upload_staging'))
+    RESUMABLE_DEFAULT_CHUNK_SIZE = 4 * 1024 * 1024  # 4MB
+    RESUMABLE_MAX_CHUNK_SIZE = 16 * 1024 * 1024  # 16MB
+    RESUMABLE_MAX_FILE_SIZE = int(os.getenv('RESUMABLE_MAX_FILE_SIZE', 10 * 1024 * 1024 * 1024))  # 10GB
+    UPLOAD_SESSION_TTL = 24 * 3600  # idle sessions are reaped after 24 hours
+    UPLOAD_REAPER_INTERVAL = 600
+    
+    # Deduplicated blob store: sweep for unreferenced blobs hourly
+    BLOB_GC_INTERVAL = 3600
+    
+    # Recycle Bin: entries are purged RECYCLE_BIN_RETENTION seconds after
+    # deletion by a reaper that sleeps until the next expiry
+    RECYCLE_BIN_RETENTION = 1800  # 30 minutes
+    RECYCLE_REAPER_MAX_SLEEP = 300
+    RECYCLE_PURGE_BATCH = 500
+    RECYCLE_LIST_DEFAULT_LIMIT = 100
+    RECYCLE_LIST_MAX_LIMIT = 1000
+    # Emptying the bin runs in the background, in throttled batches; jobs
+    # that stop reporting progress this long are resumed
+    RECYCLE_EMPTY_BATCH = 100
+    RECYCLE_EMPTY_BATCH_DELAY = 0.2  # seconds between batches
+    RECYCLE_JOB_STALE_AFTER = 60
+    
+    # Files index: compare the files table with the sandbox directory and
+    # fix drift every few minutes
+    FILES_RECONCILE_INTERVAL = 300
+    FILES_RECONCILE_BATCH = 500
+    FILES_RECONCILE_SETTLE = 2  # seconds a file must be unchanged before it is reconciled
+    
+    # Sandbox change watcher: inotify on Linux ('auto' or 'inotify'), else
+    # rescanning the directories every FS_WATCH_POLL_INTERVAL seconds
+    FS_WATCH_ENABLED = os.getenv('FS_WATCH_ENABLED', 'true').lower() == 'true'
+    FS_WATCH_BACKEND = os.getenv('FS_WATCH_BACKEND', 'auto')  # 'auto', 'inotify' or 'polling'
+    FS_WATCH_POLL_INTERVAL = 5
+    
+    # Integrity verification: re-hash the least recently verified files
+    # in the background, throttled so it does not compete with requests
+    INTEGRITY_VERIFY_ENABLED = os.getenv('INTEGRITY_VERIFY_ENABLED', 'true').lower() == 'true'
+    INTEGRITY_VERIFY_INTERVAL = int(os.getenv('INTEGRITY_VERIFY_INTERVAL', 60))  # seconds between batches
+    INTEGRITY_VERIFY_BATCH = int(os.getenv('INTEGRITY_VERIFY_BATCH', 100))  # files per batch
+    INTEGRITY_VERIFY_BYTES_PER_SEC = int(os.getenv('INTEGRITY_VERIFY_BYTES_PER_SEC', 20 * 1024 * 1024))  # 0 = unthrottled
+    INTEGRITY_VERIFY_CHUNK_SIZE = 1024 * 1024
+    INTEGRITY_FAILURES_DEFAULT_LIMIT = 100
+    INTEGRITY_FAILURES_MAX_LIMIT = 1000
+    
+    # Storage quotas: logical bytes a user may own in the sandbox, by role
+    # (None = unlimited); users.quota_bytes overrides the role's quota
+    ROLE_QUOTAS = {
+        'admin': None,
+        'user': int(os.getenv('USER_QUOTA_BYTES', 1024 * 1024 * 1024)),  # 1GB
+        'viewer': int(os.getenv('VIEWER_QUOTA_BYTES', 100 * 1024 * 1024)),  # 100MB
+    }
+    QUOTA_TOP_DEFAULT_LIMIT = 20
+    QUOTA_TOP_MAX_LIMIT = 500
+    
+    # Password-based file encryption: PBKDF2 worker processes (0 = derive
+    # on the request thread) and a short-lived cache of derived keys
+    KDF_WORKERS = int(os.getenv('KDF_WORKERS', 2))
+    KDF_CACHE_TTL = 300  # 5 minutes
+    KDF_CACHE_SIZE = 128
+    
+    # File permissions are cached per process; changes made by other
+    # processes are noticed within this many seconds (0 = on every lookup)
+    PERMISSIONS_CACHE_CHECK_INTERVAL = 1
+    
+    # File Listing
+    FILE_LIST_DEFAULT_LIMIT = 500
+    FILE_LIST_MAX_LIMIT = 1000
+    BULK_MAX_ITEMS = 1000  # files per bulk operation request
+    
+    # File Viewing: reads return at most this many bytes per request
+    FILE_READ_MAX_WINDOW = 1024 * 1024  # 1MB
+    
+    # Version History: a full snapshot every N saves, deltas in between
+    VERSION_SNAPSHOT_INTERVAL = 10
+    VERSION_MAX_PER_FILE = 50
+    VERSION_MAX_TOTAL_BYTES = int(os.getenv('VERSION_MAX_TOTAL_BYTES', 100 * 1024 * 1024))  # 100MB
+    VERSION_MAX_FILE_SIZE = 10 * 1024 * 1024  # larger files are not versioned
+    
+    # Metrics: Prometheus text format at /api/metrics (admins only). Off by
+    # default; when off nothing is instrumented.
+    METRICS_ENABLED = os.getenv('METRICS_ENABLED', 'false').lower() == 'true'
+    
+    # Request profiling: admins start sessions at /api/profiling that save a
+    # cProfile dump or sampled collapsed stacks per profiled request. Off by
+    # default; when off no hooks are installed.
+    PROFILING_ENABLED = os.getenv('PROFILING_ENABLED', 'false').lower() == 'true'
+    PROFILE_DIR = os.getenv('PROFILE_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'profiles'))
+    PROFILE_SAMPLE_INTERVAL = 0.005  # seconds between stack samples
+    PROFILE_DEFAULT_SAMPLE_RATE = 0.01  # fraction of requests when no routes are given
+    PROFILE_DEFAULT_DURATION = 600
+    PROFILE_MAX_DURATION = 3600
+    PROFILE_DEFAULT_MAX_PROFILES = 100  # per session
+    PROFILE_MAX_FILES = 500  # oldest profiles are deleted beyond this
+    PROFILE_LIST_DEFAULT_LIMIT = 100
+    PROFILE_LIST_MAX_LIMIT = 1000
+    
+    # CORS Settings
+    CORS_ORIGINS = ['http://localhost:5000', 'http://127.0.0.1:5000']
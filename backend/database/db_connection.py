@@ -1,74 +1,322 @@
-import sqlite3
-import os
-from contextlib import contextmanager
-
-class Database:
-    def __init__(self, db_path):
-        self.db_path = db_path
-        self._ensure_db_exists()
-    
-    def _ensure_db_exists(self):
-        """Create database directory and initialize schema if needed"""
-        os.makedirs(os.path.dirname(self.db_path), exist_ok=True)
-        
-        if not os.path.exists(self.db_path):
-            self._initialize_schema()
-    
-    def _initialize_schema(self):
-        """Initialize database with schema"""
-        schema_path = os.path.join(os.path.dirname(__file__), 'schema.sql')
-        with open(schema_path, 'r') as f:
-            schema = f.read()
-        
-        with self.get_connection() as conn:
-            conn.executescript(schema)
-            conn.commit()
-    
-    @contextmanager
-    def get_connection(self):
-        """Context manager for database connections
-
-        Use check_same_thread=False to allow concurrent access from multiple
-        request threads. SQLite's default behavior (True) would cause "database
-        is locked" errors under concurrent load. Each thread creates its own
-        connection, so thread safety is handled via connection isolation.
-        """
-        conn = sqlite3.connect(self.db_path, check_same_thread=False)
-        conn.row_factory = sqlite3.Row
-        try:
-            yield conn
-        finally:
-            conn.close()
-    
-    def execute_query(self, query, params=None):
-        """Execute a query and return results"""
-        with self.get_connection() as conn:
-            cursor = conn.cursor()
-            if params:
-                cursor.execute(query, params)
-            else:
-                cursor.execute(query)
-            conn.commit()
-            return cursor.fetchall()
-    
-    def execute_insert(self, query, params=None):
-        """Execute insert and return last row id"""
-        with self.get_connection() as conn:
-            cursor = conn.cursor()
-            if params:
-                cursor.execute(query, params)
-            else:
-                cursor.execute(query)
-            conn.commit()
-            return cursor.lastrowid
-    
-    def execute_update(self, query, params=None):
-        """Execute update and return affected rows"""
-        with self.get_connection() as conn:
-            cursor = conn.cursor()
-            if params:
-                cursor.execute(query, params)
-            else:
-                cursor.execute(query)
-            conn.commit()
-            return cursor.rowcount
+import sqlite3
+import os
+import threading
+from contextlib import contextmanager
+
+# Columns added to existing tables after their first release. schema.sql
+# already has them for new databases; older databases get them via ALTER TABLE.
+COLUMN_MIGRATIONS = [
+    ('users', 'quota_bytes', 'INTEGER'),
+    ('files', 'verified_at', 'REAL'),
+    ('files', 'sha256', 'TEXT'),
+    ('files', 'mtime_ns', 'INTEGER'),
+    ('files', 'compression', 'TEXT'),
+    ('files', 'stored_size', 'INTEGER'),
+    ('recycle_bin', 'deleted_by_id', 'INTEGER'),
+    ('recycle_bin', 'file_record', 'TEXT'),
+]
+
+# Indexes over migrated columns, created once COLUMN_MIGRATIONS has run
+INDEX_MIGRATIONS = [
+    'CREATE INDEX IF NOT EXISTS idx_recycle_bin_owner ON recycle_bin(deleted_by_id, deleted_at)',
+    'CREATE INDEX IF NOT EXISTS idx_files_verified_at ON files(verified_at)',
+]
+
+# files allowed one row per (user, filename) although the sandbox holds one
+# file per name. Older databases are rebuilt with filename unique, keeping
+# the newest row of each name.
+FILES_REBUILD = [
+    '''CREATE TABLE files_rebuilt (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        user_id INTEGER,
+        filename TEXT NOT NULL UNIQUE,
+        original_filename TEXT,
+        file_size INTEGER,
+        content_type TEXT,
+        is_encrypted BOOLEAN DEFAULT 0,
+        sha256 TEXT,
+        mtime_ns INTEGER,
+        compression TEXT,
+        stored_size INTEGER,
+        verified_at REAL,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE SET NULL
+    )''',
+    '''INSERT INTO files_rebuilt (id, user_id, filename, original_filename, file_size, content_type, is_encrypted,
+                                 sha256, mtime_ns, compression, stored_size, verified_at, created_at, updated_at)
+       SELECT id, user_id, filename, original_filename, file_size, content_type, is_encrypted,
+              sha256, mtime_ns, compression, stored_size, verified_at, created_at, updated_at
+       FROM files WHERE id IN (SELECT MAX(id) FROM files GROUP BY filename)''',
+    'DROP TABLE files',
+    'ALTER TABLE files_rebuilt RENAME TO files',
+    'CREATE INDEX IF NOT EXISTS idx_files_user_id ON files(user_id)',
+    'CREATE INDEX IF NOT EXISTS idx_files_verified_at ON files(verified_at)',
+]
+
+# Keep storage_usage in step with files, in the same transaction as the
+# change. A file counts its logical size against its owner. Created after
+# FILES_REBUILD, since dropping the old table drops its triggers. Counter
+# rows are created with NOT EXISTS rather than INSERT OR IGNORE: inside a
+# trigger the conflict policy of the statement that fired it (such as an
+# upsert on files) would override OR IGNORE. A trigger whose stored
+# definition differs from the one here is replaced at startup.
+USAGE_TRIGGERS = {
+    'files_usage_insert': '''CREATE TRIGGER files_usage_insert AFTER INSERT ON files
+       WHEN NEW.user_id IS NOT NULL
+       BEGIN
+           INSERT INTO storage_usage (user_id) SELECT NEW.user_id
+           WHERE NOT EXISTS (SELECT 1 FROM storage_usage WHERE user_id = NEW.user_id);
+           UPDATE storage_usage
+           SET bytes_used = bytes_used + COALESCE(NEW.file_size, NEW.stored_size, 0), file_count = file_count + 1
+           WHERE user_id = NEW.user_id;
+       END''',
+    'files_usage_delete': '''CREATE TRIGGER files_usage_delete AFTER DELETE ON files
+       WHEN OLD.user_id IS NOT NULL
+       BEGIN
+           UPDATE storage_usage
+           SET bytes_used = bytes_used - COALESCE(OLD.file_size, OLD.stored_size, 0), file_count = file_count - 1
+           WHERE user_id = OLD.user_id;
+       END''',
+    'files_usage_update': '''CREATE TRIGGER files_usage_update AFTER UPDATE OF user_id, file_size, stored_size ON files
+       BEGIN
+           UPDATE storage_usage
+           SET bytes_used = bytes_used - COALESCE(OLD.file_size, OLD.stored_size, 0), file_count = file_count - 1
+           WHERE user_id = OLD.user_id;
+           INSERT INTO storage_usage (user_id) SELECT NEW.user_id
+           WHERE NEW.user_id IS NOT NULL
+             AND NOT EXISTS (SELECT 1 FROM storage_usage WHERE user_id = NEW.user_id);
+           UPDATE storage_usage
+           SET bytes_used = bytes_used + COALESCE(NEW.file_size, NEW.stored_size, 0), file_count = file_count + 1
+           WHERE user_id = NEW.user_id;
+       END''',
+}
+
+# Keep version_storage's single row in step with file_versions
+VERSION_STORAGE_TRIGGERS = {
+    'file_versions_storage_insert': '''CREATE TRIGGER file_versions_storage_insert AFTER INSERT ON file_versions
+       BEGIN
+           INSERT INTO version_storage (id) SELECT 1
+           WHERE NOT EXISTS (SELECT 1 FROM version_storage WHERE id = 1);
+           UPDATE version_storage SET bytes_stored = bytes_stored + LENGTH(NEW.data) WHERE id = 1;
+       END''',
+    'file_versions_storage_delete': '''CREATE TRIGGER file_versions_storage_delete AFTER DELETE ON file_versions
+       BEGIN
+           UPDATE version_storage SET bytes_stored = bytes_stored - LENGTH(OLD.data) WHERE id = 1;
+       END''',
+    'file_versions_storage_update': '''CREATE TRIGGER file_versions_storage_update AFTER UPDATE OF data ON file_versions
+       BEGIN
+           UPDATE version_storage SET bytes_stored = bytes_stored - LENGTH(OLD.data) + LENGTH(NEW.data) WHERE id = 1;
+       END''',
+}
+
+
+def _cache_version_triggers(table):
+    """Triggers bumping table's cache_versions row on any change to it"""
+    triggers = {}
+    for event in ('INSERT', 'UPDATE', 'DELETE'):
+        name = f'{table}_version_{event.lower()}'
+        triggers[name] = f'''CREATE TRIGGER {name} AFTER {event} ON {table}
+       BEGIN
+           INSERT INTO cache_versions (name) SELECT '{table}'
+           WHERE NOT EXISTS (SELECT 1 FROM cache_versions WHERE name = '{table}');
+           UPDATE cache_versions SET version = version + 1 WHERE name = '{table}';
+       END'''
+    return triggers
+
+
+# Tables whose rows are cached in process memory (see utils/permissions_store.py)
+CACHE_VERSION_TRIGGERS = _cache_version_triggers('file_permissions')
+
+
+class Database:
+    # Schema is idempotent (CREATE ... IF NOT EXISTS), so it is applied once per
+    # database path per process. This lets new tables reach existing databases.
+    _initialized_paths = set()
+    _init_lock = threading.Lock()
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+        self._ensure_db_exists()
+
+    def _ensure_db_exists(self):
+        """Create database directory and initialize schema if needed"""
+        os.makedirs(os.path.dirname(self.db_path), exist_ok=True)
+
+        with Database._init_lock:
+            real_path = os.path.realpath(self.db_path)
+            if real_path not in Database._initialized_paths:
+                self._initialize_schema()
+                Database._initialized_paths.add(real_path)
+
+    def _initialize_schema(self):
+        """Initialize database with schema"""
+        schema_path = os.path.join(os.path.dirname(__file__), 'schema.sql')
+        with open(schema_path, 'r') as f:
+            schema = f.read()
+
+        with self.get_connection() as conn:
+            # WAL lets readers proceed while a writer holds the database
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.executescript(schema)
+            self._add_missing_columns(conn)
+            conn.commit()
+            self._rebuild_files_table(conn)
+            self._sync_triggers(conn, USAGE_TRIGGERS)
+            self._sync_triggers(conn, VERSION_STORAGE_TRIGGERS)
+            self._sync_triggers(conn, CACHE_VERSION_TRIGGERS)
+
+    def _missing_columns(self, conn):
+        missing = []
+        for table, column, definition in COLUMN_MIGRATIONS:
+            existing = {row['name'] for row in conn.execute(f'PRAGMA table_info({table})')}
+            if column not in existing:
+                missing.append((table, column, definition))
+        return missing
+
+    def _add_missing_columns(self, conn):
+        """Bring tables created by an older schema.sql up to date; concurrent starters wait and skip it"""
+        if self._missing_columns(conn):
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                for table, column, definition in self._missing_columns(conn):
+                    conn.execute(f'ALTER TABLE {table} ADD COLUMN {column} {definition}')
+                conn.commit()
+            except BaseException:
+                conn.rollback()
+                raise
+        for statement in INDEX_MIGRATIONS:
+            conn.execute(statement)
+
+    def _files_keyed_by_user(self, conn):
+        """True if files still has the old UNIQUE(user_id, filename) constraint"""
+        for index in conn.execute('PRAGMA index_list(files)').fetchall():
+            if index['unique']:
+                columns = [row['name'] for row in conn.execute(f"PRAGMA index_info('{index['name']}')")]
+                if columns == ['user_id', 'filename']:
+                    return True
+        return False
+
+    def _rebuild_files_table(self, conn):
+        """Apply FILES_REBUILD once; other processes starting at the same time wait and skip it"""
+        if not self._files_keyed_by_user(conn):
+            return
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            if self._files_keyed_by_user(conn):
+                for statement in FILES_REBUILD:
+                    conn.execute(statement)
+            conn.commit()
+        except BaseException:
+            conn.rollback()
+            raise
+
+    def _stale_triggers(self, conn, triggers):
+        rows = conn.execute("SELECT name, sql FROM sqlite_master WHERE type = 'trigger'")
+        stored = {row['name']: row['sql'] for row in rows}
+        return [name for name, sql in triggers.items() if stored.get(name) != sql]
+
+    def _sync_triggers(self, conn, triggers):
+        """
+        Create triggers that are missing or out of date. Drop and create run
+        in one transaction, so concurrent writers never miss a trigger and
+        processes starting together do not race to create the same one.
+        """
+        if not self._stale_triggers(conn, triggers):
+            return
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            for name in self._stale_triggers(conn, triggers):
+                conn.execute(f'DROP TRIGGER IF EXISTS {name}')
+                conn.execute(triggers[name])
+            conn.commit()
+        except BaseException:
+            conn.rollback()
+            raise
+
+    @contextmanager
+    def get_connection(self):
+        """Context manager for database connections
+
+        Use check_same_thread=False to allow concurrent access from multiple
+        request threads. SQLite's default behavior (True) would cause "database
+        is locked" errors under concurrent load. Each thread creates its own
+        connection, so thread safety is handled via connection isolation.
+        """
+        conn = sqlite3.connect(self.db_path, check_same_thread=False, timeout=30)
+        conn.row_factory = sqlite3.Row
+        try:
+            yield conn
+        finally:
+            conn.close()
+
+    @contextmanager
+    def transaction(self):
+        """Connection inside a write transaction, committed on success and rolled back on error
+
+        BEGIN IMMEDIATE takes the write lock up front, so statements from
+        several stores (passed this connection) apply together or not at all.
+        """
+        with self.get_connection() as conn:
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                yield conn
+                conn.commit()
+            except BaseException:
+                conn.rollback()
+                raise
+
+    def execute_query(self, query, params=None):
+        """Execute a query and return results"""
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            if params:
+                cursor.execute(query, params)
+            else:
+                cursor.execute(query)
+            conn.commit()
+            return cursor.fetchall()
+
+    def execute_insert(self, query, params=None):
+        """Execute insert and return last row id"""
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            if params:
+                cursor.execute(query, params)
+            else:
+                cursor.execute(query)
+            conn.commit()
+            return cursor.lastrowid
+
+    def execute_update(self, query, params=None):
+        """Execute update and return affected rows"""
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            if params:
+                cursor.execute(query, params)
+            else:
+                cursor.execute(query)
+            conn.commit()
+            return cursor.rowcount
+
+    def execute_many(self, query, params_seq):
+        """Execute a statement for each parameter tuple in one transaction"""
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.executemany(query, params_seq)
+            conn.commit()
+            return cursor.rowcount
+
+    def migration_applied(self, name):
+        """Check whether a named one-time data migration has already run"""
+        rows = self.execute_query('SELECT 1 FROM migrations WHERE name = ?', (name,))
+        return bool(rows)
+
+    def cache_version(self, name):
+        """Change counter of a table cached in memory (see CACHE_VERSION_TRIGGERS)"""
+        rows = self.execute_query('SELECT version FROM cache_versions WHERE name = ?', (name,))
+        return rows[0]['version'] if rows else 0
+
+    def mark_migration(self, name):
+        """Record that a named one-time data migration has run"""
+        self.execute_insert('INSERT OR IGNORE INTO migrations (name) VALUES (?)', (name,))
@@ -1,74 +1,240 @@
--- Users Table
-CREATE TABLE IF NOT EXISTS users (
-    id INTEGER PRIMARY KEY AUTOINCREMENT,
-    username TEXT UNIQUE NOT NULL,
-    email TEXT UNIQUE NOT NULL,
-    password_hash TEXT NOT NULL,
-    role TEXT DEFAULT 'user' CHECK(role IN ('admin', 'user', 'viewer')),
-    session_id TEXT,
-    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-);
-
--- System Calls Table
-CREATE TABLE IF NOT EXISTS system_calls (
-    id INTEGER PRIMARY KEY AUTOINCREMENT,
-    user_id INTEGER NOT NULL,
-    command TEXT NOT NULL,
-    parameters TEXT,
-    output TEXT,
-    status TEXT CHECK(status IN ('success', 'failure', 'pending')),
-    executed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-    FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE
-);
-
--- Logs Table
-CREATE TABLE IF NOT EXISTS logs (
-    id INTEGER PRIMARY KEY AUTOINCREMENT,
-    user_id INTEGER,
-    action_type TEXT NOT NULL,
-    ip_address TEXT,
-    status TEXT CHECK(status IN ('success', 'failure')),
-    details TEXT,
-    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-    FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE SET NULL
-);
-
--- Files Table
-CREATE TABLE IF NOT EXISTS files (
-    id INTEGER PRIMARY KEY AUTOINCREMENT,
-    user_id INTEGER NOT NULL,
-    filename TEXT NOT NULL,
-    original_filename TEXT,
-    file_size INTEGER,
-    content_type TEXT,
-    is_encrypted BOOLEAN DEFAULT 0,
-    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-    FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE,
-    UNIQUE(user_id, filename)
-);
-
--- Indexes for performance
-CREATE INDEX IF NOT EXISTS idx_users_username ON users(username);
-CREATE INDEX IF NOT EXISTS idx_users_email ON users(email);
-CREATE INDEX IF NOT EXISTS idx_system_calls_user_id ON system_calls(user_id);
-CREATE INDEX IF NOT EXISTS idx_system_calls_executed_at ON system_calls(executed_at);
-CREATE INDEX IF NOT EXISTS idx_logs_user_id ON logs(user_id);
-CREATE INDEX IF NOT EXISTS idx_logs_created_at ON logs(created_at);
-CREATE INDEX IF NOT EXISTS idx_logs_action_type ON logs(action_type);
-CREATE INDEX IF NOT EXISTS idx_files_user_id ON files(user_id);
-CREATE INDEX IF NOT EXISTS idx_files_filename ON files(filename);
-
--- Login Attempts Table (for rate limiting/blocking)
-CREATE TABLE IF NOT EXISTS login_attempts (
-    id INTEGER PRIMARY KEY AUTOINCREMENT,
-    ip_address TEXT NOT NULL,
-    username TEXT,
-    attempt_time TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-    success BOOLEAN DEFAULT 0
-);
-
-CREATE INDEX IF NOT EXISTS idx_login_attempts_ip ON login_attempts(ip_address);
-CREATE INDEX IF NOT EXISTS idx_login_attempts_username ON login_attempts(username);
-CREATE INDEX IF NOT EXISTS idx_login_attempts_time ON login_attempts(attempt_time);
+-- Users Table
+CREATE TABLE IF NOT EXISTS users (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    username TEXT UNIQUE NOT NULL,
+    email TEXT UNIQUE NOT NULL,
+    password_hash TEXT NOT NULL,
+    role TEXT DEFAULT 'user' CHECK(role IN ('admin', 'user', 'viewer')),
+    session_id TEXT,
+    quota_bytes INTEGER,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+-- System Calls Table
+CREATE TABLE IF NOT EXISTS system_calls (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    user_id INTEGER NOT NULL,
+    command TEXT NOT NULL,
+    parameters TEXT,
+    output TEXT,
+    status TEXT CHECK(status IN ('success', 'failure', 'pending')),
+    executed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE
+);
+
+-- Logs Table
+CREATE TABLE IF NOT EXISTS logs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    user_id INTEGER,
+    action_type TEXT NOT NULL,
+    ip_address TEXT,
+    status TEXT CHECK(status IN ('success', 'failure')),
+    details TEXT,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE SET NULL
+);
+
+-- Files Table
+-- One row per sandbox file, kept current by every write path and the
+-- reconciler in utils/files_index.py. user_id is the owner, NULL for
+-- files found on disk with no known owner.
+CREATE TABLE IF NOT EXISTS files (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    user_id INTEGER,
+    filename TEXT NOT NULL UNIQUE,
+    original_filename TEXT,
+    file_size INTEGER,
+    content_type TEXT,
+    is_encrypted BOOLEAN DEFAULT 0,
+    sha256 TEXT,
+    mtime_ns INTEGER,
+    compression TEXT,
+    stored_size INTEGER,
+    verified_at REAL,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE SET NULL
+);
+
+-- Integrity Failures Table
+-- Files whose stored bytes no longer match the size/sha256 recorded when
+-- they were written, found by the verifier or the files reconciler
+CREATE TABLE IF NOT EXISTS integrity_failures (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    filename TEXT NOT NULL,
+    reason TEXT NOT NULL,
+    expected_sha256 TEXT,
+    actual_sha256 TEXT,
+    expected_size INTEGER,
+    actual_size INTEGER,
+    detected_at REAL NOT NULL,
+    resolved_at REAL,
+    resolved_by INTEGER
+);
+
+CREATE INDEX IF NOT EXISTS idx_integrity_failures_filename ON integrity_failures(filename, resolved_at);
+
+-- Storage Usage Table
+-- Bytes and files each user owns in the sandbox, maintained from the
+-- files table by triggers (see USAGE_TRIGGERS in db_connection.py)
+CREATE TABLE IF NOT EXISTS storage_usage (
+    user_id INTEGER PRIMARY KEY,
+    bytes_used INTEGER NOT NULL DEFAULT 0,
+    file_count INTEGER NOT NULL DEFAULT 0,
+    FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE
+);
+
+CREATE INDEX IF NOT EXISTS idx_storage_usage_bytes ON storage_usage(bytes_used);
+
+-- Indexes for performance
+CREATE INDEX IF NOT EXISTS idx_users_username ON users(username);
+CREATE INDEX IF NOT EXISTS idx_users_email ON users(email);
+CREATE INDEX IF NOT EXISTS idx_system_calls_user_id ON system_calls(user_id);
+CREATE INDEX IF NOT EXISTS idx_system_calls_executed_at ON system_calls(executed_at);
+CREATE INDEX IF NOT EXISTS idx_logs_user_id ON logs(user_id);
+CREATE INDEX IF NOT EXISTS idx_logs_created_at ON logs(created_at);
+CREATE INDEX IF NOT EXISTS idx_logs_action_type ON logs(action_type);
+CREATE INDEX IF NOT EXISTS idx_files_user_id ON files(user_id);
+
+-- Login Attempts Table (for rate limiting/blocking)
+CREATE TABLE IF NOT EXISTS login_attempts (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    ip_address TEXT NOT NULL,
+    username TEXT,
+    attempt_time TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    success BOOLEAN DEFAULT 0
+);
+
+CREATE INDEX IF NOT EXISTS idx_login_attempts_ip ON login_attempts(ip_address);
+CREATE INDEX IF NOT EXISTS idx_login_attempts_username ON login_attempts(username);
+CREATE INDEX IF NOT EXISTS idx_login_attempts_time ON login_attempts(attempt_time);
+
+-- File Permissions Table (replaces file_permissions.json)
+CREATE TABLE IF NOT EXISTS file_permissions (
+    filename TEXT PRIMARY KEY,
+    can_view BOOLEAN DEFAULT 1,
+    can_download BOOLEAN DEFAULT 1,
+    can_edit BOOLEAN DEFAULT 0,
+    can_delete BOOLEAN DEFAULT 0,
+    owner INTEGER,
+    is_locked BOOLEAN DEFAULT 0,
+    lock_hash TEXT,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE INDEX IF NOT EXISTS idx_file_permissions_owner ON file_permissions(owner);
+
+-- Change counters for tables cached in process memory, bumped by triggers
+-- so every process can tell when its cache is stale
+CREATE TABLE IF NOT EXISTS cache_versions (
+    name TEXT PRIMARY KEY,
+    version INTEGER NOT NULL DEFAULT 0
+);
+
+-- One-time data migrations that have already been applied
+CREATE TABLE IF NOT EXISTS migrations (
+    name TEXT PRIMARY KEY,
+    applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+-- Resumable Upload Sessions
+CREATE TABLE IF NOT EXISTS upload_sessions (
+    id TEXT PRIMARY KEY,
+    user_id INTEGER NOT NULL,
+    filename TEXT NOT NULL,
+    total_size INTEGER NOT NULL,
+    chunk_size INTEGER NOT NULL,
+    status TEXT DEFAULT 'open' CHECK(status IN ('open', 'finalizing')),
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    last_activity REAL NOT NULL,
+    FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE
+);
+
+CREATE TABLE IF NOT EXISTS upload_chunks (
+    session_id TEXT NOT NULL,
+    chunk_index INTEGER NOT NULL,
+    size INTEGER NOT NULL,
+    sha256 TEXT NOT NULL,
+    PRIMARY KEY (session_id, chunk_index),
+    FOREIGN KEY (session_id) REFERENCES upload_sessions(id) ON DELETE CASCADE
+);
+
+CREATE INDEX IF NOT EXISTS idx_upload_sessions_user_id ON upload_sessions(user_id);
+CREATE INDEX IF NOT EXISTS idx_upload_sessions_last_activity ON upload_sessions(last_activity);
+
+-- Content-addressed blob store (ssci_files/.blobs/<sha256[:2]>/<sha256>)
+CREATE TABLE IF NOT EXISTS blobs (
+    sha256 TEXT PRIMARY KEY,
+    size INTEGER NOT NULL,
+    refcount INTEGER NOT NULL DEFAULT 0,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+-- Sandbox filenames that are hardlinks to a blob
+CREATE TABLE IF NOT EXISTS file_blobs (
+    filename TEXT PRIMARY KEY,
+    sha256 TEXT NOT NULL,
+    FOREIGN KEY (sha256) REFERENCES blobs(sha256)
+);
+
+CREATE INDEX IF NOT EXISTS idx_file_blobs_sha256 ON file_blobs(sha256);
+
+-- File version history: zlib-compressed full snapshots and deltas
+CREATE TABLE IF NOT EXISTS file_versions (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    filename TEXT NOT NULL,
+    version INTEGER NOT NULL,
+    kind TEXT NOT NULL CHECK(kind IN ('full', 'delta')),
+    size INTEGER NOT NULL,
+    sha256 TEXT NOT NULL,
+    data BLOB NOT NULL,
+    created_by INTEGER,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    UNIQUE (filename, version)
+);
+
+-- Bytes stored in file_versions, kept current by triggers (see
+-- VERSION_STORAGE_TRIGGERS in db_connection.py) so retention need not
+-- sum the table on every save
+CREATE TABLE IF NOT EXISTS version_storage (
+    id INTEGER PRIMARY KEY CHECK (id = 1),
+    bytes_stored INTEGER NOT NULL DEFAULT 0
+);
+
+-- Recycle bin index (replaces recycle_bin/metadata.json). Blob-backed
+-- entries keep their blob referenced instead of a file in the bin.
+CREATE TABLE IF NOT EXISTS recycle_bin (
+    recycle_name TEXT PRIMARY KEY,
+    original_name TEXT NOT NULL,
+    deleted_at INTEGER NOT NULL,
+    deleted_by TEXT,
+    deleted_by_id INTEGER,
+    expires_at INTEGER NOT NULL,
+    size INTEGER NOT NULL DEFAULT 0,
+    sha256 TEXT,
+    permissions TEXT,
+    file_record TEXT
+);
+
+CREATE INDEX IF NOT EXISTS idx_recycle_bin_expires_at ON recycle_bin(expires_at);
+CREATE INDEX IF NOT EXISTS idx_recycle_bin_deleted_at ON recycle_bin(deleted_at);
+-- idx_recycle_bin_owner is created in db_connection.INDEX_MIGRATIONS
+
+-- Background jobs emptying the recycle bin (owner_id NULL: the whole bin)
+CREATE TABLE IF NOT EXISTS recycle_jobs (
+    id TEXT PRIMARY KEY,
+    owner_id INTEGER,
+    requested_by INTEGER NOT NULL,
+    cutoff INTEGER NOT NULL,
+    status TEXT DEFAULT 'pending' CHECK(status IN ('pending', 'running', 'completed', 'failed')),
+    total INTEGER NOT NULL DEFAULT 0,
+    processed INTEGER NOT NULL DEFAULT 0,
+    purged INTEGER NOT NULL DEFAULT 0,
+    error TEXT,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL,
+    finished_at REAL
+);
+
+CREATE INDEX IF NOT EXISTS idx_recycle_jobs_status ON recycle_jobs(status);
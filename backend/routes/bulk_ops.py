@@ -0,0 +1,278 @@
+from flask import Blueprint, request, jsonify
+import os
+import time
+import shutil
+from werkzeug.utils import secure_filename
+from utils.auth_utils import token_required, file_unlocked
+from utils.helpers import get_client_ip, success_response, error_response
+from utils.secure_ops import SANDBOX_DIR, log_secure_action
+from database.db_connection import Database
+from utils.permissions_store import (
+    get_permissions_map, set_permissions_many, delete_permissions_many, invalidate_permissions
+)
+from utils.dir_listing import invalidate_listing_cache
+from utils.files_index import remove_files
+from utils.blob_store import recycle_file, restore_file as restore_blob
+from utils.file_versions import recycle_versions
+from utils.recycle_store import (
+    RECYCLE_BIN_DIR, unique_recycle_name, new_entry, add_entries, get_entries, claim_entries, release_claim, entry_path
+)
+from routes.recycle_bin import restore_entry, restore_quota_error, owner_scope
+from config import Config
+
+bulk_ops_bp = Blueprint('bulk_ops', __name__)
+
+db = Database(Config.DATABASE_PATH)
+
+PERMISSION_KEYS = ('view', 'download', 'edit', 'delete')
+
+
+def _unique(names):
+    """Drop repeated names, keeping the first occurrence"""
+    return list(dict.fromkeys(names))
+
+
+def _name_list(data, key):
+    names = data.get(key) if isinstance(data, dict) else None
+    if not isinstance(names, list) or not names or not all(isinstance(n, str) for n in names):
+        return None
+    return _unique(names)
+
+
+def _respond(names, results, message):
+    """Per-item results, in request order"""
+    position = {name: i for i, name in enumerate(names)}
+    results.sort(key=lambda r: position[r['filename']])
+    succeeded = sum(1 for r in results if r['success'])
+    return jsonify(success_response({
+        'results': results,
+        'succeeded': succeeded,
+        'failed': len(results) - succeeded
+    }, message))
+
+
+def _audit(current_user, action, results, verb):
+    """One audit record for the whole batch"""
+    done = [r['filename'] for r in results if r['success']]
+    failed = [r['filename'] for r in results if not r['success']]
+    details = f'{verb} {len(done)} file(s): {", ".join(done)}'
+    if failed:
+        details += f'; failed {len(failed)}: {", ".join(failed)}'
+    log_secure_action(
+        current_user['user_id'],
+        action,
+        get_client_ip(request),
+        'failure' if failed and not done else 'success',
+        details
+    )
+
+
+@bulk_ops_bp.route('/delete', methods=['POST'])
+@token_required
+def bulk_delete(current_user):
+    """Move several files to the recycle bin
+
+    Body: {"filenames": [...], "unlock_tokens": {filename: token},
+    "passcodes": {filename: passcode}}; tokens or passcodes are only
+    needed for locked files.
+    """
+    try:
+        data = request.get_json()
+        filenames = _name_list(data, 'filenames')
+        if filenames is None:
+            return error_response('filenames must be a non-empty list of names.')
+        if len(filenames) > Config.BULK_MAX_ITEMS:
+            return error_response(f'At most {Config.BULK_MAX_ITEMS} files per request.')
+        passcodes = data.get('passcodes') or {}
+        unlock_tokens = data.get('unlock_tokens') or {}
+        if not isinstance(passcodes, dict) or not isinstance(unlock_tokens, dict):
+            return error_response('passcodes and unlock_tokens must map filenames to values.')
+
+        # Validate every target before touching anything
+        permissions_map = get_permissions_map(filenames)
+        results = []
+        valid = []
+        for filename in filenames:
+            permissions = permissions_map[filename]
+            if secure_filename(filename) != filename:
+                error = 'Invalid filename.'
+            elif not file_unlocked(permissions, filename, current_user['user_id'],
+                                   token=unlock_tokens.get(filename), passcode=passcodes.get(filename)):
+                error = 'File is locked. Passcode required.'
+            elif current_user['role'] != 'admin' and not permissions.get('delete', False):
+                error = 'You do not have permission to delete this file.'
+            elif not os.path.isfile(os.path.join(SANDBOX_DIR, filename)):
+                error = 'File not found.'
+            else:
+                valid.append(filename)
+                continue
+            results.append({'filename': filename, 'success': False, 'error': error})
+
+        if valid:
+            timestamp = int(time.time())
+            entries = []
+
+            for filename in valid:
+                recycle_filename = unique_recycle_name(filename, timestamp)
+                try:
+                    size = os.path.getsize(os.path.join(SANDBOX_DIR, filename))
+                    sha256 = recycle_file(filename)
+                    if sha256 is None:
+                        shutil.move(os.path.join(SANDBOX_DIR, filename), os.path.join(RECYCLE_BIN_DIR, recycle_filename))
+                except OSError as e:
+                    results.append({'filename': filename, 'success': False, 'error': str(e)})
+                    continue
+
+                entries.append(new_entry(
+                    recycle_filename, filename, current_user['username'], permissions_map[filename], size,
+                    sha256=sha256, deleted_at=timestamp, deleted_by_id=current_user['user_id']
+                ))
+                results.append({'filename': filename, 'success': True, 'recycle_name': recycle_filename})
+
+            # All metadata for the batch in one transaction: files rows, recycle bin entries,
+            # versions and permissions change together or not at all
+            moved = [entry['original_name'] for entry in entries]
+            try:
+                with db.transaction() as conn:
+                    records = remove_files(moved, conn)
+                    for entry in entries:
+                        entry['file_record'] = records.get(entry['original_name'])
+                    add_entries(entries, conn)
+                    recycle_versions([(entry['original_name'], entry['recycle_name']) for entry in entries], conn)
+                    delete_permissions_many(moved, conn)
+            except Exception:
+                # Nothing was recorded, so put the files back where they were
+                for entry in entries:
+                    if entry['sha256']:
+                        restore_blob(entry['sha256'], entry['original_name'])
+                    else:
+                        shutil.move(entry_path(entry), os.path.join(SANDBOX_DIR, entry['original_name']))
+                raise
+            invalidate_permissions(moved)
+            invalidate_listing_cache(SANDBOX_DIR)
+
+        _audit(current_user, 'bulk_file_deleted', results, 'Moved to recycle bin')
+        return _respond(filenames, results, 'Bulk delete finished')
+    except Exception as e:
+        return error_response(f'Failed to delete files: {str(e)}', 500)
+
+
+@bulk_ops_bp.route('/restore', methods=['POST'])
+@token_required
+def bulk_restore(current_user):
+    """Restore several files from the recycle bin
+
+    Body: {"items": [...]} with the recycle bin internal names.
+    """
+    try:
+        data = request.get_json()
+        items = _name_list(data, 'items')
+        if items is None:
+            return error_response('items must be a non-empty list of recycle bin names.')
+        if len(items) > Config.BULK_MAX_ITEMS:
+            return error_response(f'At most {Config.BULK_MAX_ITEMS} files per request.')
+
+        entries = get_entries(items)
+        owner_id = owner_scope(current_user)
+        results = []
+        valid = []
+        claimed = set()
+        for item in items:
+            entry = entries.get(item)
+            if entry and owner_id is not None and entry['deleted_by_id'] != owner_id:
+                entry = None
+            original_name = entry['original_name'] if entry else None
+            if entry is None or not os.path.exists(entry_path(entry)):
+                error = 'File not found in recycle bin'
+            elif os.path.exists(os.path.join(SANDBOX_DIR, original_name)) or original_name in claimed:
+                error = f'File "{original_name}" already exists in sandbox'
+            else:
+                claimed.add(original_name)
+                valid.append(item)
+                continue
+            results.append({'filename': item, 'success': False, 'error': error})
+
+        # Entries restored or purged since they were read are skipped
+        restored_permissions = {}
+        taken = claim_entries(valid, owner_id)
+        for item in set(valid) - {entry['recycle_name'] for entry in taken}:
+            results.append({'filename': item, 'success': False, 'error': 'File not found in recycle bin'})
+
+        for entry in taken:
+            item = entry['recycle_name']
+            original_name = entry['original_name']
+            # Checked as each file is restored, so the batch as a whole stays within quota
+            over_quota = restore_quota_error(entry, current_user)
+            if over_quota:
+                release_claim(entry)
+                results.append({'filename': item, 'success': False, 'error': over_quota[0]['error']})
+                continue
+            try:
+                restored = restore_entry(entry)
+            except OSError as e:
+                release_claim(entry)
+                results.append({'filename': item, 'success': False, 'error': str(e)})
+                continue
+            if not restored:
+                results.append({'filename': item, 'success': False,
+                                'error': 'Restoring this file would exceed the storage quota.'})
+                continue
+
+            if entry['permissions'] is not None:
+                restored_permissions[original_name] = entry['permissions']
+            results.append({'filename': item, 'success': True, 'restored_as': original_name})
+
+        if taken:
+            set_permissions_many(restored_permissions)
+            invalidate_listing_cache(SANDBOX_DIR)
+
+        _audit(current_user, 'bulk_file_restored', results, 'Restored')
+        return _respond(items, results, 'Bulk restore finished')
+    except Exception as e:
+        return error_response(f'Failed to restore files: {str(e)}', 500)
+
+
+@bulk_ops_bp.route('/permissions', methods=['POST'])
+@token_required
+def bulk_permissions(current_user):
+    """Change view/download/edit/delete permissions on several files
+
+    Body: {"filenames": [...], "permissions": {"view": true, ...}}. Only the
+    file's owner or an admin may change its permissions; keys left out are
+    kept as they are.
+    """
+    try:
+        data = request.get_json()
+        filenames = _name_list(data, 'filenames')
+        changes = data.get('permissions')
+        if filenames is None:
+            return error_response('filenames must be a non-empty list of names.')
+        if len(filenames) > Config.BULK_MAX_ITEMS:
+            return error_response(f'At most {Config.BULK_MAX_ITEMS} files per request.')
+        if (not isinstance(changes, dict) or not changes
+                or any(k not in PERMISSION_KEYS or not isinstance(v, bool) for k, v in changes.items())):
+            return error_response(f'permissions must map {", ".join(PERMISSION_KEYS)} to true or false.')
+
+        permissions_map = get_permissions_map(filenames)
+        results = []
+        updated = {}
+        for filename in filenames:
+            permissions = permissions_map[filename]
+            if secure_filename(filename) != filename:
+                error = 'Invalid filename.'
+            elif not os.path.isfile(os.path.join(SANDBOX_DIR, filename)):
+                error = 'File not found.'
+            elif current_user['role'] != 'admin' and permissions.get('owner') != current_user['user_id']:
+                error = 'Only the owner or an admin can change permissions.'
+            else:
+                updated[filename] = {**permissions, **changes}
+                results.append({'filename': filename, 'success': True, 'permissions': {k: updated[filename][k] for k in PERMISSION_KEYS}})
+                continue
+            results.append({'filename': filename, 'success': False, 'error': error})
+
+        set_permissions_many(updated)
+
+        _audit(current_user, 'bulk_permissions_changed', results, f'Set {changes} on')
+        return _respond(filenames, results, 'Bulk permission update finished')
+    except Exception as e:
+        return error_response(f'Failed to update permissions: {str(e)}', 500)
@@ -1,491 +1,894 @@
-﻿from flask import Blueprint, request, jsonify, send_file
-import os
-import shutil
-import time
-import json
-from pathlib import Path
-from werkzeug.utils import secure_filename
-from werkzeug.security import generate_password_hash, check_password_hash
-from database.db_connection import Database
-from utils.auth_utils import token_required, role_required
-from utils.helpers import get_client_ip, success_response, error_response
-from utils.secure_ops import secure_read, secure_write, secure_delete, is_safe_path, SANDBOX_DIR
-from config import Config
-
-file_manager_bp = Blueprint('file_manager', __name__)
-db = Database(Config.DATABASE_PATH)
-
-def safe_filename(filename: str) -> str:
-    """
-    Sanitize filename to prevent path traversal attacks.
-
-    Extracts only the filename component and ensures the resolved path
-    remains within the sandbox directory.
-    """
-    safe_name = secure_filename(filename)
-    if not safe_name:
-        raise ValueError("Invalid or empty filename")
-
-    safe_name = Path(safe_name).name
-
-    test_path = os.path.realpath(os.path.join(SANDBOX_DIR, safe_name))
-    sandbox_real = os.path.realpath(SANDBOX_DIR)
-
-    if not test_path.startswith(sandbox_real + os.sep) and test_path != sandbox_real:
-        raise ValueError("Path traversal detected")
-
-    return safe_name
-
-@file_manager_bp.route('/', methods=['GET'])
-@token_required
-def list_files(current_user):
-    """List files in sandbox directory with permissions"""
-    try:
-        if not os.path.exists(SANDBOX_DIR):
-            os.makedirs(SANDBOX_DIR)
-            
-        files = []
-        
-        # Load all permissions once
-        permissions_file = os.path.join(os.path.dirname(__file__), '..', 'file_permissions.json')
-        all_permissions = {}
-        if os.path.exists(permissions_file):
-            import json
-            with open(permissions_file, 'r') as f:
-                try:
-                    all_permissions = json.load(f)
-                except:
-                    pass
-
-        for filename in os.listdir(SANDBOX_DIR):
-            file_path = os.path.join(SANDBOX_DIR, filename)
-            if os.path.isfile(file_path):
-                stats = os.stat(file_path)
-                
-                # Get permissions for this file
-                perms = all_permissions.get(filename, {
-                    'view': True,
-                    'download': True,
-                    'edit': False,
-                    'delete': False,
-                    'owner': None
-                })
-                
-                files.append({
-                    'name': filename,
-                    'size': stats.st_size,
-                    'modified': stats.st_mtime,
-                    'permissions': perms
-                })
-        
-        return jsonify(success_response({'files': files}))
-    except Exception as e:
-        return error_response(f'Failed to list files: {str(e)}', 500)
-
-@file_manager_bp.route('/', methods=['POST'])
-@token_required
-def create_file(current_user):
-    """Create a new file"""
-    data = request.get_json()
-    filename = data.get('filename', '').strip()
-    content = data.get('content', '')
-    
-    if not filename:
-        return error_response('Filename is required.')
-    
-    try:
-        # Check if file exists to prevent overwrite if not intended (though secure_write overwrites)
-        # But here we are "creating".
-        # secure_write handles path safety and logging.
-        secure_write(filename, content, current_user['user_id'], get_client_ip(request))
-        return jsonify(success_response(None, 'File created successfully'))
-    except Exception as e:
-        return error_response(f'Failed to create file: {str(e)}', 500)
-
-@file_manager_bp.route('/<filename>', methods=['GET'])
-@token_required
-def read_file(current_user, filename):
-    """Read file content"""
-    try:
-        filename = secure_filename(filename)
-        if not is_safe_path(filename):
-            return error_response('Invalid filename.')
-        
-        file_path = os.path.join(SANDBOX_DIR, filename)
-        if not os.path.exists(file_path):
-            return error_response('File not found.', 404)
-        
-        # Check view permission
-        permissions = get_file_permissions(filename)
-        if not permissions.get('view', True):
-            return error_response('You do not have permission to view this file.', 403)
-            
-        # Check File Lock
-        if permissions.get('is_locked', False):
-            passcode = request.headers.get('X-File-Passcode')
-            if not passcode or not check_password_hash(permissions.get('lock_hash', ''), passcode):
-                return error_response('File is locked. Passcode required.', 403, {'locked': True})
-        
-        # Try to read as text first
-        try:
-            with open(file_path, 'r', encoding='utf-8') as f:
-                content = f.read()
-            
-            # Log the action
-            from utils.secure_ops import log_secure_action
-            log_secure_action(
-                current_user['user_id'],
-                'file_read',
-                get_client_ip(request),
-                'success',
-                f'Read file: {filename}'
-            )
-            
-            return jsonify(success_response({'content': content, 'filename': filename, 'is_binary': False}))
-        except UnicodeDecodeError:
-            # Binary file - return info that it's binary
-            file_size = os.path.getsize(file_path)
-            return jsonify(success_response({
-                'content': f'[Binary File - {filename}]\nSize: {file_size} bytes\nThis file cannot be viewed as text. Please download it to view.',
-                'filename': filename,
-                'is_binary': True
-            }))
-            
-    except Exception as e:
-        return error_response(f'Failed to read file: {str(e)}', 500)
-
-@file_manager_bp.route('/<filename>', methods=['PUT'])
-@token_required
-def update_file(current_user, filename):
-    """Update file content"""
-    data = request.get_json()
-    content = data.get('content', '')
-    
-    try:
-        permissions = get_file_permissions(filename)
-        
-        # Check File Lock
-        if permissions.get('is_locked', False):
-            passcode = request.headers.get('X-File-Passcode')
-            if not passcode or not check_password_hash(permissions.get('lock_hash', ''), passcode):
-                return error_response('File is locked. Passcode required.', 403, {'locked': True})
-
-        # Check edit permission (admin bypasses this check)
-        if current_user['role'] != 'admin':
-            if not permissions.get('edit', False):
-                return error_response('You do not have permission to edit this file.', 403)
-        
-        secure_write(filename, content, current_user['user_id'], get_client_ip(request))
-        return jsonify(success_response(None, 'File updated successfully'))
-    except Exception as e:
-        return error_response(f'Failed to update file: {str(e)}', 500)
-
-@file_manager_bp.route('/<filename>', methods=['DELETE'])
-@token_required
-def delete_file(current_user, filename):
-    """Delete file (Move to Recycle Bin)"""
-    try:
-        permissions = get_file_permissions(filename)
-        
-        # Check File Lock
-        if permissions.get('is_locked', False):
-            passcode = request.headers.get('X-File-Passcode')
-            if not passcode or not check_password_hash(permissions.get('lock_hash', ''), passcode):
-                return error_response('File is locked. Passcode required.', 403, {'locked': True})
-
-        # Check delete permission (admin bypasses this check)
-        if current_user['role'] != 'admin':
-            if not permissions.get('delete', False):
-                return error_response('You do not have permission to delete this file.', 403)
-        
-        file_path = os.path.join(SANDBOX_DIR, filename)
-        if not os.path.exists(file_path):
-            return error_response('File not found.', 404)
-            
-        # Recycle Bin Logic
-        RECYCLE_BIN_DIR = os.path.join(os.path.dirname(SANDBOX_DIR), 'recycle_bin')
-        if not os.path.exists(RECYCLE_BIN_DIR):
-            os.makedirs(RECYCLE_BIN_DIR)
-            
-        # Generate unique name for recycle bin
-        timestamp = int(time.time())
-        recycle_filename = f"{timestamp}_{filename}"
-        recycle_path = os.path.join(RECYCLE_BIN_DIR, recycle_filename)
-        
-        # Get current permissions to save in metadata
-        current_permissions = get_file_permissions(filename)
-        
-        # Move file
-        shutil.move(file_path, recycle_path)
-        
-        # Update Recycle Bin Metadata
-        metadata_file = os.path.join(RECYCLE_BIN_DIR, 'metadata.json')
-        metadata = {}
-        if os.path.exists(metadata_file):
-            try:
-                with open(metadata_file, 'r') as f:
-                    metadata = json.load(f)
-            except:
-                pass
-                
-        metadata[recycle_filename] = {
-            'original_name': filename,
-            'deleted_at': timestamp,
-            'deleted_by': current_user['username'],
-            'permissions': current_permissions
-        }
-        
-        with open(metadata_file, 'w') as f:
-            json.dump(metadata, f, indent=2)
-        
-        # Remove permissions entry from file_permissions.json
-        permissions_file = os.path.join(os.path.dirname(__file__), '..', 'file_permissions.json')
-        try:
-            with open(permissions_file, 'r') as f:
-                all_permissions = json.load(f)
-            if filename in all_permissions:
-                del all_permissions[filename]
-                with open(permissions_file, 'w') as f:
-                    json.dump(all_permissions, f, indent=2)
-        except:
-            pass
-            
-        # Log action
-        from utils.secure_ops import log_secure_action
-        log_secure_action(
-            current_user['user_id'],
-            'file_deleted',
-            get_client_ip(request),
-            'success',
-            f'Moved file to recycle bin: {filename}'
-        )
-        
-        return jsonify(success_response(None, 'File moved to recycle bin'))
-    except Exception as e:
-        return error_response(f'Failed to delete file: {str(e)}', 500)
-
-@file_manager_bp.route('/upload', methods=['POST'])
-@token_required
-def upload_file(current_user):
-    """Upload a file with optional encryption and permissions"""
-    if 'file' not in request.files:
-        return error_response('No file part')
-    
-    file = request.files['file']
-    
-    if file.filename == '':
-        return error_response('No selected file')
-    
-    if file:
-        try:
-            from cryptography.fernet import Fernet
-            import base64
-            import json
-
-            filename = safe_filename(file.filename)
-            encrypt = request.form.get('encrypt', 'false').lower() == 'true'
-            passcode = request.form.get('passcode', '')
-            permissions_str = request.form.get('permissions', '{"view": true, "download": true, "edit": false, "delete": false}')
-            permissions = json.loads(permissions_str)
-            
-            # AppLock
-            applock = request.form.get('applock', 'false').lower() == 'true'
-            applock_passcode = request.form.get('applock_passcode', '')
-            
-            lock_hash = None
-            if applock:
-                if not applock_passcode:
-                    return error_response('Passcode is required for AppLock')
-                lock_hash = generate_password_hash(applock_passcode)
-            
-            # Read file content as bytes
-            content = file.read()
-            
-            final_filename = filename
-            
-            # If encryption is requested
-            if encrypt:
-                if not passcode:
-                    return error_response('Passcode is required for encryption')
-
-                # Encrypt the content with password-derived key (PBKDF2)
-                from utils.secure_ops import encrypt_file_with_password
-                encrypted_content = encrypt_file_with_password(content, passcode)
-                
-                # Save encrypted file with .enc extension
-                final_filename = filename + '.enc'
-                file_path = os.path.join(SANDBOX_DIR, final_filename)
-                
-                with open(file_path, 'wb') as f:
-                    f.write(encrypted_content)
-                
-                # Log the action
-                from utils.secure_ops import log_secure_action
-                log_secure_action(
-                    current_user['user_id'],
-                    'file_upload_encrypted',
-                    get_client_ip(request),
-                    'success',
-                    f'Uploaded and encrypted file: {filename}'
-                )
-            else:
-                # Save file without encryption
-                file_path = os.path.join(SANDBOX_DIR, filename)
-                
-                with open(file_path, 'wb') as f:
-                    f.write(content)
-                
-                # Log the action
-                from utils.secure_ops import log_secure_action
-                log_secure_action(
-                    current_user['user_id'],
-                    'file_upload',
-                    get_client_ip(request),
-                    'success',
-                    f'Uploaded file: {filename}'
-                )
-            
-            # Save permissions and lock status
-            save_file_permissions(final_filename, permissions, current_user['user_id'], applock, lock_hash)
-
-            # Record file ownership in database
-            db.execute_insert(
-                '''INSERT OR REPLACE INTO files (user_id, filename, original_filename, file_size, is_encrypted)
-                   VALUES (?, ?, ?, ?, ?)''',
-                (current_user['user_id'], final_filename, filename, len(content), 1 if encrypt else 0)
-            )
-
-            return jsonify(success_response({
-                'filename': final_filename,
-                'encrypted': encrypt,
-                'permissions': permissions,
-                'locked': applock
-            }, 'File uploaded successfully'))
-                
-        except Exception as e:
-            return error_response(f'Failed to upload file: {str(e)}', 500)
-
-def save_file_permissions(filename, permissions, user_id, is_locked=False, lock_hash=None):
-    """Save file permissions to JSON file"""
-    import json
-    permissions_file = os.path.join(os.path.dirname(__file__), '..', 'file_permissions.json')
-    
-    try:
-        with open(permissions_file, 'r') as f:
-            all_permissions = json.load(f)
-    except:
-        all_permissions = {}
-    
-    all_permissions[filename] = {
-        'view': permissions.get('view', True),
-        'download': permissions.get('download', True),
-        'edit': permissions.get('edit', False),
-        'delete': permissions.get('delete', False),
-        'owner': user_id,
-        'is_locked': is_locked,
-        'lock_hash': lock_hash
-    }
-    
-    with open(permissions_file, 'w') as f:
-        json.dump(all_permissions, f, indent=2)
-
-def get_file_permissions(filename):
-    """Get file permissions from JSON file"""
-    import json
-    permissions_file = os.path.join(os.path.dirname(__file__), '..', 'file_permissions.json')
-    
-    try:
-        with open(permissions_file, 'r') as f:
-            all_permissions = json.load(f)
-        return all_permissions.get(filename, {
-            'view': True,
-            'download': True,
-            'edit': False,
-            'delete': False,
-            'owner': None
-        })
-    except:
-        return {
-            'view': True,
-            'download': True,
-            'edit': False,
-            'delete': False,
-            'owner': None
-        }
-
-@file_manager_bp.route('/download/<filename>', methods=['GET'])
-@token_required
-def download_file(current_user, filename):
-    """Download a file"""
-    try:
-        filename = secure_filename(filename)
-        if not is_safe_path(filename):
-             return error_response('Invalid filename.')
-
-        file_path = os.path.join(SANDBOX_DIR, filename)
-        if not os.path.exists(file_path):
-            return error_response('File not found.', 404)
-
-        # Verify file ownership (admin can access any file)
-        if current_user['role'] != 'admin':
-            file_record = db.execute_query(
-                'SELECT user_id FROM files WHERE filename = ?',
-                (filename,)
-            )
-            if not file_record or file_record[0]['user_id'] != current_user['user_id']:
-                from utils.secure_ops import log_secure_action
-                log_secure_action(
-                    current_user['user_id'],
-                    'file_download_denied',
-                    get_client_ip(request),
-                    'failure',
-                    f'Unauthorized access attempt for file: {filename}'
-                )
-                return error_response('You do not have permission to download this file.', 403)
-
-        # Check download permission (admin bypasses this check)
-        if current_user['role'] != 'admin':
-            permissions = get_file_permissions(filename)
-            if not permissions.get('download', True):
-                # Log the failed attempt
-                from utils.secure_ops import log_secure_action
-                log_secure_action(
-                    current_user['user_id'],
-                    'file_download_denied',
-                    get_client_ip(request),
-                    'failure',
-                    f'Download denied for file: {filename}'
-                )
-                return error_response('You do not have permission to download this file.', 403)
-        
-        # Check File Lock (for admin too, or maybe admin bypasses? Let's enforce for all if locked)
-        permissions = get_file_permissions(filename)
-        if permissions.get('is_locked', False):
-            passcode = request.headers.get('X-File-Passcode')
-            if not passcode or not check_password_hash(permissions.get('lock_hash', ''), passcode):
-                return error_response('File is locked. Passcode required.', 403, {'locked': True})
-        
-        # Log successful download
-        from utils.secure_ops import log_secure_action
-        log_secure_action(
-            current_user['user_id'],
-            'file_download',
-            get_client_ip(request),
-            'success',
-            f'Downloaded file: {filename}'
-        )
-            
-        return send_file(file_path, as_attachment=True)
-    except Exception as e:
-        return error_response(f'Failed to download file: {str(e)}', 500)
-
-@file_manager_bp.route('/permissions/<filename>', methods=['GET'])
-@token_required
-def get_permissions_endpoint(current_user, filename):
-    '''Get file permissions'''
-    try:
-        permissions = get_file_permissions(filename)
-        return jsonify(success_response(permissions))
-    except Exception as e:
-        return error_response(f'Failed to get permissions: {str(e)}', 500)
-
+﻿from flask import Blueprint, request, jsonify, send_file, Response, stream_with_context
+import os
+import mimetypes
+from datetime import datetime, timezone
+import shutil
+import time
+import json
+import secrets
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+from werkzeug.utils import secure_filename
+from werkzeug.exceptions import RequestedRangeNotSatisfiable
+from werkzeug.http import is_resource_modified, parse_etags
+from werkzeug.security import generate_password_hash, check_password_hash
+from database.db_connection import Database
+from utils.auth_utils import token_required, role_required, file_unlocked, generate_unlock_token
+from utils.helpers import get_client_ip, success_response, error_response
+from utils.secure_ops import secure_read, secure_write, secure_patch, secure_delete, is_safe_path, SANDBOX_DIR
+from utils.range_requests import resolve_byte_ranges, byteranges_response, MAX_RANGES
+from utils.dir_listing import list_directory_page, invalidate_listing_cache
+from utils.blob_store import store_file, recycle_file, detach_file
+from utils.line_index import is_binary_file, read_window
+from utils.file_versions import record_version, list_versions, get_version_content, recycle_versions
+from utils.compression import compress_upload_stream, stored_compression, open_stored
+from utils.recycle_store import RECYCLE_BIN_DIR, unique_recycle_name, new_entry, add_entries
+from utils.files_index import get_record, record_file, remove_file, restore_record
+from utils.quotas import quota_error, exceeds_quota, get_quota
+from utils.permissions_store import (
+    get_file_permissions, get_permissions_map, save_file_permissions, set_file_permissions, delete_file_permissions
+)
+from config import Config
+
+file_manager_bp = Blueprint('file_manager', __name__)
+db = Database(Config.DATABASE_PATH)
+
+# Serializes the ETag check with the write it guards
+_edit_lock = threading.Lock()
+
+def safe_filename(filename: str) -> str:
+    """
+    Sanitize filename to prevent path traversal attacks.
+
+    Extracts only the filename component and ensures the resolved path
+    remains within the sandbox directory.
+    """
+    safe_name = secure_filename(filename)
+    if not safe_name:
+        raise ValueError("Invalid or empty filename")
+
+    safe_name = Path(safe_name).name
+
+    test_path = os.path.realpath(os.path.join(SANDBOX_DIR, safe_name))
+    sandbox_real = os.path.realpath(SANDBOX_DIR)
+
+    if not test_path.startswith(sandbox_real + os.sep) and test_path != sandbox_real:
+        raise ValueError("Path traversal detected")
+
+    return safe_name
+
+@file_manager_bp.route('/', methods=['GET'])
+@token_required
+def list_files(current_user):
+    """List files in sandbox directory with permissions
+
+    Query parameters: sort (name, size, modified), order (asc, desc),
+    prefix, cursor (from a previous page's next_cursor) and limit.
+    """
+    try:
+        if not os.path.exists(SANDBOX_DIR):
+            os.makedirs(SANDBOX_DIR)
+
+        sort = request.args.get('sort', 'name')
+        order = request.args.get('order', 'asc')
+        prefix = request.args.get('prefix', '')
+        cursor = request.args.get('cursor') or None
+        limit = request.args.get('limit', Config.FILE_LIST_DEFAULT_LIMIT, type=int)
+        limit = max(1, min(limit, Config.FILE_LIST_MAX_LIMIT))
+
+        try:
+            files, next_cursor, total = list_directory_page(
+                SANDBOX_DIR, sort=sort, order=order, prefix=prefix, cursor=cursor, limit=limit
+            )
+        except ValueError as e:
+            return error_response(str(e))
+
+        # Load permissions for this page's files in one batch
+        all_permissions = get_permissions_map([f['name'] for f in files])
+        stored = compressed_sizes([f['name'] for f in files])
+        for f in files:
+            f['permissions'] = all_permissions[f['name']]
+            # size is the logical size; stored_size what it takes on disk
+            f['stored_size'] = f['size']
+            record = stored.get(f['name'])
+            if record and record['stored_size'] == f['stored_size']:
+                f['size'] = record['file_size']
+                f['compression'] = record['compression']
+        
+        return jsonify(success_response({
+            'files': files,
+            'next_cursor': next_cursor,
+            'total': total
+        }))
+    except Exception as e:
+        return error_response(f'Failed to list files: {str(e)}', 500)
+
+def compressed_sizes(filenames):
+    """Latest files row of each compressed file among filenames"""
+    result = {}
+    for start in range(0, len(filenames), 500):
+        batch = filenames[start:start + 500]
+        placeholders = ','.join('?' * len(batch))
+        rows = db.execute_query(
+            f'''SELECT filename, compression, file_size, stored_size FROM files
+                WHERE filename IN ({placeholders}) AND compression IS NOT NULL''',
+            tuple(batch)
+        )
+        result.update({row['filename']: row for row in rows})
+    return result
+
+@file_manager_bp.route('/', methods=['POST'])
+@token_required
+def create_file(current_user):
+    """Create a new file"""
+    data = request.get_json()
+    filename = data.get('filename', '').strip()
+    content = data.get('content', '')
+    
+    if not filename:
+        return error_response('Filename is required.')
+    
+    try:
+        # Check if file exists to prevent overwrite if not intended (though secure_write overwrites)
+        # But here we are "creating".
+        # secure_write handles path safety and logging.
+        over_quota = quota_error(secure_filename(filename), current_user['user_id'], len(content.encode('utf-8')))
+        if over_quota:
+            return over_quota
+        with _undoable_write(secure_filename(filename)) as previous:
+            secure_write(filename, content, current_user['user_id'], get_client_ip(request))
+            over_quota = _undo_if_over_quota(secure_filename(filename), previous)
+        if over_quota:
+            return over_quota
+        return jsonify(success_response(None, 'File created successfully'))
+    except Exception as e:
+        return error_response(f'Failed to create file: {str(e)}', 500)
+
+@file_manager_bp.route('/<filename>', methods=['GET'])
+@token_required
+def read_file(current_user, filename):
+    """Read file content, one window at a time for large files
+
+    Query parameters: offset and length (bytes), or line (1-based) and
+    lines. Without them the first FILE_READ_MAX_WINDOW bytes are returned.
+    """
+    try:
+        filename = secure_filename(filename)
+        if not is_safe_path(filename):
+            return error_response('Invalid filename.')
+        
+        file_path = os.path.join(SANDBOX_DIR, filename)
+        if not os.path.exists(file_path):
+            return error_response('File not found.', 404)
+        
+        # Check view permission
+        permissions = get_file_permissions(filename)
+        if not permissions.get('view', True):
+            return error_response('You do not have permission to view this file.', 403)
+            
+        # Check File Lock
+        if not file_unlocked(permissions, filename, current_user['user_id']):
+            return error_response('File is locked. Passcode required.', 403, {'locked': True})
+        
+        compression, file_size = stored_compression(filename, file_path)
+
+        # Only the start of the file is sniffed to tell text from binary
+        if is_binary_file(file_path, compression):
+            return jsonify(success_response({
+                'content': f'[Binary File - {filename}]\nSize: {file_size} bytes\nThis file cannot be viewed as text. Please download it to view.',
+                'filename': filename,
+                'is_binary': True,
+                'total_size': file_size
+            }))
+
+        offset = request.args.get('offset', 0, type=int)
+        length = request.args.get('length', type=int)
+        line = request.args.get('line', type=int)
+        lines = request.args.get('lines', type=int)
+        if any(v is not None and v < 0 for v in (offset, length, line, lines)):
+            return error_response('offset, length, line and lines must not be negative.')
+
+        window = read_window(
+            file_path, offset=offset, length=length, line=line, lines=lines,
+            max_bytes=Config.FILE_READ_MAX_WINDOW, compression=compression, size=file_size
+        )
+
+        # Log the action
+        from utils.secure_ops import log_secure_action
+        log_secure_action(
+            current_user['user_id'],
+            'file_read',
+            get_client_ip(request),
+            'success',
+            f'Read file: {filename}'
+        )
+
+        return jsonify(success_response({
+            **window,
+            'filename': filename,
+            'is_binary': False,
+            'etag': current_etag(filename, file_path)
+        }))
+            
+    except Exception as e:
+        return error_response(f'Failed to read file: {str(e)}', 500)
+
+@file_manager_bp.route('/<filename>', methods=['PUT'])
+@token_required
+def update_file(current_user, filename):
+    """Update file content
+
+    Send either the full new content, or edits: a list of byte-range
+    ({offset, length, text}) or line-range ({line, lines, text})
+    replacements. Edits require the file's current ETag in an If-Match
+    header or an etag field; a stale ETag is rejected with 412.
+    """
+    data = request.get_json()
+    content = data.get('content', '')
+    edits = data.get('edits')
+    
+    try:
+        permissions = get_file_permissions(filename)
+        
+        # Check File Lock
+        if not file_unlocked(permissions, filename, current_user['user_id']):
+            return error_response('File is locked. Passcode required.', 403, {'locked': True})
+
+        # Check edit permission (admin bypasses this check)
+        if current_user['role'] != 'admin':
+            if not permissions.get('edit', False):
+                return error_response('You do not have permission to edit this file.', 403)
+        
+        if edits is not None and (not isinstance(edits, list) or not edits):
+            return error_response('edits must be a non-empty list.')
+
+        expected_etag = request.headers.get('If-Match') or data.get('etag')
+        if edits is not None and not expected_etag:
+            return error_response('An ETag (If-Match header or etag field) is required for partial updates.', 428)
+
+        file_path = os.path.join(SANDBOX_DIR, secure_filename(filename))
+        with _edit_lock:
+            if expected_etag:
+                etag = current_etag(filename, file_path) if os.path.exists(file_path) else None
+                if etag is None or not parse_etags(expected_etag).contains(etag):
+                    return error_response('File has changed since it was read.', 412, {'etag': etag})
+
+            if edits is not None:
+                # Replacements can grow the file by at most their text
+                added = sum(len(str(edit.get('text', '')).encode('utf-8')) for edit in edits if isinstance(edit, dict))
+                over_quota = quota_error(secure_filename(filename), current_user['user_id'], added=added)
+            else:
+                over_quota = quota_error(secure_filename(filename), current_user['user_id'],
+                                         len(content.encode('utf-8')))
+            if over_quota:
+                return over_quota
+
+            # Capture the content being replaced if history does not have it yet
+            if os.path.exists(file_path):
+                record_version(secure_filename(filename), file_path, current_user['user_id'])
+
+            with _undoable_write(secure_filename(filename)) as previous:
+                if edits is not None:
+                    secure_patch(filename, edits, current_user['user_id'], get_client_ip(request))
+                else:
+                    secure_write(filename, content, current_user['user_id'], get_client_ip(request))
+                over_quota = _undo_if_over_quota(secure_filename(filename), previous)
+            if over_quota:
+                return over_quota
+            record_version(secure_filename(filename), file_path, current_user['user_id'])
+            etag = current_etag(filename, file_path)
+
+        return jsonify(success_response({'etag': etag}, 'File updated successfully'))
+    except (ValueError, FileNotFoundError) as e:
+        return error_response(str(e), 404 if isinstance(e, FileNotFoundError) else 400)
+    except Exception as e:
+        return error_response(f'Failed to update file: {str(e)}', 500)
+
+def _version_access_error(current_user, filename, action):
+    """Apply read_file's view or update_file's edit checks; returns an error response or None"""
+    # Without the file there are no permissions to check against
+    if not os.path.exists(os.path.join(SANDBOX_DIR, filename)):
+        return error_response('File not found.', 404)
+    permissions = get_file_permissions(filename)
+    if action == 'view' and not permissions.get('view', True):
+        return error_response('You do not have permission to view this file.', 403)
+    if action == 'edit' and current_user['role'] != 'admin' and not permissions.get('edit', False):
+        return error_response('You do not have permission to edit this file.', 403)
+    if not file_unlocked(permissions, filename, current_user['user_id']):
+        return error_response('File is locked. Passcode required.', 403, {'locked': True})
+    return None
+
+@file_manager_bp.route('/<filename>/versions', methods=['GET'])
+@token_required
+def get_file_versions(current_user, filename):
+    """List saved versions of a file, newest first"""
+    try:
+        filename = secure_filename(filename)
+        access_error = _version_access_error(current_user, filename, 'view')
+        if access_error:
+            return access_error
+        return jsonify(success_response({'filename': filename, 'versions': list_versions(filename)}))
+    except Exception as e:
+        return error_response(f'Failed to list versions: {str(e)}', 500)
+
+@file_manager_bp.route('/<filename>/versions/<int:version>', methods=['GET'])
+@token_required
+def read_file_version(current_user, filename, version):
+    """Read the content of a saved version"""
+    try:
+        filename = secure_filename(filename)
+        access_error = _version_access_error(current_user, filename, 'view')
+        if access_error:
+            return access_error
+
+        content = get_version_content(filename, version)
+        if content is None:
+            return error_response('Version not found.', 404)
+        return jsonify(success_response({
+            'filename': filename,
+            'version': version,
+            'content': content.decode('utf-8', errors='replace'),
+            'size': len(content)
+        }))
+    except Exception as e:
+        return error_response(f'Failed to read version: {str(e)}', 500)
+
+@file_manager_bp.route('/<filename>/versions/<int:version>/restore', methods=['POST'])
+@token_required
+def restore_file_version(current_user, filename, version):
+    """Restore a saved version; the restore itself becomes the newest version"""
+    try:
+        filename = secure_filename(filename)
+        access_error = _version_access_error(current_user, filename, 'edit')
+        if access_error:
+            return access_error
+
+        content = get_version_content(filename, version)
+        if content is None:
+            return error_response('Version not found.', 404)
+
+        over_quota = quota_error(filename, current_user['user_id'], len(content))
+        if over_quota:
+            return over_quota
+
+        file_path = os.path.join(SANDBOX_DIR, filename)
+        with _edit_lock:
+            record_version(filename, file_path, current_user['user_id'])
+            with _undoable_write(filename) as previous:
+                secure_write(filename, content, current_user['user_id'], get_client_ip(request))
+                over_quota = _undo_if_over_quota(filename, previous)
+            if over_quota:
+                return over_quota
+            new_version = record_version(filename, file_path, current_user['user_id'])
+            etag = current_etag(filename, file_path)
+
+        return jsonify(success_response(
+            {'version': new_version, 'etag': etag},
+            f'Restored version {version} of "{filename}"'
+        ))
+    except Exception as e:
+        return error_response(f'Failed to restore version: {str(e)}', 500)
+
+@file_manager_bp.route('/<filename>/unlock', methods=['POST'])
+@token_required
+def unlock_file(current_user, filename):
+    """Verify a locked file's passcode once and issue an unlock token
+
+    Later requests send the token as X-Unlock-Token instead of the
+    passcode. It is bound to the user, the file and the current lock, and
+    expires after UNLOCK_TOKEN_EXPIRES seconds.
+    """
+    data = request.get_json()
+    passcode = data.get('passcode', '')
+
+    try:
+        filename = secure_filename(filename)
+        permissions = get_file_permissions(filename)
+        if not permissions.get('is_locked', False):
+            return error_response('File is not locked.')
+
+        from utils.secure_ops import log_secure_action
+        if not passcode or not check_password_hash(permissions.get('lock_hash') or '', passcode):
+            log_secure_action(
+                current_user['user_id'],
+                'file_unlock',
+                get_client_ip(request),
+                'failure',
+                f'Wrong passcode for locked file: {filename}'
+            )
+            return error_response('Invalid passcode.', 403, {'locked': True})
+
+        log_secure_action(
+            current_user['user_id'],
+            'file_unlock',
+            get_client_ip(request),
+            'success',
+            f'Unlocked file: {filename}'
+        )
+        return jsonify(success_response({
+            'unlock_token': generate_unlock_token(current_user['user_id'], filename, permissions.get('lock_hash')),
+            'expires_in': Config.UNLOCK_TOKEN_EXPIRES
+        }))
+    except Exception as e:
+        return error_response(f'Failed to unlock file: {str(e)}', 500)
+
+@file_manager_bp.route('/<filename>', methods=['DELETE'])
+@token_required
+def delete_file(current_user, filename):
+    """Delete file (Move to Recycle Bin)"""
+    try:
+        permissions = get_file_permissions(filename)
+        
+        # Check File Lock
+        if not file_unlocked(permissions, filename, current_user['user_id']):
+            return error_response('File is locked. Passcode required.', 403, {'locked': True})
+
+        # Check delete permission (admin bypasses this check)
+        if current_user['role'] != 'admin':
+            if not permissions.get('delete', False):
+                return error_response('You do not have permission to delete this file.', 403)
+        
+        file_path = os.path.join(SANDBOX_DIR, filename)
+        if not os.path.exists(file_path):
+            return error_response('File not found.', 404)
+            
+        # Generate unique name for recycle bin
+        timestamp = int(time.time())
+        recycle_filename = unique_recycle_name(filename, timestamp)
+        recycle_path = os.path.join(RECYCLE_BIN_DIR, recycle_filename)
+        size = os.path.getsize(file_path)
+        
+        # Files in the blob store only drop their name; the blob stays
+        # referenced by the recycle bin entry. Other files are moved.
+        sha256 = recycle_file(filename)
+        if sha256 is None:
+            shutil.move(file_path, recycle_path)
+        
+        # Record it in the recycle bin index, keeping the files row for a restore
+        add_entries([new_entry(
+            recycle_filename, filename, current_user['username'], permissions, size,
+            sha256=sha256, deleted_at=timestamp, deleted_by_id=current_user['user_id'],
+            file_record=remove_file(filename)
+        )])
+        recycle_versions([(filename, recycle_filename)])
+        
+        # Remove permissions entry
+        delete_file_permissions(filename)
+        invalidate_listing_cache(SANDBOX_DIR)
+            
+        # Log action
+        from utils.secure_ops import log_secure_action
+        log_secure_action(
+            current_user['user_id'],
+            'file_deleted',
+            get_client_ip(request),
+            'success',
+            f'Moved file to recycle bin: {filename}'
+        )
+        
+        return jsonify(success_response(None, 'File moved to recycle bin'))
+    except Exception as e:
+        return error_response(f'Failed to delete file: {str(e)}', 500)
+
+@file_manager_bp.route('/upload', methods=['POST'])
+@token_required
+def upload_file(current_user):
+    """Upload a file with optional encryption and permissions"""
+    if 'file' not in request.files:
+        return error_response('No file part')
+    
+    file = request.files['file']
+    
+    if file.filename == '':
+        return error_response('No selected file')
+    
+    if file:
+        try:
+            filename = safe_filename(file.filename)
+            encrypt = request.form.get('encrypt', 'false').lower() == 'true'
+            passcode = request.form.get('passcode', '')
+            permissions_str = request.form.get('permissions', '{"view": true, "download": true, "edit": false, "delete": false}')
+            permissions = json.loads(permissions_str)
+            
+            # AppLock
+            applock = request.form.get('applock', 'false').lower() == 'true'
+            applock_passcode = request.form.get('applock_passcode', '')
+            
+            lock_hash = None
+            if applock:
+                if not applock_passcode:
+                    return error_response('Passcode is required for AppLock')
+                lock_hash = generate_password_hash(applock_passcode)
+            
+            if encrypt and not passcode:
+                return error_response('Passcode is required for encryption')
+
+            # The request length bounds the file's size; chunked requests
+            # declare none and are checked once stored
+            over_quota = quota_error(
+                filename + '.enc' if encrypt else filename, current_user['user_id'],
+                request.content_length or 0, take_ownership=True
+            )
+            if over_quota:
+                return over_quota
+
+            # Compression: 'true'/'auto' or 'false'; unset follows the global policy
+            compress = request.form.get('compress')
+            if compress is not None:
+                compress = compress.lower() in ('true', 'auto')
+
+            result, over_quota = store_upload(
+                file.stream, filename, current_user, permissions,
+                encrypt=encrypt, passcode=passcode, applock=applock, lock_hash=lock_hash,
+                compress=compress
+            )
+            if over_quota:
+                return over_quota
+            return jsonify(success_response(result, 'File uploaded successfully'))
+                
+        except Exception as e:
+            return error_response(f'Failed to upload file: {str(e)}', 500)
+
+def _logical_size(record):
+    if not record:
+        return 0
+    return record['file_size'] if record['file_size'] is not None else record['stored_size'] or 0
+
+@contextmanager
+def _undoable_write(filename):
+    """
+    Keep what a write to filename replaces so _undo_if_over_quota can put it
+    back: a hidden hardlink to the file (writes replace files rather than
+    rewrite them), its files row and its permissions. Yields None if there
+    is no file; the link is dropped on exit.
+    """
+    aside_path = os.path.join(SANDBOX_DIR, f'.aside-{secrets.token_hex(8)}')
+    try:
+        os.link(os.path.join(SANDBOX_DIR, filename), aside_path)
+    except FileNotFoundError:
+        yield None
+        return
+    try:
+        yield {'path': aside_path, 'record': get_record(filename), 'permissions': get_file_permissions(filename)}
+    finally:
+        if os.path.exists(aside_path):
+            os.remove(aside_path)
+
+def _undo_if_over_quota(filename, previous):
+    """
+    Check a write that passed quota_error again once it is counted, and undo
+    it if its owner is now over quota: writes racing each other can all pass
+    the check before any of them is counted. Only writes that grew the file
+    are undone. previous comes from _undoable_write. Returns an error
+    response if the write was undone.
+    """
+    record = get_record(filename)
+    previous_record = previous['record'] if previous else None
+    if (record is None or record['user_id'] is None
+            or _logical_size(record) <= _logical_size(previous_record)
+            or not exceeds_quota(record['user_id'])):
+        return None
+
+    file_path = os.path.join(SANDBOX_DIR, filename)
+    detach_file(filename)
+    if previous:
+        os.replace(previous['path'], file_path)
+        restore_record(filename, previous_record)
+        set_file_permissions(filename, previous['permissions'])
+    else:
+        os.remove(file_path)
+        remove_file(filename)
+        delete_file_permissions(filename)
+    invalidate_listing_cache(SANDBOX_DIR)
+    return error_response(
+        'This would exceed the storage quota; the file was not changed.', 413,
+        {'quota_bytes': get_quota(record['user_id']), 'requested_bytes': _logical_size(record)}
+    )
+
+def store_upload(stream, filename, current_user, permissions, encrypt=False, passcode='',
+                 applock=False, lock_hash=None, compress=None):
+    """Stream an upload into the sandbox and record its permissions and ownership
+
+    Shared by the single-request upload and the resumable upload finalize
+    step. filename must already be sanitized. compress=None follows
+    COMPRESSION_POLICY. Returns the response data and None, or None and an
+    error response if the upload took its owner over quota and was undone.
+    """
+    final_filename = filename + '.enc' if encrypt else filename
+    with _undoable_write(final_filename) as previous:
+        result = _write_upload(stream, filename, final_filename, current_user, permissions, encrypt, passcode,
+                               applock, lock_hash, compress)
+        # The check before the upload cannot see chunked requests' size,
+        # nor uploads running alongside this one
+        over_quota = _undo_if_over_quota(final_filename, previous)
+    if over_quota:
+        return None, over_quota
+    return result, None
+
+def _write_upload(stream, filename, final_filename, current_user, permissions, encrypt, passcode,
+                  applock, lock_hash, compress):
+    """store_upload's write, indexing and permissions; returns the response data"""
+    from utils.secure_ops import log_secure_action, stream_to_sandbox
+
+    compression = None
+    
+    # If encryption is requested
+    if encrypt:
+        # Encrypt chunk by chunk with a password-derived key (PBKDF2)
+        # and save the encrypted file with .enc extension
+        file_size, sha256 = stream_to_sandbox(stream, final_filename, password=passcode)
+        stored_size = file_size
+        
+        # Log the action
+        log_secure_action(
+            current_user['user_id'],
+            'file_upload_encrypted',
+            get_client_ip(request),
+            'success',
+            f'Uploaded and encrypted file: {filename}'
+        )
+    else:
+        # Save file without encryption, streaming it in chunks. Text-like
+        # content is compressed on the way if that is enabled and pays off.
+        if compress if compress is not None else Config.COMPRESSION_POLICY == 'auto':
+            stream, compression = compress_upload_stream(stream)
+        stored_size, sha256 = stream_to_sandbox(stream, filename)
+        file_size = stream.logical_size if compression else stored_size
+        
+        # Log the action
+        log_secure_action(
+            current_user['user_id'],
+            'file_upload',
+            get_client_ip(request),
+            'success',
+            f'Uploaded file: {filename}'
+        )
+    
+    # Identical content is stored once and shared by hardlink
+    store_file(final_filename, sha256, stored_size)
+
+    # Save permissions and lock status
+    save_file_permissions(final_filename, permissions, current_user['user_id'], applock, lock_hash)
+
+    # Record file ownership in database (uploading over a file takes it over)
+    record_file(
+        final_filename, current_user['user_id'], sha256=sha256, file_size=file_size, compression=compression,
+        is_encrypted=encrypt, original_filename=filename, take_ownership=True
+    )
+
+    return {
+        'filename': final_filename,
+        'encrypted': encrypt,
+        'permissions': permissions,
+        'locked': applock,
+        'compression': compression,
+        'size': file_size,
+        'stored_size': stored_size
+    }
+
+@file_manager_bp.route('/download/<filename>', methods=['GET'])
+@token_required
+def download_file(current_user, filename):
+    """Download a file"""
+    try:
+        filename = secure_filename(filename)
+        if not is_safe_path(filename):
+             return error_response('Invalid filename.')
+
+        file_path = os.path.join(SANDBOX_DIR, filename)
+        if not os.path.exists(file_path):
+            return error_response('File not found.', 404)
+
+        file_record = get_record(filename)
+
+        # Verify file ownership (admin can access any file)
+        if current_user['role'] != 'admin':
+            if not file_record or file_record['user_id'] != current_user['user_id']:
+                from utils.secure_ops import log_secure_action
+                log_secure_action(
+                    current_user['user_id'],
+                    'file_download_denied',
+                    get_client_ip(request),
+                    'failure',
+                    f'Unauthorized access attempt for file: {filename}'
+                )
+                return error_response('You do not have permission to download this file.', 403)
+
+        permissions = get_file_permissions(filename)
+
+        # Check download permission (admin bypasses this check)
+        if current_user['role'] != 'admin':
+            if not permissions.get('download', True):
+                # Log the failed attempt
+                from utils.secure_ops import log_secure_action
+                log_secure_action(
+                    current_user['user_id'],
+                    'file_download_denied',
+                    get_client_ip(request),
+                    'failure',
+                    f'Download denied for file: {filename}'
+                )
+                return error_response('You do not have permission to download this file.', 403)
+        
+        # Check File Lock (for admin too, or maybe admin bypasses? Let's enforce for all if locked)
+        if not file_unlocked(permissions, filename, current_user['user_id']):
+            return error_response('File is locked. Passcode required.', 403, {'locked': True})
+        
+        if request.args.get('decrypt', 'false').lower() == 'true':
+            return download_decrypted(current_user, filename, file_path)
+
+        stats = os.stat(file_path)
+        etag = file_etag(file_record, stats)
+
+        last_modified = datetime.fromtimestamp(stats.st_mtime, tz=timezone.utc)
+        compression, logical_size = stored_compression(filename, file_path)
+
+        # Several ranges at once (any header with a list) are merged where
+        # they overlap or touch and served as multipart/byteranges, or as one
+        # range if that is all that is left (unless If-Range says the
+        # client's copy is stale); send_file handles single ranges and
+        # conditional requests itself
+        ranges = None
+        if not compression and ',' in request.headers.get('Range', '') and (
+                'If-Range' not in request.headers or not is_resource_modified(
+                    request.environ, etag=etag, last_modified=last_modified, ignore_if_range=False)):
+            ranges = resolve_byte_ranges(request.headers.get('Range'), stats.st_size)
+            if not ranges or len(ranges) > MAX_RANGES:
+                raise RequestedRangeNotSatisfiable(stats.st_size)
+
+        if compression:
+            # Decompressed on the fly, so served whole without byte ranges
+            response = decompressed_response(filename, file_path, compression, logical_size)
+            response.set_etag(etag)
+            response.last_modified = last_modified
+            response.make_conditional(request)
+        elif ranges and not is_resource_modified(request.environ, etag=etag, last_modified=last_modified):
+            response = Response(status=304)
+            response.set_etag(etag)
+        elif ranges:
+            mimetype = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+            response = byteranges_response(file_path, ranges, stats.st_size, mimetype)
+            response.set_etag(etag)
+            response.last_modified = last_modified
+        else:
+            response = send_file(
+                file_path,
+                as_attachment=True,
+                conditional=True,
+                etag=etag,
+                last_modified=last_modified
+            )
+
+        # Revalidations that transfer no content are not logged as downloads
+        if response.status_code != 304:
+            from utils.secure_ops import log_secure_action
+            log_secure_action(
+                current_user['user_id'],
+                'file_download',
+                get_client_ip(request),
+                'success',
+                f'Downloaded file: {filename}'
+            )
+            
+        return response
+    except RequestedRangeNotSatisfiable as e:
+        response = jsonify({'success': False, 'error': 'Requested range not satisfiable'})
+        response.status_code = 416
+        if e.length is not None:
+            response.headers['Content-Range'] = f'bytes */{e.length}'
+        return response
+    except Exception as e:
+        return error_response(f'Failed to download file: {str(e)}', 500)
+
+def file_etag(file_record, stats):
+    """Strong ETag for a sandbox file
+
+    Uses the SHA-256 recorded at write time while the file's size and mtime
+    still match the record, otherwise falls back to size, mtime and inode.
+    """
+    if (file_record and file_record['sha256']
+            and (file_record['stored_size'] or file_record['file_size']) == stats.st_size
+            and file_record['mtime_ns'] == stats.st_mtime_ns):
+        return file_record['sha256']
+    return f'{stats.st_size:x}-{stats.st_mtime_ns:x}-{stats.st_ino:x}'
+
+def current_etag(filename, file_path):
+    """ETag of a sandbox file as served by read and download"""
+    return file_etag(get_record(secure_filename(filename)), os.stat(file_path))
+
+def decompressed_response(filename, file_path, compression, logical_size):
+    """
+    Stream the logical content of a compressed file. Not send_file: a
+    server using sendfile() on the file wrapper would send the compressed
+    bytes under the logical Content-Length.
+    """
+    f = open_stored(file_path, compression)
+
+    def generate():
+        try:
+            while True:
+                chunk = f.read(Config.UPLOAD_CHUNK_SIZE)
+                if not chunk:
+                    break
+                yield chunk
+        finally:
+            f.close()
+
+    # No request context needed, and none is held if a 304 drops the body
+    response = Response(generate(), mimetype=mimetypes.guess_type(filename)[0] or 'application/octet-stream')
+    response.headers['Content-Disposition'] = f'attachment; filename="{filename}"'
+    response.headers['Content-Length'] = str(logical_size)
+    response.call_on_close(f.close)
+    return response
+
+def download_decrypted(current_user, filename, file_path):
+    """Stream the decrypted plaintext of an encrypted (.enc) file
+
+    The passcode comes from the X-Encryption-Passcode header. The first
+    chunk is decrypted before the response starts, so a wrong passcode is
+    reported as an error instead of a broken download.
+    """
+    from utils.secure_ops import log_secure_action, iter_decrypt_stream, decrypted_size
+
+    passcode = request.headers.get('X-Encryption-Passcode')
+    if not passcode:
+        return error_response('Passcode is required for decryption', 400, {'encrypted': True})
+
+    f = open(file_path, 'rb')
+    try:
+        plaintext_size = decrypted_size(f.read(64), os.fstat(f.fileno()).st_size)
+        f.seek(0)
+        chunks = iter_decrypt_stream(f, passcode)
+        first = next(chunks, b'')
+    except ValueError:
+        f.close()
+        log_secure_action(
+            current_user['user_id'],
+            'file_decrypt_denied',
+            get_client_ip(request),
+            'failure',
+            f'Decryption failed for file: {filename}'
+        )
+        return error_response('Invalid passcode or corrupted file.', 403, {'encrypted': True})
+    except Exception:
+        f.close()
+        raise
+
+    def generate():
+        try:
+            yield first
+            for chunk in chunks:
+                yield chunk
+        finally:
+            f.close()
+
+    log_secure_action(
+        current_user['user_id'],
+        'file_download_decrypted',
+        get_client_ip(request),
+        'success',
+        f'Downloaded decrypted file: {filename}'
+    )
+
+    download_name = filename[:-4] if filename.endswith('.enc') else filename
+    response = Response(
+        stream_with_context(generate()),
+        mimetype=mimetypes.guess_type(download_name)[0] or 'application/octet-stream'
+    )
+    response.headers['Content-Disposition'] = f'attachment; filename="{download_name}"'
+    if plaintext_size is not None:
+        response.headers['Content-Length'] = str(plaintext_size)
+    response.call_on_close(f.close)
+    return response
+
+@file_manager_bp.route('/permissions/<filename>', methods=['GET'])
+@token_required
+def get_permissions_endpoint(current_user, filename):
+    '''Get file permissions'''
+    try:
+        permissions = get_file_permissions(filename)
+        return jsonify(success_response(permissions))
+    except Exception as e:
+        return error_response(f'Failed to get permissions: {str(e)}', 500)
+
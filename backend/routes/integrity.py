@@ -0,0 +1,54 @@
+from flask import Blueprint, request, jsonify
+from utils.auth_utils import token_required, role_required
+from utils.helpers import get_client_ip, success_response, error_response
+from utils.secure_ops import log_secure_action
+from utils.integrity import get_failures, resolve_failure, integrity_status
+from config import Config
+
+integrity_bp = Blueprint('integrity', __name__)
+
+
+@integrity_bp.route('/status', methods=['GET'])
+@token_required
+@role_required(['admin'])
+def get_status(current_user):
+    """Verification coverage and open failures (admin only)"""
+    return jsonify(success_response(integrity_status()))
+
+
+@integrity_bp.route('/failures', methods=['GET'])
+@token_required
+@role_required(['admin'])
+def list_failures(current_user):
+    """List integrity failures, open ones only unless all=true (admin only)"""
+    include_resolved = request.args.get('all', 'false').lower() == 'true'
+    try:
+        limit = int(request.args.get('limit', Config.INTEGRITY_FAILURES_DEFAULT_LIMIT))
+    except ValueError:
+        return error_response('limit must be an integer.')
+    limit = max(1, min(limit, Config.INTEGRITY_FAILURES_MAX_LIMIT))
+    return jsonify(success_response({'failures': get_failures(include_resolved, limit)}))
+
+
+@integrity_bp.route('/failures/<int:failure_id>/resolve', methods=['POST'])
+@token_required
+@role_required(['admin'])
+def resolve(current_user, failure_id):
+    """Close a failure; accept=true makes the file's current content its new reference (admin only)"""
+    data = request.get_json() or {}
+    accept = bool(data.get('accept', False))
+    try:
+        failure = resolve_failure(failure_id, current_user['user_id'], accept=accept)
+        if failure is None:
+            return error_response('Failure not found.', 404)
+
+        log_secure_action(
+            current_user['user_id'], 'integrity_resolve', get_client_ip(request), 'success',
+            f'Resolved integrity failure {failure_id} for {failure["filename"]}'
+            + (' (accepted current content)' if accept else '')
+        )
+        return jsonify(success_response(failure, 'Integrity failure resolved'))
+    except FileNotFoundError:
+        return error_response('File no longer exists; resolve without accept.', 409)
+    except Exception as e:
+        return error_response(f'Failed to resolve integrity failure: {str(e)}', 500)
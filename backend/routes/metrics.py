@@ -0,0 +1,14 @@
+from flask import Blueprint, Response
+from utils.auth_utils import token_required, role_required
+from utils.metrics import render
+
+# Registered by app.py only when METRICS_ENABLED is set
+metrics_bp = Blueprint('metrics', __name__)
+
+
+@metrics_bp.route('/metrics', methods=['GET'])
+@token_required
+@role_required(['admin'])
+def get_metrics(current_user):
+    """Runtime metrics in Prometheus text format (admin only)"""
+    return Response(render(), content_type='text/plain; version=0.0.4; charset=utf-8')
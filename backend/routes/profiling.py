@@ -0,0 +1,105 @@
+from flask import Blueprint, request, jsonify, send_file, current_app
+from utils.auth_utils import token_required, role_required
+from utils.helpers import get_client_ip, success_response, error_response
+from utils.secure_ops import log_secure_action
+from utils.profiling import MODES, start_session, stop_session, session_status, list_profiles, profile_path
+from config import Config
+
+# Registered by app.py only when PROFILING_ENABLED is set
+profiling_bp = Blueprint('profiling', __name__)
+
+
+def _is_int(value):
+    return isinstance(value, int) and not isinstance(value, bool)
+
+
+@profiling_bp.route('/status', methods=['GET'])
+@token_required
+@role_required(['admin'])
+def get_status(current_user):
+    """The running profiling session, if any (admin only)"""
+    return jsonify(success_response({'session': session_status()}))
+
+
+@profiling_bp.route('/start', methods=['POST'])
+@token_required
+@role_required(['admin'])
+def start(current_user):
+    """
+    Start profiling requests (admin only). Profiles sample_rate of the
+    requests to the given endpoints (names such as file_manager.list_files,
+    or URL rules such as /api/files/), or of all requests if none are given.
+    """
+    data = request.get_json() or {}
+    mode = data.get('mode', 'cprofile')
+    if mode not in MODES:
+        return error_response(f'mode must be one of: {", ".join(MODES)}.')
+
+    endpoints = data.get('endpoints') or []
+    if not isinstance(endpoints, list) or not all(isinstance(endpoint, str) for endpoint in endpoints):
+        return error_response('endpoints must be a list of endpoint names or URL rules.')
+    known = set(current_app.view_functions) | {rule.rule for rule in current_app.url_map.iter_rules()}
+    unknown = [endpoint for endpoint in endpoints if endpoint not in known]
+    if unknown:
+        return error_response(f'Unknown endpoints: {", ".join(unknown)}')
+
+    sample_rate = data.get('sample_rate', 1.0 if endpoints else Config.PROFILE_DEFAULT_SAMPLE_RATE)
+    if not isinstance(sample_rate, (int, float)) or isinstance(sample_rate, bool) or not 0 < sample_rate <= 1:
+        return error_response('sample_rate must be a number in (0, 1].')
+
+    duration = data.get('duration', Config.PROFILE_DEFAULT_DURATION)
+    if not _is_int(duration) or not 0 < duration <= Config.PROFILE_MAX_DURATION:
+        return error_response(f'duration must be 1 to {Config.PROFILE_MAX_DURATION} seconds.')
+
+    max_profiles = data.get('max_profiles', Config.PROFILE_DEFAULT_MAX_PROFILES)
+    if not _is_int(max_profiles) or not 0 < max_profiles <= Config.PROFILE_MAX_FILES:
+        return error_response(f'max_profiles must be 1 to {Config.PROFILE_MAX_FILES}.')
+
+    session = start_session(mode, float(sample_rate), endpoints, duration, max_profiles, current_user['user_id'])
+    log_secure_action(
+        current_user['user_id'], 'profiling_start', get_client_ip(request), 'success',
+        f'Started {mode} profiling of {sample_rate:.0%} of requests to '
+        f'{", ".join(endpoints) or "all endpoints"} for {duration}s'
+    )
+    return jsonify(success_response({'session': session}, 'Profiling started'))
+
+
+@profiling_bp.route('/stop', methods=['POST'])
+@token_required
+@role_required(['admin'])
+def stop(current_user):
+    """Stop the running profiling session (admin only)"""
+    session = stop_session()
+    if session is None:
+        return error_response('No profiling session is running.', 404)
+
+    log_secure_action(
+        current_user['user_id'], 'profiling_stop', get_client_ip(request), 'success',
+        f'Stopped {session["mode"]} profiling after {session["captured"]} profile(s)'
+    )
+    return jsonify(success_response({'session': session}, 'Profiling stopped'))
+
+
+@profiling_bp.route('/profiles', methods=['GET'])
+@token_required
+@role_required(['admin'])
+def get_profiles(current_user):
+    """List saved profiles, newest first (admin only)"""
+    try:
+        limit = int(request.args.get('limit', Config.PROFILE_LIST_DEFAULT_LIMIT))
+    except ValueError:
+        return error_response('limit must be an integer.')
+    limit = max(1, min(limit, Config.PROFILE_LIST_MAX_LIMIT))
+    return jsonify(success_response({'profiles': list_profiles(limit)}))
+
+
+@profiling_bp.route('/profiles/<name>', methods=['GET'])
+@token_required
+@role_required(['admin'])
+def download_profile(current_user, name):
+    """Download a saved profile (admin only)"""
+    path = profile_path(name)
+    if path is None:
+        return error_response('Profile not found.', 404)
+    mimetype = 'application/octet-stream' if name.endswith('.pstats') else 'text/plain'
+    return send_file(path, mimetype=mimetype, as_attachment=True, download_name=name)
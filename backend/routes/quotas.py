@@ -0,0 +1,80 @@
+from flask import Blueprint, request, jsonify
+from database.db_connection import Database
+from utils.auth_utils import token_required, role_required
+from utils.helpers import get_client_ip, success_response, error_response
+from utils.secure_ops import log_secure_action
+from utils.files_index import reconcile
+from utils.quotas import get_usage, get_quota, top_consumers, recount_usage
+from config import Config
+
+quotas_bp = Blueprint('quotas', __name__)
+db = Database(Config.DATABASE_PATH)
+
+
+@quotas_bp.route('/me', methods=['GET'])
+@token_required
+def my_usage(current_user):
+    """Get the current user's storage usage and quota"""
+    usage = get_usage(current_user['user_id'])
+    usage['quota_bytes'] = get_quota(current_user['user_id'])
+    return jsonify(success_response(usage))
+
+
+@quotas_bp.route('/top', methods=['GET'])
+@token_required
+@role_required(['admin'])
+def get_top_consumers(current_user):
+    """List the users using the most storage (admin only)"""
+    try:
+        limit = int(request.args.get('limit', Config.QUOTA_TOP_DEFAULT_LIMIT))
+    except ValueError:
+        return error_response('limit must be an integer.')
+    limit = max(1, min(limit, Config.QUOTA_TOP_MAX_LIMIT))
+    return jsonify(success_response({'users': top_consumers(limit)}))
+
+
+@quotas_bp.route('/users/<int:user_id>', methods=['PUT'])
+@token_required
+@role_required(['admin'])
+def set_user_quota(current_user, user_id):
+    """Set a user's quota in bytes; null falls back to their role's quota (admin only)"""
+    data = request.get_json()
+    quota_bytes = data.get('quota_bytes')
+    if quota_bytes is not None and (not isinstance(quota_bytes, int) or isinstance(quota_bytes, bool)
+                                    or quota_bytes < 0):
+        return error_response('quota_bytes must be a non-negative integer or null.')
+
+    updated = db.execute_update(
+        'UPDATE users SET quota_bytes = ?, updated_at = CURRENT_TIMESTAMP WHERE id = ?',
+        (quota_bytes, user_id)
+    )
+    if not updated:
+        return error_response('User not found.', 404)
+
+    log_secure_action(
+        current_user['user_id'], 'quota_update', get_client_ip(request), 'success',
+        f'Set storage quota of user {user_id} to {quota_bytes}'
+    )
+    usage = get_usage(user_id)
+    usage['quota_bytes'] = get_quota(user_id)
+    return jsonify(success_response(usage, 'Quota updated'))
+
+
+@quotas_bp.route('/recount', methods=['POST'])
+@token_required
+@role_required(['admin'])
+def recount(current_user):
+    """Reconcile the files index with the sandbox and recount all usage (admin only)"""
+    try:
+        added, updated, removed = reconcile()
+        users = recount_usage()
+        log_secure_action(
+            current_user['user_id'], 'quota_recount', get_client_ip(request), 'success',
+            f'Recounted storage usage for {users} user(s)'
+        )
+        return jsonify(success_response({
+            'users': users,
+            'index': {'added': added, 'updated': updated, 'removed': removed}
+        }, 'Storage usage recounted'))
+    except Exception as e:
+        return error_response(f'Failed to recount storage usage: {str(e)}', 500)
@@ -1,217 +1,246 @@
-from flask import Blueprint, request, jsonify
-import os
-import shutil
-import json
-import time
-from datetime import datetime, timedelta
-from werkzeug.utils import secure_filename
-from utils.auth_utils import token_required
-from utils.helpers import success_response, error_response, get_client_ip
-from utils.secure_ops import SANDBOX_DIR, log_secure_action
-from config import Config
-
-recycle_bin_bp = Blueprint('recycle_bin', __name__)
-
-# Recycle bin directory
-RECYCLE_BIN_DIR = os.path.join(os.path.dirname(SANDBOX_DIR), 'recycle_bin')
-RECYCLE_METADATA_FILE = os.path.join(RECYCLE_BIN_DIR, 'metadata.json')
-
-# Ensure recycle bin exists
-if not os.path.exists(RECYCLE_BIN_DIR):
-    os.makedirs(RECYCLE_BIN_DIR)
-
-def get_recycle_metadata():
-    """Load recycle bin metadata"""
-    if os.path.exists(RECYCLE_METADATA_FILE):
-        try:
-            with open(RECYCLE_METADATA_FILE, 'r') as f:
-                return json.load(f)
-        except:
-            return {}
-    return {}
-
-def save_recycle_metadata(metadata):
-    """Save recycle bin metadata"""
-    with open(RECYCLE_METADATA_FILE, 'w') as f:
-        json.dump(metadata, f, indent=2)
-
-def cleanup_expired_files():
-    """Remove files older than 30 minutes"""
-    metadata = get_recycle_metadata()
-    current_time = time.time()
-    expired_files = []
-    
-    for filename, info in list(metadata.items()):
-        delete_time = info.get('deleted_at', 0)
-        # 30 minutes = 1800 seconds
-        if current_time - delete_time > 1800:
-            expired_files.append(filename)
-            # Permanently delete
-            file_path = os.path.join(RECYCLE_BIN_DIR, filename)
-            if os.path.exists(file_path):
-                os.remove(file_path)
-            # Remove from metadata
-            del metadata[filename]
-    
-    if expired_files:
-        save_recycle_metadata(metadata)
-    
-    return expired_files
-
-@recycle_bin_bp.route('/', methods=['GET'])
-@token_required
-def list_recycle_bin(current_user):
-    """List files in recycle bin"""
-    try:
-        # Clean up expired files first
-        cleanup_expired_files()
-        
-        metadata = get_recycle_metadata()
-        files = []
-        current_time = time.time()
-        
-        for filename, info in metadata.items():
-            file_path = os.path.join(RECYCLE_BIN_DIR, filename)
-            if os.path.exists(file_path):
-                stats = os.stat(file_path)
-                deleted_at = info.get('deleted_at', 0)
-                time_remaining = max(0, 1800 - (current_time - deleted_at))  # 30 min = 1800 sec
-                
-                files.append({
-                    'name': info.get('original_name', filename),
-                    'internal_name': filename,
-                    'size': stats.st_size,
-                    'deleted_at': deleted_at,
-                    'deleted_by': info.get('deleted_by'),
-                    'time_remaining': int(time_remaining),
-                    'original_permissions': info.get('permissions', {})
-                })
-        
-        # Sort by deletion time (newest first)
-        files.sort(key=lambda x: x['deleted_at'], reverse=True)
-        
-        return jsonify(success_response({'files': files}))
-    except Exception as e:
-        return error_response(f'Failed to list recycle bin: {str(e)}', 500)
-
-@recycle_bin_bp.route('/restore/<filename>', methods=['POST'])
-@token_required
-def restore_file(current_user, filename):
-    """Restore a file from recycle bin"""
-    try:
-        metadata = get_recycle_metadata()
-        
-        if filename not in metadata:
-            return error_response('File not found in recycle bin', 404)
-        
-        info = metadata[filename]
-        original_name = info.get('original_name', filename)
-        
-        recycle_path = os.path.join(RECYCLE_BIN_DIR, filename)
-        restore_path = os.path.join(SANDBOX_DIR, original_name)
-        
-        if not os.path.exists(recycle_path):
-            return error_response('File not found in recycle bin', 404)
-        
-        # Check if file already exists in sandbox
-        if os.path.exists(restore_path):
-            return error_response(f'File "{original_name}" already exists in sandbox', 400)
-        
-        # Move file back to sandbox
-        shutil.move(recycle_path, restore_path)
-        
-        # Restore permissions
-        if 'permissions' in info:
-            permissions_file = os.path.join(os.path.dirname(__file__), '..', 'file_permissions.json')
-            try:
-                with open(permissions_file, 'r') as f:
-                    all_permissions = json.load(f)
-            except:
-                all_permissions = {}
-            
-            all_permissions[original_name] = info['permissions']
-            
-            with open(permissions_file, 'w') as f:
-                json.dump(all_permissions, f, indent=2)
-        
-        # Remove from recycle bin metadata
-        del metadata[filename]
-        save_recycle_metadata(metadata)
-        
-        # Log the action
-        log_secure_action(
-            current_user['user_id'],
-            'file_restored',
-            get_client_ip(request),
-            'success',
-            f'Restored file: {original_name}'
-        )
-        
-        return jsonify(success_response(None, f'File "{original_name}" restored successfully'))
-    except Exception as e:
-        return error_response(f'Failed to restore file: {str(e)}', 500)
-
-@recycle_bin_bp.route('/delete/<filename>', methods=['DELETE'])
-@token_required
-def permanently_delete(current_user, filename):
-    """Permanently delete a file from recycle bin"""
-    try:
-        metadata = get_recycle_metadata()
-        
-        if filename not in metadata:
-            return error_response('File not found in recycle bin', 404)
-        
-        info = metadata[filename]
-        original_name = info.get('original_name', filename)
-        
-        recycle_path = os.path.join(RECYCLE_BIN_DIR, filename)
-        
-        if os.path.exists(recycle_path):
-            os.remove(recycle_path)
-        
-        # Remove from metadata
-        del metadata[filename]
-        save_recycle_metadata(metadata)
-        
-        # Log the action
-        log_secure_action(
-            current_user['user_id'],
-            'file_permanently_deleted',
-            get_client_ip(request),
-            'success',
-            f'Permanently deleted file: {original_name}'
-        )
-        
-        return jsonify(success_response(None, f'File "{original_name}" permanently deleted'))
-    except Exception as e:
-        return error_response(f'Failed to delete file: {str(e)}', 500)
-
-@recycle_bin_bp.route('/empty', methods=['POST'])
-@token_required
-def empty_recycle_bin(current_user):
-    """Empty entire recycle bin"""
-    try:
-        metadata = get_recycle_metadata()
-        deleted_count = 0
-        
-        for filename in list(metadata.keys()):
-            recycle_path = os.path.join(RECYCLE_BIN_DIR, filename)
-            if os.path.exists(recycle_path):
-                os.remove(recycle_path)
-                deleted_count += 1
-        
-        # Clear metadata
-        save_recycle_metadata({})
-        
-        # Log the action
-        log_secure_action(
-            current_user['user_id'],
-            'recycle_bin_emptied',
-            get_client_ip(request),
-            'success',
-            f'Emptied recycle bin ({deleted_count} files)'
-        )
-        
-        return jsonify(success_response(None, f'Recycle bin emptied ({deleted_count} files deleted)'))
-    except Exception as e:
-        return error_response(f'Failed to empty recycle bin: {str(e)}', 500)
+from flask import Blueprint, request, jsonify
+import os
+import shutil
+import time
+from utils.auth_utils import token_required
+from utils.helpers import success_response, error_response, get_client_ip
+from utils.secure_ops import SANDBOX_DIR, log_secure_action
+from utils.permissions_store import set_file_permissions
+from utils.dir_listing import invalidate_listing_cache
+from utils.blob_store import restore_file as restore_blob, recycle_file
+from utils.files_index import restore_record, remove_file
+from utils.file_versions import restore_versions
+from utils.quotas import quota_error, exceeds_quota
+from config import Config
+from utils.recycle_store import (
+    list_page, claim_entry, release_claim, entry_path, purge_entry
+)
+from utils.recycle_jobs import start_empty_job, get_job
+
+recycle_bin_bp = Blueprint('recycle_bin', __name__)
+
+def owner_scope(current_user):
+    """Admins act on the whole bin; other users only on what they deleted"""
+    return None if current_user['role'] == 'admin' else current_user['user_id']
+
+def _restored_owner(entry):
+    """The owner a restored file is charged to, as restore_record assigns it"""
+    return (entry.get('file_record') or {}).get('user_id') or (entry['permissions'] or {}).get('owner')
+
+def restore_quota_error(entry, current_user):
+    """quota_error for restoring an entry, or None if it fits or has no owner"""
+    owner_id = _restored_owner(entry)
+    if owner_id is None:
+        return None
+    record = entry.get('file_record') or {}
+    size = record['file_size'] if record.get('file_size') is not None else entry['size']
+    return quota_error(entry['original_name'], current_user['user_id'], size, owner_id=owner_id)
+
+def restore_entry(entry):
+    """
+    Put a claimed entry's bytes back in the sandbox under its original name.
+
+    Returns False, with the entry back in the bin, if writes racing this
+    one took its owner over quota once it was counted.
+    """
+    original_name = entry['original_name']
+    if entry.get('sha256'):
+        restore_blob(entry['sha256'], original_name)
+    else:
+        shutil.move(entry_path(entry), os.path.join(SANDBOX_DIR, original_name))
+    restore_record(original_name, entry.get('file_record'), (entry['permissions'] or {}).get('owner'))
+
+    owner_id = _restored_owner(entry)
+    if entry['size'] and owner_id is not None and exceeds_quota(owner_id):
+        remove_file(original_name)
+        if recycle_file(original_name) is None:
+            shutil.move(os.path.join(SANDBOX_DIR, original_name), entry_path(entry))
+            invalidate_listing_cache(SANDBOX_DIR)
+        release_claim(entry)
+        return False
+
+    restore_versions(entry['recycle_name'], original_name)
+    return True
+
+@recycle_bin_bp.route('/', methods=['GET'])
+@token_required
+def list_recycle_bin(current_user):
+    """List files in recycle bin, newest deletion first
+
+    Query parameters: cursor (from a previous page's next_cursor), limit,
+    prefix (of the original name), since and until (deletion time, epoch
+    seconds) and, for admins, deleted_by (username). Users other than
+    admins only see files they deleted.
+    """
+    try:
+        limit = request.args.get('limit', Config.RECYCLE_LIST_DEFAULT_LIMIT, type=int)
+        limit = max(1, min(limit, Config.RECYCLE_LIST_MAX_LIMIT))
+        
+        # Expired entries waiting for the background reaper are left out
+        try:
+            entries, next_cursor, total = list_page(
+                owner_id=owner_scope(current_user),
+                deleted_by=request.args.get('deleted_by') if current_user['role'] == 'admin' else None,
+                prefix=request.args.get('prefix', ''),
+                since=request.args.get('since', type=int),
+                until=request.args.get('until', type=int),
+                cursor=request.args.get('cursor') or None,
+                limit=limit
+            )
+        except ValueError as e:
+            return error_response(str(e))
+        
+        current_time = time.time()
+        files = []
+        for entry in entries:
+            time_remaining = max(0, entry['expires_at'] - current_time)
+            files.append({
+                'name': entry['original_name'],
+                'internal_name': entry['recycle_name'],
+                'size': entry['size'],
+                'deleted_at': entry['deleted_at'],
+                'deleted_by': entry['deleted_by'],
+                'time_remaining': int(time_remaining),
+                'original_permissions': entry['permissions'] or {}
+            })
+        
+        return jsonify(success_response({
+            'files': files,
+            'next_cursor': next_cursor,
+            'total': total
+        }))
+    except Exception as e:
+        return error_response(f'Failed to list recycle bin: {str(e)}', 500)
+
+@recycle_bin_bp.route('/restore/<filename>', methods=['POST'])
+@token_required
+def restore_file(current_user, filename):
+    """Restore a file from recycle bin"""
+    try:
+        # Claiming removes the entry, so a concurrent restore or the reaper
+        # cannot act on it too; it is put back if the restore fails
+        entry = claim_entry(filename, owner_scope(current_user))
+        if entry is None:
+            return error_response('File not found in recycle bin', 404)
+        
+        original_name = entry['original_name']
+        
+        if not os.path.exists(entry_path(entry)):
+            # The bytes are gone, so the entry can never be restored; drop
+            # what is left of it (versions, blob reference) instead
+            purge_entry(entry)
+            return error_response('File not found in recycle bin', 404)
+        
+        # Check if file already exists in sandbox
+        if os.path.exists(os.path.join(SANDBOX_DIR, original_name)):
+            release_claim(entry)
+            return error_response(f'File "{original_name}" already exists in sandbox', 400)
+        
+        over_quota = restore_quota_error(entry, current_user)
+        if over_quota:
+            release_claim(entry)
+            return over_quota
+        
+        # Relink the blob, or move the file back to sandbox
+        try:
+            restored = restore_entry(entry)
+        except OSError:
+            release_claim(entry)
+            raise
+        if not restored:
+            return error_response('Restoring this file would exceed the storage quota.', 413)
+        invalidate_listing_cache(SANDBOX_DIR)
+        
+        # Restore permissions
+        if entry['permissions'] is not None:
+            set_file_permissions(original_name, entry['permissions'])
+        
+        # Log the action
+        log_secure_action(
+            current_user['user_id'],
+            'file_restored',
+            get_client_ip(request),
+            'success',
+            f'Restored file: {original_name}'
+        )
+        
+        return jsonify(success_response(None, f'File "{original_name}" restored successfully'))
+    except Exception as e:
+        return error_response(f'Failed to restore file: {str(e)}', 500)
+
+@recycle_bin_bp.route('/delete/<filename>', methods=['DELETE'])
+@token_required
+def permanently_delete(current_user, filename):
+    """Permanently delete a file from recycle bin"""
+    try:
+        entry = claim_entry(filename, owner_scope(current_user))
+        if entry is None:
+            return error_response('File not found in recycle bin', 404)
+        
+        original_name = entry['original_name']
+        purge_entry(entry)
+        
+        # Log the action
+        log_secure_action(
+            current_user['user_id'],
+            'file_permanently_deleted',
+            get_client_ip(request),
+            'success',
+            f'Permanently deleted file: {original_name}'
+        )
+        
+        return jsonify(success_response(None, f'File "{original_name}" permanently deleted'))
+    except Exception as e:
+        return error_response(f'Failed to delete file: {str(e)}', 500)
+
+def _job_response(job):
+    return {
+        'job_id': job['id'],
+        'status': job['status'],
+        'total': job['total'],
+        'processed': job['processed'],
+        'purged': job['purged'],
+        'remaining': job['remaining'],
+        'error': job['error'],
+        'created_at': job['created_at'],
+        'finished_at': job['finished_at']
+    }
+
+@recycle_bin_bp.route('/empty', methods=['POST'])
+@token_required
+def empty_recycle_bin(current_user):
+    """Start emptying the recycle bin (for users other than admins, their own files in it)
+
+    Files are purged by a background job in throttled batches; poll
+    GET /empty/<job_id> for progress. Files deleted after the request are
+    left alone. If a job for the same scope is already running, that job
+    is returned.
+    """
+    try:
+        job, created = start_empty_job(owner_scope(current_user), current_user['user_id'])
+        
+        if created:
+            log_secure_action(
+                current_user['user_id'],
+                'recycle_bin_emptied',
+                get_client_ip(request),
+                'success',
+                f'Started emptying recycle bin ({job["total"]} files, job {job["id"]})'
+            )
+        
+        message = 'Emptying recycle bin' if created else 'Recycle bin is already being emptied'
+        return jsonify(success_response(_job_response(job), message)), 202
+    except Exception as e:
+        return error_response(f'Failed to empty recycle bin: {str(e)}', 500)
+
+@recycle_bin_bp.route('/empty/<job_id>', methods=['GET'])
+@token_required
+def empty_status(current_user, job_id):
+    """Progress of an empty-recycle-bin job"""
+    try:
+        job = get_job(job_id)
+        if job is None or (current_user['role'] != 'admin' and job['requested_by'] != current_user['user_id']):
+            return error_response('Job not found', 404)
+        return jsonify(success_response(_job_response(job)))
+    except Exception as e:
+        return error_response(f'Failed to get job status: {str(e)}', 500)
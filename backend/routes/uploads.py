@@ -0,0 +1,329 @@
+from flask import Blueprint, request, jsonify
+import os
+import time
+import shutil
+import hashlib
+import secrets
+import tempfile
+from werkzeug.security import generate_password_hash
+from database.db_connection import Database
+from utils.auth_utils import token_required
+from utils.helpers import get_client_ip, success_response, error_response
+from utils.secure_ops import log_secure_action
+from utils.quotas import quota_error
+from routes.file_manager import safe_filename, store_upload
+from config import Config
+
+uploads_bp = Blueprint('uploads', __name__)
+db = Database(Config.DATABASE_PATH)
+
+STAGING_DIR = Config.UPLOAD_STAGING_DIR
+
+
+def _session_dir(session_id):
+    return os.path.join(STAGING_DIR, session_id)
+
+
+def _chunk_path(session_id, index):
+    return os.path.join(_session_dir(session_id), f'{index:08d}.part')
+
+
+def _chunk_count(session):
+    """Number of chunks in the upload (zero for an empty file)"""
+    return -(-session['total_size'] // session['chunk_size'])
+
+
+def _expected_chunk_size(session, index):
+    """Every chunk is chunk_size bytes except possibly the last one"""
+    if index < _chunk_count(session) - 1:
+        return session['chunk_size']
+    return session['total_size'] - session['chunk_size'] * index
+
+
+def _get_session(session_id, current_user):
+    """Load an upload session owned by the current user, or None"""
+    rows = db.execute_query('SELECT * FROM upload_sessions WHERE id = ?', (session_id,))
+    if not rows or rows[0]['user_id'] != current_user['user_id']:
+        return None
+    return rows[0]
+
+
+def _session_status(session):
+    """Summarize which chunks have arrived and how far the contiguous prefix reaches"""
+    rows = db.execute_query(
+        'SELECT chunk_index, size FROM upload_chunks WHERE session_id = ? ORDER BY chunk_index',
+        (session['id'],)
+    )
+    received = {row['chunk_index']: row['size'] for row in rows}
+    total_chunks = _chunk_count(session)
+
+    # Clients resuming sequentially can continue from this byte offset
+    contiguous_offset = 0
+    for index in range(total_chunks):
+        if index not in received:
+            break
+        contiguous_offset += received[index]
+
+    return {
+        'upload_id': session['id'],
+        'filename': session['filename'],
+        'total_size': session['total_size'],
+        'chunk_size': session['chunk_size'],
+        'total_chunks': total_chunks,
+        'received_chunks': sorted(received),
+        'missing_chunks': [i for i in range(total_chunks) if i not in received],
+        'received_bytes': sum(received.values()),
+        'contiguous_offset': contiguous_offset,
+        'status': session['status'],
+        'expires_at': session['last_activity'] + Config.UPLOAD_SESSION_TTL
+    }
+
+
+def _discard_session(session_id):
+    db.execute_update('DELETE FROM upload_chunks WHERE session_id = ?', (session_id,))
+    db.execute_update('DELETE FROM upload_sessions WHERE id = ?', (session_id,))
+    shutil.rmtree(_session_dir(session_id), ignore_errors=True)
+
+
+class _ChunkReader:
+    """File-like reader over a session's staged chunks in order"""
+
+    def __init__(self, paths):
+        self._paths = iter(paths)
+        self._current = None
+
+    def read(self, size=-1):
+        # Fill the request across chunk boundaries: the encryptor relies on
+        # full reads to find the final chunk
+        parts = []
+        while size < 0 or size > 0:
+            if self._current is None:
+                path = next(self._paths, None)
+                if path is None:
+                    break
+                self._current = open(path, 'rb')
+            data = self._current.read(size)
+            if not data:
+                self._current.close()
+                self._current = None
+                continue
+            parts.append(data)
+            if size > 0:
+                size -= len(data)
+        return b''.join(parts)
+
+    def close(self):
+        if self._current is not None:
+            self._current.close()
+            self._current = None
+
+
+@uploads_bp.route('/', methods=['POST'])
+@token_required
+def create_upload(current_user):
+    """Start a resumable upload session"""
+    data = request.get_json()
+
+    try:
+        filename = safe_filename(data.get('filename', ''))
+    except ValueError as e:
+        return error_response(str(e))
+
+    total_size = data.get('total_size')
+    chunk_size = data.get('chunk_size', Config.RESUMABLE_DEFAULT_CHUNK_SIZE)
+    if not isinstance(total_size, int) or total_size < 0:
+        return error_response('total_size must be a non-negative integer.')
+    if total_size > Config.RESUMABLE_MAX_FILE_SIZE:
+        return error_response('File is too large.', 413)
+    if not isinstance(chunk_size, int) or not 0 < chunk_size <= Config.RESUMABLE_MAX_CHUNK_SIZE:
+        return error_response(f'chunk_size must be between 1 and {Config.RESUMABLE_MAX_CHUNK_SIZE} bytes.')
+
+    over_quota = quota_error(filename, current_user['user_id'], total_size, take_ownership=True)
+    if over_quota:
+        return over_quota
+
+    session_id = secrets.token_urlsafe(16)
+    os.makedirs(_session_dir(session_id), exist_ok=True)
+    db.execute_insert(
+        '''INSERT INTO upload_sessions (id, user_id, filename, total_size, chunk_size, last_activity)
+           VALUES (?, ?, ?, ?, ?, ?)''',
+        (session_id, current_user['user_id'], filename, total_size, chunk_size, time.time())
+    )
+
+    session = db.execute_query('SELECT * FROM upload_sessions WHERE id = ?', (session_id,))[0]
+    return jsonify(success_response(_session_status(session), 'Upload session created')), 201
+
+
+@uploads_bp.route('/<session_id>', methods=['GET'])
+@token_required
+def get_upload(current_user, session_id):
+    """Report received chunks and offsets so a client can resume"""
+    session = _get_session(session_id, current_user)
+    if not session:
+        return error_response('Upload session not found.', 404)
+    return jsonify(success_response(_session_status(session)))
+
+
+@uploads_bp.route('/<session_id>/chunks/<int:index>', methods=['PUT'])
+@token_required
+def put_chunk(current_user, session_id, index):
+    """Store one chunk (raw request body); retries simply overwrite it"""
+    session = _get_session(session_id, current_user)
+    if not session:
+        return error_response('Upload session not found.', 404)
+    if session['status'] != 'open':
+        return error_response('Upload is being finalized.', 409)
+    if not 0 <= index < _chunk_count(session):
+        return error_response('Chunk index out of range.')
+
+    # Chunked request bodies declare no length; their size is checked once read
+    expected_size = _expected_chunk_size(session, index)
+    if request.content_length is not None and request.content_length != expected_size:
+        return error_response(f'Chunk {index} must be exactly {expected_size} bytes.')
+
+    digest = hashlib.sha256()
+    size = 0
+    fd, tmp_path = tempfile.mkstemp(dir=_session_dir(session_id), prefix='.chunk-')
+    try:
+        with os.fdopen(fd, 'wb') as out:
+            while True:
+                block = request.stream.read(Config.UPLOAD_CHUNK_SIZE)
+                if not block:
+                    break
+                digest.update(block)
+                size += len(block)
+                out.write(block)
+
+        if size != expected_size:
+            os.remove(tmp_path)
+            return error_response(f'Chunk {index} must be exactly {expected_size} bytes.')
+
+        expected_hash = request.headers.get('X-Chunk-SHA256')
+        if expected_hash and expected_hash.lower() != digest.hexdigest():
+            os.remove(tmp_path)
+            return error_response('Chunk checksum mismatch.', 422)
+
+        os.replace(tmp_path, _chunk_path(session_id, index))
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+    db.execute_insert(
+        'INSERT OR REPLACE INTO upload_chunks (session_id, chunk_index, size, sha256) VALUES (?, ?, ?, ?)',
+        (session_id, index, size, digest.hexdigest())
+    )
+    db.execute_update('UPDATE upload_sessions SET last_activity = ? WHERE id = ?', (time.time(), session_id))
+
+    return jsonify(success_response({'index': index, 'size': size, 'sha256': digest.hexdigest()}, 'Chunk stored'))
+
+
+@uploads_bp.route('/<session_id>/complete', methods=['POST'])
+@token_required
+def complete_upload(current_user, session_id):
+    """Assemble the chunks into the sandbox, applying encryption and permissions"""
+    session = _get_session(session_id, current_user)
+    if not session:
+        return error_response('Upload session not found.', 404)
+
+    # All options have defaults, so the body may be empty or missing
+    data = request.get_json(silent=True) or {}
+    if not isinstance(data, dict):
+        return error_response('Request body must be a JSON object.')
+    encrypt = data.get('encrypt', False)
+    passcode = data.get('passcode', '')
+    permissions = data.get('permissions', {'view': True, 'download': True, 'edit': False, 'delete': False})
+    applock = data.get('applock', False)
+    applock_passcode = data.get('applock_passcode', '')
+    compress = data.get('compress')
+
+    # JSON booleans only: bool("false") would be True
+    if not isinstance(encrypt, bool) or not isinstance(applock, bool):
+        return error_response('encrypt and applock must be true or false.')
+    if not isinstance(passcode, str) or not isinstance(applock_passcode, str):
+        return error_response('passcode and applock_passcode must be strings.')
+    if encrypt and not passcode:
+        return error_response('Passcode is required for encryption')
+    if applock and not applock_passcode:
+        return error_response('Passcode is required for AppLock')
+    if not isinstance(permissions, dict):
+        return error_response('permissions must be an object.')
+    if compress is not None and not isinstance(compress, bool):
+        return error_response('compress must be true or false.')
+
+    status = _session_status(session)
+    if status['missing_chunks']:
+        return error_response('Upload is incomplete.', 409, {'missing_chunks': status['missing_chunks']})
+
+    # Checked again: usage may have grown since the session was created
+    over_quota = quota_error(
+        session['filename'] + '.enc' if encrypt else session['filename'], current_user['user_id'],
+        session['total_size'], take_ownership=True
+    )
+    if over_quota:
+        return over_quota
+
+    # Only one finalize may run per session
+    claimed = db.execute_update(
+        "UPDATE upload_sessions SET status = 'finalizing', last_activity = ? WHERE id = ? AND status = 'open'",
+        (time.time(), session_id)
+    )
+    if not claimed:
+        return error_response('Upload is already being finalized.', 409)
+
+    lock_hash = generate_password_hash(applock_passcode) if applock else None
+    reader = _ChunkReader([_chunk_path(session_id, i) for i in range(status['total_chunks'])])
+    try:
+        result, over_quota = store_upload(
+            reader, session['filename'], current_user, permissions,
+            encrypt=encrypt, passcode=passcode, applock=applock, lock_hash=lock_hash,
+            compress=compress
+        )
+    except Exception as e:
+        db.execute_update("UPDATE upload_sessions SET status = 'open' WHERE id = ?", (session_id,))
+        return error_response(f'Failed to finalize upload: {str(e)}', 500)
+    finally:
+        reader.close()
+
+    # Undone for quota: the chunks are kept, so finalizing can be retried
+    if over_quota:
+        db.execute_update("UPDATE upload_sessions SET status = 'open' WHERE id = ?", (session_id,))
+        return over_quota
+
+    _discard_session(session_id)
+    return jsonify(success_response(result, 'File uploaded successfully'))
+
+
+@uploads_bp.route('/<session_id>', methods=['DELETE'])
+@token_required
+def abort_upload(current_user, session_id):
+    """Abort an upload session and discard its chunks"""
+    session = _get_session(session_id, current_user)
+    if not session:
+        return error_response('Upload session not found.', 404)
+
+    _discard_session(session_id)
+    log_secure_action(
+        current_user['user_id'],
+        'upload_aborted',
+        get_client_ip(request),
+        'success',
+        f'Aborted resumable upload: {session["filename"]}'
+    )
+    return jsonify(success_response(None, 'Upload session aborted'))
+
+
+def reap_stale_uploads():
+    """Discard sessions idle longer than UPLOAD_SESSION_TTL and orphaned staging dirs"""
+    cutoff = time.time() - Config.UPLOAD_SESSION_TTL
+    stale = db.execute_query('SELECT id FROM upload_sessions WHERE last_activity < ?', (cutoff,))
+    for row in stale:
+        _discard_session(row['id'])
+
+    if os.path.isdir(STAGING_DIR):
+        known = {row['id'] for row in db.execute_query('SELECT id FROM upload_sessions')}
+        for entry in os.scandir(STAGING_DIR):
+            if entry.is_dir() and entry.name not in known and entry.stat().st_mtime < cutoff:
+                shutil.rmtree(entry.path, ignore_errors=True)
+
+    return len(stale)
@@ -0,0 +1,63 @@
+import os
+import sys
+import json
+import hashlib
+import tempfile
+import unittest
+import subprocess
+
+TESTS_DIR = os.path.dirname(os.path.abspath(__file__))
+BACKEND_DIR = os.path.dirname(TESTS_DIR)
+
+# Starts the key derivation pool the way "python app.py" does: spawned
+# workers re-run the main script, here app.py, as __mp_main__
+DRIVER = '''
+import sys, json
+sys.path[:0] = [{backend!r}, {tests!r}]
+import __main__
+__main__.__file__ = {app!r}
+from config import Config
+Config.KDF_WORKERS = 1
+from utils import key_derivation
+import test_key_derivation
+key = key_derivation.derive_key('passcode', b'0' * 16, use_cache=False)
+state = key_derivation._get_pool().submit(test_key_derivation.worker_state).result()
+print(json.dumps(dict(state, key=key.hex())))
+'''
+
+
+def worker_state():
+    """What a pool worker has loaded besides the KDF (runs in the worker)"""
+    import threading
+    main = sys.modules.get('__mp_main__')
+    return {
+        'main_file': getattr(main, '__file__', None),
+        'app_modules': sorted(name for name in sys.modules if name.split('.')[0] in ('routes', 'database')),
+        'threads': threading.active_count(),
+    }
+
+
+class KeyDerivationPoolTest(unittest.TestCase):
+
+    def test_workers_skip_app_startup(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            env = dict(os.environ, SECRET_KEY='s' * 32, JWT_SECRET_KEY='j' * 32, ENCRYPTION_KEY='e' * 32,
+                       DATABASE_PATH=os.path.join(tmp, 'database.db'))
+            driver = DRIVER.format(backend=BACKEND_DIR, tests=TESTS_DIR, app=os.path.join(BACKEND_DIR, 'app.py'))
+            result = subprocess.run([sys.executable, '-c', driver], cwd=tmp, env=env,
+                                    capture_output=True, text=True, timeout=120)
+            self.assertEqual(result.returncode, 0, result.stderr)
+            state = json.loads(result.stdout.strip().splitlines()[-1])
+
+            expected = hashlib.pbkdf2_hmac('sha256', b'passcode', b'0' * 16, 600_000, 32)
+            self.assertEqual(state['key'], expected.hex())
+            # The worker did re-run app.py, without opening the database,
+            # registering routes or starting background tasks
+            self.assertEqual(state['main_file'], os.path.join(BACKEND_DIR, 'app.py'))
+            self.assertEqual(state['app_modules'], [])
+            self.assertEqual(state['threads'], 1)
+            self.assertFalse(os.path.exists(env['DATABASE_PATH']))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,73 +1,123 @@
-import jwt
-import bcrypt
-from datetime import datetime, timedelta
-from functools import wraps
-from flask import request, jsonify
-from config import Config
-
-def hash_password(password):
-    """Hash a password using bcrypt"""
-    return bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
-
-def verify_password(password, password_hash):
-    """Verify a password against its hash"""
-    return bcrypt.checkpw(password.encode('utf-8'), password_hash.encode('utf-8'))
-
-def generate_token(user_id, username, role):
-    """Generate JWT access token"""
-    payload = {
-        'user_id': user_id,
-        'username': username,
-        'role': role,
-        'exp': datetime.utcnow() + timedelta(seconds=Config.JWT_ACCESS_TOKEN_EXPIRES),
-        'iat': datetime.utcnow()
-    }
-    return jwt.encode(payload, Config.JWT_SECRET_KEY, algorithm='HS256')
-
-def decode_token(token):
-    """Decode and verify JWT token"""
-    try:
-        payload = jwt.decode(token, Config.JWT_SECRET_KEY, algorithms=['HS256'])
-        return payload
-    except jwt.ExpiredSignatureError:
-        return None
-    except jwt.InvalidTokenError:
-        return None
-
-def token_required(f):
-    """Decorator to require valid JWT token"""
-    @wraps(f)
-    def decorated(*args, **kwargs):
-        token = None
-        
-        # Get token from Authorization header
-        if 'Authorization' in request.headers:
-            auth_header = request.headers['Authorization']
-            try:
-                token = auth_header.split(' ')[1]  # Bearer <token>
-            except IndexError:
-                return jsonify({'error': 'Invalid token format'}), 401
-        
-        if not token:
-            return jsonify({'error': 'Token is missing'}), 401
-        
-        # Decode token
-        payload = decode_token(token)
-        if not payload:
-            return jsonify({'error': 'Token is invalid or expired'}), 401
-        
-        # Pass user info to the route
-        return f(payload, *args, **kwargs)
-    
-    return decorated
-
-def role_required(allowed_roles):
-    """Decorator to require specific role(s)"""
-    def decorator(f):
-        @wraps(f)
-        def decorated(current_user, *args, **kwargs):
-            if current_user['role'] not in allowed_roles:
-                return jsonify({'error': 'Insufficient permissions'}), 403
-            return f(current_user, *args, **kwargs)
-        return decorated
-    return decorator
+import jwt
+import bcrypt
+import hashlib
+from datetime import datetime, timedelta
+from functools import wraps
+from flask import request, jsonify
+from werkzeug.security import check_password_hash
+from config import Config
+
+# Unlock tokens carry this audience, so decode_token (and therefore
+# token_required) rejects them as access tokens
+UNLOCK_TOKEN_AUDIENCE = 'file-unlock'
+
+def hash_password(password):
+    """Hash a password using bcrypt"""
+    return bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
+
+def verify_password(password, password_hash):
+    """Verify a password against its hash"""
+    return bcrypt.checkpw(password.encode('utf-8'), password_hash.encode('utf-8'))
+
+def generate_token(user_id, username, role):
+    """Generate JWT access token"""
+    payload = {
+        'user_id': user_id,
+        'username': username,
+        'role': role,
+        'exp': datetime.utcnow() + timedelta(seconds=Config.JWT_ACCESS_TOKEN_EXPIRES),
+        'iat': datetime.utcnow()
+    }
+    return jwt.encode(payload, Config.JWT_SECRET_KEY, algorithm='HS256')
+
+def decode_token(token):
+    """Decode and verify JWT token"""
+    try:
+        payload = jwt.decode(token, Config.JWT_SECRET_KEY, algorithms=['HS256'])
+        return payload
+    except jwt.ExpiredSignatureError:
+        return None
+    except jwt.InvalidTokenError:
+        return None
+
+def lock_version(lock_hash):
+    """Fingerprint of a file's lock; re-locking produces a new salted hash and so a new version"""
+    return hashlib.sha256((lock_hash or '').encode()).hexdigest()[:16]
+
+def generate_unlock_token(user_id, filename, lock_hash):
+    """Generate a short-lived token proving the user knows a locked file's passcode"""
+    payload = {
+        'uid': user_id,
+        'file': filename,
+        'lv': lock_version(lock_hash),
+        'aud': UNLOCK_TOKEN_AUDIENCE,
+        'exp': datetime.utcnow() + timedelta(seconds=Config.UNLOCK_TOKEN_EXPIRES),
+        'iat': datetime.utcnow()
+    }
+    return jwt.encode(payload, Config.JWT_SECRET_KEY, algorithm='HS256')
+
+def verify_unlock_token(token, user_id, filename, lock_hash):
+    """Check an unlock token against the user, the file and its current lock"""
+    try:
+        payload = jwt.decode(token, Config.JWT_SECRET_KEY, algorithms=['HS256'], audience=UNLOCK_TOKEN_AUDIENCE)
+    except jwt.InvalidTokenError:
+        return False
+    return (payload.get('uid') == user_id
+            and payload.get('file') == filename
+            and payload.get('lv') == lock_version(lock_hash))
+
+def file_unlocked(permissions, filename, user_id, token=None, passcode=None):
+    """
+    Whether a locked file may be accessed by this request.
+
+    An unlock token (X-Unlock-Token) is checked first since it only costs
+    an HMAC; the passcode (X-File-Passcode) needs the slow password hash.
+    """
+    if not permissions.get('is_locked', False):
+        return True
+    lock_hash = permissions.get('lock_hash') or ''
+
+    token = token or request.headers.get('X-Unlock-Token')
+    if token and verify_unlock_token(token, user_id, filename, lock_hash):
+        return True
+
+    passcode = passcode or request.headers.get('X-File-Passcode')
+    return bool(passcode) and check_password_hash(lock_hash, passcode)
+
+def token_required(f):
+    """Decorator to require valid JWT token"""
+    @wraps(f)
+    def decorated(*args, **kwargs):
+        token = None
+        
+        # Get token from Authorization header
+        if 'Authorization' in request.headers:
+            auth_header = request.headers['Authorization']
+            try:
+                token = auth_header.split(' ')[1]  # Bearer <token>
+            except IndexError:
+                return jsonify({'error': 'Invalid token format'}), 401
+        
+        if not token:
+            return jsonify({'error': 'Token is missing'}), 401
+        
+        # Decode token
+        payload = decode_token(token)
+        if not payload:
+            return jsonify({'error': 'Token is invalid or expired'}), 401
+        
+        # Pass user info to the route
+        return f(payload, *args, **kwargs)
+    
+    return decorated
+
+def role_required(allowed_roles):
+    """Decorator to require specific role(s)"""
+    def decorator(f):
+        @wraps(f)
+        def decorated(current_user, *args, **kwargs):
+            if current_user['role'] not in allowed_roles:
+                return jsonify({'error': 'Insufficient permissions'}), 403
+            return f(current_user, *args, **kwargs)
+        return decorated
+    return decorator
@@ -0,0 +1,103 @@
+import time
+import heapq
+import logging
+import threading
+import multiprocessing
+
+# name -> thread, so each task is started at most once per process
+_tasks = {}
+_tasks_lock = threading.Lock()
+
+
+def is_worker_process():
+    """True inside multiprocessing children (e.g. the key derivation pool)"""
+    return multiprocessing.parent_process() is not None
+
+
+def start_periodic_task(name, interval, func):
+    """
+    Run func every interval seconds on a daemon thread.
+
+    Safe to call more than once; the task starts only on the first call
+    and never in multiprocessing worker processes. Exceptions are logged
+    and the task keeps running. Returns an Event that stops the task.
+    """
+    with _tasks_lock:
+        if name in _tasks or is_worker_process():
+            return None
+
+        stop = threading.Event()
+
+        def run():
+            while not stop.wait(interval):
+                try:
+                    func()
+                except Exception:
+                    logging.exception(f"Background task {name} failed")
+
+        thread = threading.Thread(target=run, name=name, daemon=True)
+        _tasks[name] = thread
+        thread.start()
+        return stop
+
+
+class DeadlineTask:
+    """
+    Run func on a daemon thread whenever a scheduled deadline passes.
+
+    Deadlines (epoch seconds) are kept in a min-heap and the thread sleeps
+    until the earliest one. It also wakes every max_sleep seconds, so work
+    scheduled by other processes is picked up. func runs once per wake-up,
+    however many deadlines are due.
+    """
+
+    def __init__(self, name, func, max_sleep):
+        self.name = name
+        self._func = func
+        self._max_sleep = max_sleep
+        self._deadlines = []
+        self._wakeup = threading.Condition()
+
+    def schedule(self, when):
+        """Make sure func runs at (or shortly after) the given time"""
+        with self._wakeup:
+            heapq.heappush(self._deadlines, when)
+            if self._deadlines[0] == when:
+                self._wakeup.notify()
+
+    def start(self):
+        """Start the thread; a no-op after the first call and in worker processes"""
+        with _tasks_lock:
+            if self.name in _tasks or is_worker_process():
+                return False
+            thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+            _tasks[self.name] = thread
+            thread.start()
+            return True
+
+    def _wait(self):
+        """Sleep until a deadline is due or max_sleep has passed"""
+        with self._wakeup:
+            while True:
+                now = time.time()
+                due = False
+                while self._deadlines and self._deadlines[0] <= now:
+                    heapq.heappop(self._deadlines)
+                    due = True
+                if due:
+                    return
+
+                timeout = self._max_sleep
+                if self._deadlines:
+                    timeout = min(timeout, self._deadlines[0] - now)
+                # A notify means an earlier deadline arrived: recompute
+                if not self._wakeup.wait(timeout) and timeout == self._max_sleep:
+                    return
+
+    def _run(self):
+        while True:
+            self._wait()
+            try:
+                self._func()
+            except Exception:
+                logging.exception(f"Background task {self.name} failed")
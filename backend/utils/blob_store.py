@@ -0,0 +1,197 @@
+import os
+import logging
+import secrets
+import threading
+from contextlib import contextmanager
+from database.db_connection import Database
+from utils.secure_ops import SANDBOX_DIR
+from utils.dir_listing import invalidate_listing_cache
+from config import Config
+
+db = Database(Config.DATABASE_PATH)
+
+# Blobs are named by the SHA-256 of their stored bytes. Sandbox filenames
+# are hardlinks to a blob (file_blobs maps name -> blob), so identical
+# uploads share one copy on disk. Recycle bin entries keep a blob
+# referenced without any file of their own.
+BLOB_DIR = os.path.join(SANDBOX_DIR, '.blobs')
+
+# Refcount changes and the link/unlink they describe happen together under
+# _locked(): a thread lock, plus a write transaction that makes other
+# processes sharing the database wait as well
+_lock = threading.Lock()
+
+
+@contextmanager
+def _locked():
+    with _lock, db.transaction() as conn:
+        yield conn
+
+
+def blob_path(sha256):
+    """Location of the blob with the given content hash"""
+    return os.path.join(BLOB_DIR, sha256[:2], sha256)
+
+
+def _name_blob(conn, filename):
+    row = conn.execute('SELECT sha256 FROM file_blobs WHERE filename = ?', (filename,)).fetchone()
+    return row['sha256'] if row else None
+
+
+def _link_over(src, dst):
+    """Atomically make dst a hardlink to src"""
+    tmp_path = os.path.join(os.path.dirname(dst), f'.link-{secrets.token_hex(8)}')
+    os.link(src, tmp_path)
+    try:
+        os.replace(tmp_path, dst)
+    except BaseException:
+        os.remove(tmp_path)
+        raise
+
+
+def _acquire(conn, sha256, size):
+    """Add a reference to a blob (lock held)"""
+    conn.execute(
+        '''INSERT INTO blobs (sha256, size, refcount) VALUES (?, ?, 1)
+           ON CONFLICT(sha256) DO UPDATE SET refcount = refcount + 1''',
+        (sha256, size)
+    )
+
+
+def _release(conn, sha256):
+    """Drop a reference to a blob, deleting it once unreferenced (lock held)"""
+    conn.execute('UPDATE blobs SET refcount = refcount - 1 WHERE sha256 = ?', (sha256,))
+    if conn.execute('DELETE FROM blobs WHERE sha256 = ? AND refcount <= 0', (sha256,)).rowcount:
+        try:
+            os.remove(blob_path(sha256))
+        except FileNotFoundError:
+            pass
+
+
+def store_file(filename, sha256, size):
+    """
+    Move a freshly written sandbox file into the blob store.
+
+    If a blob with the same content already exists the file is replaced by
+    a hardlink to it, freeing the duplicate bytes; otherwise the file itself
+    becomes the blob. Returns True if the upload was deduplicated.
+    """
+    path = os.path.join(SANDBOX_DIR, filename)
+    target = blob_path(sha256)
+
+    with _locked() as conn:
+        previous = _name_blob(conn, filename)
+        deduplicated = os.path.exists(target)
+        try:
+            if deduplicated:
+                _link_over(target, path)
+            else:
+                os.makedirs(os.path.dirname(target), exist_ok=True)
+                os.link(path, target)
+        except OSError as e:
+            # No hardlink support: keep the file as a plain, unshared copy
+            logging.error(f"Blob store unavailable for {filename}: {e}")
+            if previous:
+                conn.execute('DELETE FROM file_blobs WHERE filename = ?', (filename,))
+                _release(conn, previous)
+            return False
+
+        _acquire(conn, sha256, size)
+        conn.execute(
+            'INSERT OR REPLACE INTO file_blobs (filename, sha256) VALUES (?, ?)',
+            (filename, sha256)
+        )
+        if previous:
+            _release(conn, previous)
+
+    invalidate_listing_cache(SANDBOX_DIR)
+    return deduplicated
+
+
+def detach_file(filename):
+    """Forget the blob behind a sandbox name that was removed or rewritten"""
+    with _locked() as conn:
+        sha256 = _name_blob(conn, filename)
+        if sha256:
+            conn.execute('DELETE FROM file_blobs WHERE filename = ?', (filename,))
+            _release(conn, sha256)
+        return sha256
+
+
+def recycle_file(filename):
+    """
+    Remove a sandbox name but keep its blob referenced for the recycle bin.
+
+    Returns the blob hash, or None if the file is not backed by a blob (the
+    caller then moves the file itself).
+    """
+    path = os.path.join(SANDBOX_DIR, filename)
+    with _locked() as conn:
+        sha256 = _name_blob(conn, filename)
+        if sha256 is None:
+            return None
+
+        try:
+            linked = os.path.samefile(path, blob_path(sha256))
+        except FileNotFoundError:
+            linked = False
+        if not linked:
+            # The name no longer points at its blob; drop the stale mapping
+            conn.execute('DELETE FROM file_blobs WHERE filename = ?', (filename,))
+            _release(conn, sha256)
+            return None
+
+        os.remove(path)
+        conn.execute('DELETE FROM file_blobs WHERE filename = ?', (filename,))
+
+    invalidate_listing_cache(SANDBOX_DIR)
+    return sha256
+
+
+def restore_file(sha256, filename):
+    """Link a recycled blob back into the sandbox; its reference moves with it"""
+    with _locked() as conn:
+        os.link(blob_path(sha256), os.path.join(SANDBOX_DIR, filename))
+        conn.execute(
+            'INSERT OR REPLACE INTO file_blobs (filename, sha256) VALUES (?, ?)',
+            (filename, sha256)
+        )
+    invalidate_listing_cache(SANDBOX_DIR)
+
+
+def release_blob(sha256):
+    """Drop a recycle bin reference to a blob"""
+    with _locked() as conn:
+        _release(conn, sha256)
+
+
+def collect_garbage():
+    """Delete blobs nothing references, including files left by a crash"""
+    removed = 0
+    with _locked() as conn:
+        for row in conn.execute('SELECT sha256 FROM blobs WHERE refcount <= 0').fetchall():
+            conn.execute('DELETE FROM blobs WHERE sha256 = ?', (row['sha256'],))
+            if os.path.exists(blob_path(row['sha256'])):
+                os.remove(blob_path(row['sha256']))
+                removed += 1
+
+    if not os.path.isdir(BLOB_DIR):
+        return removed
+
+    # Scan without the lock; candidates are checked against blobs under it,
+    # so a blob stored in the meantime is kept
+    found = []
+    for bucket in os.scandir(BLOB_DIR):
+        if bucket.is_dir():
+            found.extend((entry.name, entry.path) for entry in os.scandir(bucket.path))
+    if found:
+        with _locked() as conn:
+            known = {row['sha256'] for row in conn.execute('SELECT sha256 FROM blobs')}
+            for sha256, path in found:
+                if sha256 not in known:
+                    try:
+                        os.remove(path)
+                        removed += 1
+                    except FileNotFoundError:
+                        pass
+    return removed
@@ -0,0 +1,137 @@
+import os
+import gzip
+import lzma
+import zlib
+from database.db_connection import Database
+from config import Config
+
+db = Database(Config.DATABASE_PATH)
+
+# Sandbox files may be stored gzip- or xz-compressed. The files table
+# records which (files.compression); the content is never sniffed, so a
+# user's own .gz upload is served exactly as uploaded.
+ALGORITHMS = ('gzip', 'xz')
+
+# Amount of leading data used to decide whether compression pays off
+SAMPLE_SIZE = 64 * 1024
+
+
+def choose_compression(sample):
+    """
+    Pick an algorithm for a file from a sample of its beginning, or None.
+
+    Data that does not shrink below COMPRESSION_MIN_RATIO with zlib (media,
+    archives, ciphertext) is stored as is. xz is chosen only when it beats
+    zlib clearly, since it is several times slower to write.
+    """
+    if len(sample) < Config.COMPRESSION_MIN_SIZE:
+        return None
+
+    zlib_size = len(zlib.compress(sample, 6))
+    if zlib_size > len(sample) * Config.COMPRESSION_MIN_RATIO:
+        return None
+
+    xz_size = len(lzma.compress(sample, preset=6))
+    return 'xz' if xz_size < zlib_size * 0.85 else 'gzip'
+
+
+class CompressingReader:
+    """File-like reader yielding the compressed form of another stream"""
+
+    def __init__(self, stream, algorithm, head=b''):
+        self._stream = stream
+        self._head = head
+        if algorithm == 'gzip':
+            self._compressor = zlib.compressobj(6, zlib.DEFLATED, 31)  # gzip container
+        else:
+            self._compressor = lzma.LZMACompressor(format=lzma.FORMAT_XZ, preset=6)
+        self._buffer = b''
+        self._done = False
+        self.logical_size = 0
+
+    def _fill(self, size):
+        while len(self._buffer) < size and not self._done:
+            if self._head:
+                data, self._head = self._head, b''
+            else:
+                data = self._stream.read(Config.UPLOAD_CHUNK_SIZE)
+            if data:
+                self.logical_size += len(data)
+                self._buffer += self._compressor.compress(data)
+            else:
+                self._buffer += self._compressor.flush()
+                self._done = True
+
+    def read(self, size=-1):
+        if size is None or size < 0:
+            self._fill(float('inf'))
+            size = len(self._buffer)
+        else:
+            self._fill(size)
+        data, self._buffer = self._buffer[:size], self._buffer[size:]
+        return data
+
+
+class _PrefixedReader:
+    """Replays bytes already read from a stream before the rest of it"""
+
+    def __init__(self, head, stream):
+        self._head = head
+        self._stream = stream
+
+    def read(self, size=-1):
+        if self._head:
+            if size is None or size < 0:
+                data, self._head = self._head + self._stream.read(), b''
+            else:
+                data, self._head = self._head[:size], self._head[size:]
+            return data
+        return self._stream.read(size)
+
+
+def compress_upload_stream(stream):
+    """
+    Sample the start of an upload and wrap it for compression if worthwhile.
+
+    Returns (reader, compression); for a compressed stream the reader's
+    logical_size holds the uncompressed byte count once it is exhausted.
+    """
+    head = stream.read(SAMPLE_SIZE)
+    compression = choose_compression(head)
+    if compression:
+        return CompressingReader(stream, compression, head), compression
+    return _PrefixedReader(head, stream), None
+
+
+def open_stored(path, compression):
+    """Open a sandbox file for reading its logical (uncompressed) content"""
+    if compression == 'gzip':
+        return gzip.open(path, 'rb')
+    if compression == 'xz':
+        return lzma.open(path, 'rb')
+    return open(path, 'rb')
+
+
+def stored_compression(filename, file_path):
+    """
+    Return (compression, logical size) for a sandbox file.
+
+    The files row only counts while the file still has the size and mtime
+    recorded with it; anything that rewrote the file since stored it plain.
+    """
+    stats = os.stat(file_path)
+    rows = db.execute_query(
+        'SELECT compression, file_size, stored_size, mtime_ns FROM files WHERE filename = ?',
+        (filename,)
+    )
+    if (rows and rows[0]['compression'] in ALGORITHMS
+            and rows[0]['stored_size'] == stats.st_size
+            and rows[0]['mtime_ns'] == stats.st_mtime_ns):
+        return rows[0]['compression'], rows[0]['file_size']
+    return None, stats.st_size
+
+
+def open_logical(filename, file_path):
+    """Open a sandbox file's logical content; returns (file object, logical size)"""
+    compression, size = stored_compression(filename, file_path)
+    return open_stored(file_path, compression), size
@@ -0,0 +1,159 @@
+import os
+import json
+import time
+import base64
+import threading
+from bisect import bisect_left, bisect_right
+from utils.fs_watcher import watcher
+
+SORT_FIELDS = ('name', 'size', 'modified')
+
+# Changes made within this many seconds of a directory's mtime may not move
+# the mtime (coarse filesystem timestamps), so such listings are not reused.
+RACY_WINDOW = 1.0
+
+# path -> {'mtime_ns': ..., 'entries': [...], 'sorted': {field: (keys, entries)}}
+_cache = {}
+_cache_lock = threading.Lock()
+# Bumped on every invalidation, so a scan that raced one is not cached
+_generation = 0
+
+
+def invalidate_listing_cache(path=None):
+    """Drop cached listings (all of them, or just the one for path)"""
+    global _generation
+    with _cache_lock:
+        _generation += 1
+        if path is None:
+            _cache.clear()
+        else:
+            _cache.pop(os.path.realpath(path), None)
+
+
+@watcher.subscribe
+def _on_file_event(event):
+    """A file's size or mtime can change without touching its directory's mtime"""
+    if event.kind == 'rescan':
+        invalidate_listing_cache(event.path)
+        return
+    for path in (event.path, event.dest_path):
+        # Hidden names are not listed
+        if path and not os.path.basename(path).startswith('.'):
+            invalidate_listing_cache(os.path.dirname(path))
+
+
+def _scan(path):
+    """Scan a directory once, reusing the stat data os.scandir already has"""
+    entries = []
+    with os.scandir(path) as it:
+        for entry in it:
+            # Hidden names are in-progress uploads and internal stores
+            if entry.name.startswith('.'):
+                continue
+            try:
+                if not entry.is_file(follow_symlinks=False):
+                    continue
+                stats = entry.stat(follow_symlinks=False)
+            except FileNotFoundError:
+                continue
+            entries.append({
+                'name': entry.name,
+                'size': stats.st_size,
+                'modified': stats.st_mtime
+            })
+    return entries
+
+
+def _get_cached(path):
+    real_path = os.path.realpath(path)
+    scan_started = time.time()
+    mtime_ns = os.stat(real_path).st_mtime_ns
+
+    with _cache_lock:
+        cached = _cache.get(real_path)
+        if cached and cached['mtime_ns'] == mtime_ns:
+            return cached
+        generation = _generation
+
+    cached = {'mtime_ns': mtime_ns, 'entries': _scan(real_path), 'sorted': {}}
+
+    if scan_started - mtime_ns / 1e9 > RACY_WINDOW:
+        with _cache_lock:
+            if generation == _generation:
+                _cache[real_path] = cached
+    return cached
+
+
+def _sorted_view(cached, sort):
+    """Entries ordered by (sort field, name), built once per cached listing"""
+    view = cached['sorted'].get(sort)
+    if view is None:
+        entries = sorted(cached['entries'], key=lambda e: (e[sort], e['name']))
+        keys = [(e[sort], e['name']) for e in entries]
+        view = (keys, entries)
+        cached['sorted'][sort] = view
+    return view
+
+
+def encode_cursor(sort, entry):
+    """Opaque cursor pointing just past entry in the given sort order"""
+    raw = json.dumps([sort, entry[sort], entry['name']]).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_cursor(cursor, sort):
+    """Decode a cursor produced by encode_cursor for the same sort field"""
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        cursor_sort, value, name = json.loads(base64.urlsafe_b64decode(padded.encode()))
+    except (ValueError, TypeError):
+        raise ValueError('Invalid cursor')
+    if cursor_sort != sort:
+        raise ValueError('Cursor does not match sort order')
+    expected = str if sort == 'name' else (int, float)
+    if not isinstance(value, expected) or isinstance(value, bool) or not isinstance(name, str):
+        raise ValueError('Invalid cursor')
+    return (value, name)
+
+
+def list_directory_page(path, sort='name', order='asc', prefix='', cursor=None, limit=100):
+    """
+    List regular files in path one page at a time.
+
+    Returns (entries, next_cursor, total) where total counts every entry
+    matching prefix. Pagination is keyset-based, so pages stay consistent
+    while files are added or removed between requests.
+    """
+    if sort not in SORT_FIELDS:
+        raise ValueError(f'Invalid sort field: {sort}')
+    if order not in ('asc', 'desc'):
+        raise ValueError(f'Invalid sort order: {order}')
+
+    keys, entries = _sorted_view(_get_cached(path), sort)
+
+    if prefix:
+        if sort == 'name':
+            # Name order keeps a prefix contiguous
+            lo = bisect_left(keys, (prefix, ''))
+            hi = lo
+            while hi < len(keys) and keys[hi][1].startswith(prefix):
+                hi += 1
+            keys, entries = keys[lo:hi], entries[lo:hi]
+        else:
+            matching = [i for i, e in enumerate(entries) if e['name'].startswith(prefix)]
+            keys = [keys[i] for i in matching]
+            entries = [entries[i] for i in matching]
+
+    total = len(entries)
+
+    if order == 'asc':
+        start = bisect_right(keys, decode_cursor(cursor, sort)) if cursor else 0
+        page = entries[start:start + limit]
+        has_more = start + limit < total
+    else:
+        end = bisect_left(keys, decode_cursor(cursor, sort)) if cursor else total
+        page = entries[max(0, end - limit):end][::-1]
+        has_more = end - limit > 0
+
+    next_cursor = encode_cursor(sort, page[-1]) if page and has_more else None
+    return [dict(e) for e in page], next_cursor, total
@@ -0,0 +1,241 @@
+import os
+import zlib
+import struct
+import hashlib
+from database.db_connection import Database
+from utils.compression import open_logical
+from utils.secure_ops import SANDBOX_DIR
+from config import Config
+
+db = Database(Config.DATABASE_PATH)
+
+# Versions of a file in the recycle bin are kept under its recycle name with
+# this prefix, which no sandbox filename can have, so a new file of the same
+# name starts with no history
+RECYCLED_PREFIX = 'recycle_bin/'
+
+# Delta payload: length of the unchanged prefix and suffix, then the new
+# middle. Editor saves usually touch one region, so this stays small.
+_DELTA_HEADER = struct.Struct('>QQ')
+
+
+def _common_prefix(a, b, limit):
+    """Length of the common prefix of a and b, up to limit (binary search on slices)"""
+    lo, hi = 0, limit
+    while lo < hi:
+        mid = (lo + hi + 1) // 2
+        if a[:mid] == b[:mid]:
+            lo = mid
+        else:
+            hi = mid - 1
+    return lo
+
+
+def _common_suffix(a, b, limit):
+    lo, hi = 0, limit
+    while lo < hi:
+        mid = (lo + hi + 1) // 2
+        if a[len(a) - mid:] == b[len(b) - mid:]:
+            lo = mid
+        else:
+            hi = mid - 1
+    return lo
+
+
+def _make_delta(base, content):
+    limit = min(len(base), len(content))
+    prefix = _common_prefix(base, content, limit)
+    suffix = _common_suffix(base, content, limit - prefix)
+    return _DELTA_HEADER.pack(prefix, suffix) + content[prefix:len(content) - suffix]
+
+
+def _apply_delta(base, delta):
+    prefix, suffix = _DELTA_HEADER.unpack_from(delta)
+    return base[:prefix] + delta[_DELTA_HEADER.size:] + base[len(base) - suffix:]
+
+
+def _latest(filename):
+    rows = db.execute_query(
+        'SELECT version, sha256, kind FROM file_versions WHERE filename = ? ORDER BY version DESC LIMIT 1',
+        (filename,)
+    )
+    return rows[0] if rows else None
+
+
+def list_versions(filename):
+    """Versions of a file, newest first"""
+    rows = db.execute_query(
+        '''SELECT version, kind, size, sha256, LENGTH(data) AS stored_size, created_by, created_at
+           FROM file_versions WHERE filename = ? ORDER BY version DESC''',
+        (filename,)
+    )
+    return [dict(row) for row in rows]
+
+
+def get_version_content(filename, version):
+    """Rebuild a version from the nearest full snapshot at or before it, or None"""
+    rows = db.execute_query(
+        '''SELECT version, kind, data FROM file_versions
+           WHERE filename = ? AND version <= ? AND version >= (
+               SELECT MAX(version) FROM file_versions
+               WHERE filename = ? AND version <= ? AND kind = 'full')
+           ORDER BY version''',
+        (filename, version, filename, version)
+    )
+    if not rows or rows[-1]['version'] != version:
+        return None
+
+    content = b''
+    for row in rows:
+        data = zlib.decompress(row['data'])
+        content = data if row['kind'] == 'full' else _apply_delta(content, data)
+    return content
+
+
+def record_version(filename, file_path, user_id):
+    """
+    Store the file's current content as a new version if it differs from
+    the latest one. Called before a save (capturing the original, or any
+    change made outside the editor) and after it.
+
+    Every VERSION_SNAPSHOT_INTERVAL versions a full copy is stored; the
+    rest are compressed deltas against the previous version. Files larger
+    than VERSION_MAX_FILE_SIZE are not versioned.
+    """
+    f, size = open_logical(filename, file_path)
+    with f:
+        if size > Config.VERSION_MAX_FILE_SIZE:
+            return None
+        content = f.read()
+    sha256 = hashlib.sha256(content).hexdigest()
+
+    latest = _latest(filename)
+    if latest and latest['sha256'] == sha256:
+        return latest['version']
+
+    version = latest['version'] + 1 if latest else 1
+    snapshot = latest is None or version % Config.VERSION_SNAPSHOT_INTERVAL == 1
+    if snapshot:
+        kind, payload = 'full', content
+    else:
+        base = get_version_content(filename, latest['version'])
+        kind, payload = 'delta', _make_delta(base, content)
+
+    db.execute_insert(
+        '''INSERT INTO file_versions (filename, version, kind, size, sha256, data, created_by)
+           VALUES (?, ?, ?, ?, ?, ?, ?)''',
+        (filename, version, kind, len(content), sha256, zlib.compress(payload), user_id)
+    )
+    apply_retention(filename)
+    return version
+
+
+def _drop_oldest(filename):
+    """Delete a file's oldest version, turning the next one into a snapshot"""
+    rows = db.execute_query(
+        'SELECT version, kind FROM file_versions WHERE filename = ? ORDER BY version LIMIT 2',
+        (filename,)
+    )
+    if len(rows) < 2:
+        return False
+
+    oldest, following = rows
+    if following['kind'] == 'delta':
+        content = get_version_content(filename, following['version'])
+        db.execute_update(
+            "UPDATE file_versions SET kind = 'full', data = ? WHERE filename = ? AND version = ?",
+            (zlib.compress(content), filename, following['version'])
+        )
+    db.execute_update(
+        'DELETE FROM file_versions WHERE filename = ? AND version = ?',
+        (filename, oldest['version'])
+    )
+    return True
+
+
+def _stored_bytes():
+    rows = db.execute_query('SELECT bytes_stored FROM version_storage WHERE id = 1')
+    return rows[0]['bytes_stored'] if rows else 0
+
+
+def apply_retention(filename):
+    """Cap versions per file, then total stored bytes across all files"""
+    count = db.execute_query('SELECT COUNT(*) AS n FROM file_versions WHERE filename = ?', (filename,))[0]['n']
+    while count > Config.VERSION_MAX_PER_FILE and _drop_oldest(filename):
+        count -= 1
+
+    # The newest version of each file is always kept
+    while _stored_bytes() > Config.VERSION_MAX_TOTAL_BYTES:
+        oldest = db.execute_query(
+            '''SELECT filename FROM file_versions
+               WHERE filename IN (SELECT filename FROM file_versions GROUP BY filename HAVING COUNT(*) > 1)
+               ORDER BY id LIMIT 1'''
+        )
+        if not oldest or not _drop_oldest(oldest[0]['filename']):
+            break
+
+
+def _move_versions(renames, conn=None):
+    """Re-key versions for (filename, new_filename) pairs in one transaction, replacing any under new_filename"""
+    if conn is None:
+        with db.get_connection() as conn:
+            _move_versions(renames, conn)
+            conn.commit()
+        return
+    for filename, new_filename in renames:
+        conn.execute('DELETE FROM file_versions WHERE filename = ?', (new_filename,))
+        conn.execute('UPDATE file_versions SET filename = ? WHERE filename = ?', (new_filename, filename))
+
+
+def recycle_versions(recycled, conn=None):
+    """Move versions of files moved to the recycle bin, given (filename, recycle_name) pairs
+
+    With conn the moves join the caller's transaction.
+    """
+    _move_versions([(filename, RECYCLED_PREFIX + recycle_name) for filename, recycle_name in recycled], conn)
+
+
+def restore_versions(recycle_name, filename):
+    """Give a file restored from the recycle bin back its versions"""
+    _move_versions([(RECYCLED_PREFIX + recycle_name, filename)])
+
+
+def purge_versions(recycle_name):
+    """Delete the versions of a recycle bin entry that is being purged"""
+    db.execute_update('DELETE FROM file_versions WHERE filename = ?', (RECYCLED_PREFIX + recycle_name,))
+
+
+def recount_version_storage():
+    """Rebuild version_storage from file_versions in one transaction"""
+    with db.get_connection() as conn:
+        conn.execute(
+            '''INSERT OR REPLACE INTO version_storage (id, bytes_stored)
+               SELECT 1, COALESCE(SUM(LENGTH(data)), 0) FROM file_versions'''
+        )
+        conn.commit()
+
+
+def delete_orphaned_versions():
+    """
+    Delete versions of files that no longer exist. Before versions moved
+    with their file to the recycle bin they stayed under the filename
+    after a delete, where a new file of that name would inherit them.
+    """
+    rows = db.execute_query(
+        'SELECT DISTINCT filename FROM file_versions WHERE filename NOT LIKE ?', (RECYCLED_PREFIX + '%',)
+    )
+    orphaned = [(row['filename'],) for row in rows
+                if not os.path.exists(os.path.join(SANDBOX_DIR, row['filename']))]
+    if orphaned:
+        db.execute_many('DELETE FROM file_versions WHERE filename = ?', orphaned)
+    return len(orphaned)
+
+
+# Databases that had versions before the storage triggers start from a recount
+if not db.migration_applied('version_storage_bytes'):
+    recount_version_storage()
+    db.mark_migration('version_storage_bytes')
+
+if not db.migration_applied('file_versions_orphans'):
+    delete_orphaned_versions()
+    db.mark_migration('file_versions_orphans')
@@ -0,0 +1,258 @@
+import os
+import stat
+import time
+import threading
+import logging
+from database.db_connection import Database
+from utils.secure_ops import SANDBOX_DIR
+from utils.permissions_store import get_permissions_map
+from utils.integrity import report_failure
+from utils.background import DeadlineTask
+from utils.fs_watcher import watcher
+from config import Config
+
+db = Database(Config.DATABASE_PATH)
+
+# The files table has one row per sandbox file: owner, logical and stored
+# size, and the mtime/sha256 seen when it was last written. sha256 is of
+# the stored bytes and is what utils/integrity.py verifies against. Every write
+# path updates it through record_file()/remove_file(); reconcile() repairs
+# drift from changes made on disk directly.
+
+_COLUMNS = '''user_id, filename, original_filename, file_size, content_type, is_encrypted, sha256,
+              mtime_ns, compression, stored_size'''
+
+
+def get_record(filename):
+    rows = db.execute_query(f'SELECT {_COLUMNS} FROM files WHERE filename = ?', (filename,))
+    return dict(rows[0]) if rows else None
+
+
+def record_file(filename, user_id, sha256=None, file_size=None, compression=None, is_encrypted=False,
+                original_filename=None, take_ownership=False):
+    """
+    Index a sandbox file after it was written.
+
+    Sizes and mtime come from the file itself; file_size is only needed
+    when it differs from the stored size (compressed files). An existing
+    owner is kept unless take_ownership is set, so editing someone's file
+    does not make it yours.
+    """
+    stats = os.stat(os.path.join(SANDBOX_DIR, filename))
+    db.execute_insert(
+        '''INSERT INTO files (user_id, filename, original_filename, file_size, is_encrypted, sha256, mtime_ns,
+                              compression, stored_size, verified_at)
+           VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+           ON CONFLICT(filename) DO UPDATE SET
+               user_id = CASE WHEN ? OR files.user_id IS NULL THEN excluded.user_id ELSE files.user_id END,
+               original_filename = COALESCE(excluded.original_filename, files.original_filename),
+               file_size = excluded.file_size,
+               is_encrypted = excluded.is_encrypted,
+               sha256 = excluded.sha256,
+               mtime_ns = excluded.mtime_ns,
+               compression = excluded.compression,
+               stored_size = excluded.stored_size,
+               verified_at = excluded.verified_at,
+               updated_at = CURRENT_TIMESTAMP''',
+        (user_id, filename, original_filename, stats.st_size if file_size is None else file_size,
+         1 if is_encrypted else 0, sha256, stats.st_mtime_ns, compression, stats.st_size,
+         time.time() if sha256 else None, 1 if take_ownership else 0)
+    )
+
+
+def remove_file(filename):
+    """Drop a file's row; returns it so a recycle bin entry can bring it back"""
+    record = get_record(filename)
+    if record:
+        db.execute_update('DELETE FROM files WHERE filename = ?', (filename,))
+    return record
+
+
+def remove_files(filenames, conn):
+    """Drop many files' rows in the caller's transaction; returns filename -> row for those that had one"""
+    records = {}
+    for filename in filenames:
+        row = conn.execute(f'SELECT {_COLUMNS} FROM files WHERE filename = ?', (filename,)).fetchone()
+        if row:
+            records[filename] = dict(row)
+            conn.execute('DELETE FROM files WHERE filename = ?', (filename,))
+    return records
+
+
+def restore_record(filename, record, owner_id=None):
+    """
+    Index a file restored from the recycle bin.
+
+    The saved row is reused while the file still has the size and mtime it
+    was recorded with (so its hash and compression stay known); otherwise
+    the file is indexed afresh.
+    """
+    stats = os.stat(os.path.join(SANDBOX_DIR, filename))
+    if record and record.get('stored_size') == stats.st_size and record.get('mtime_ns') == stats.st_mtime_ns:
+        record_file(
+            filename, record.get('user_id') or owner_id, sha256=record.get('sha256'),
+            file_size=record.get('file_size'), compression=record.get('compression'),
+            is_encrypted=record.get('is_encrypted'), original_filename=record.get('original_filename'),
+            take_ownership=True
+        )
+    else:
+        record_file(filename, (record or {}).get('user_id') or owner_id, take_ownership=True)
+
+
+def _scan_sandbox(names=None):
+    """filename -> (size, mtime_ns) of the regular files in the sandbox (or of those of names that exist)"""
+    found = {}
+    if names is not None:
+        for name in names:
+            try:
+                stats = os.stat(os.path.join(SANDBOX_DIR, name), follow_symlinks=False)
+            except FileNotFoundError:
+                continue
+            if stat.S_ISREG(stats.st_mode):
+                found[name] = (stats.st_size, stats.st_mtime_ns)
+        return found
+
+    with os.scandir(SANDBOX_DIR) as it:
+        for entry in it:
+            # Hidden names are in-progress writes and internal stores
+            if entry.name.startswith('.'):
+                continue
+            try:
+                if entry.is_file(follow_symlinks=False):
+                    stats = entry.stat(follow_symlinks=False)
+                    found[entry.name] = (stats.st_size, stats.st_mtime_ns)
+            except FileNotFoundError:
+                continue
+    return found
+
+
+def _indexed_rows(names=None):
+    if names is None:
+        return db.execute_query('SELECT filename, stored_size, mtime_ns, sha256 FROM files')
+    rows = []
+    for start in range(0, len(names), 500):
+        batch = names[start:start + 500]
+        placeholders = ','.join('?' * len(batch))
+        rows += db.execute_query(
+            f'SELECT filename, stored_size, mtime_ns, sha256 FROM files WHERE filename IN ({placeholders})',
+            tuple(batch)
+        )
+    return rows
+
+
+def reconcile(names=None):
+    """
+    Bring the files table in line with the sandbox directory (or just the
+    given filenames).
+
+    Only rows whose stored size or mtime differ from the disk are touched,
+    FILES_RECONCILE_BATCH per transaction. Each fix is conditional on the row
+    still holding the values that were compared, so a write path updating
+    the same file meanwhile wins, and files written in the last
+    FILES_RECONCILE_SETTLE seconds are left to the write path indexing them.
+    Files with no row get the owner from their permissions entry, if any.
+    Returns (added, updated, removed).
+    """
+    if not os.path.isdir(SANDBOX_DIR):
+        return 0, 0, 0
+
+    on_disk = _scan_sandbox(names)
+    indexed = {}
+    hashes = {}
+    for row in _indexed_rows(names):
+        indexed[row['filename']] = (row['stored_size'], row['mtime_ns'])
+        hashes[row['filename']] = row['sha256']
+
+    settled_ns = (time.time() - Config.FILES_RECONCILE_SETTLE) * 1e9
+    missing = [name for name in on_disk if name not in indexed and on_disk[name][1] <= settled_ns]
+    changed = [name for name in on_disk
+               if name in indexed and indexed[name] != on_disk[name] and on_disk[name][1] <= settled_ns]
+    gone = [name for name in indexed if name not in on_disk]
+
+    owners = get_permissions_map(missing) if missing else {}
+    added = updated = removed = 0
+    batch = Config.FILES_RECONCILE_BATCH
+
+    for start in range(0, len(missing), batch):
+        names = missing[start:start + batch]
+        added += db.execute_many(
+            '''INSERT OR IGNORE INTO files (user_id, filename, original_filename, file_size, mtime_ns, stored_size)
+               VALUES (?, ?, ?, ?, ?, ?)''',
+            [(owners[name].get('owner'), name, name, on_disk[name][0], on_disk[name][1], on_disk[name][0])
+             for name in names]
+        )
+
+    # Changed outside the app: the recorded hash and compression no longer
+    # apply. Files that had a hash are reported as modified.
+    modified = []
+    for start in range(0, len(changed), batch):
+        with db.get_connection() as conn:
+            for name in changed[start:start + batch]:
+                cursor = conn.execute(
+                    '''UPDATE files SET file_size = ?, stored_size = ?, mtime_ns = ?, sha256 = NULL,
+                                        compression = NULL, verified_at = NULL, updated_at = CURRENT_TIMESTAMP
+                       WHERE filename = ? AND stored_size IS ? AND mtime_ns IS ?''',
+                    (on_disk[name][0], on_disk[name][0], on_disk[name][1], name, indexed[name][0], indexed[name][1])
+                )
+                if cursor.rowcount:
+                    updated += 1
+                    if hashes[name]:
+                        modified.append(name)
+            conn.commit()
+
+    for name in modified:
+        report_failure(name, 'modified', expected_sha256=hashes[name], expected_size=indexed[name][0],
+                       actual_size=on_disk[name][0])
+
+    for start in range(0, len(gone), batch):
+        # Re-check: the file may have been written since the scan
+        names = [name for name in gone[start:start + batch]
+                 if not os.path.exists(os.path.join(SANDBOX_DIR, name))]
+        if names:
+            removed += db.execute_many(
+                'DELETE FROM files WHERE filename = ? AND stored_size IS ? AND mtime_ns IS ?',
+                [(name, indexed[name][0], indexed[name][1]) for name in names]
+            )
+
+    if added or updated or removed:
+        logging.info(f"Files index reconciled: {added} added, {updated} updated, {removed} removed")
+    return added, updated, removed
+
+
+# Changes seen by the sandbox watcher are reconciled per file once they have
+# settled, so the index catches up within seconds instead of at the next
+# full pass
+_pending = set()
+_pending_rescan = False
+_pending_lock = threading.Lock()
+
+
+def _reconcile_pending():
+    global _pending_rescan
+    with _pending_lock:
+        names, rescan = sorted(_pending), _pending_rescan
+        _pending.clear()
+        _pending_rescan = False
+    if rescan:
+        reconcile()
+    elif names:
+        reconcile(names)
+
+
+pending_reconciler = DeadlineTask('files-index-events', _reconcile_pending, Config.FILES_RECONCILE_INTERVAL)
+
+
+@watcher.subscribe
+def _on_file_event(event):
+    global _pending_rescan
+    sandbox = os.path.realpath(SANDBOX_DIR)
+    with _pending_lock:
+        if event.kind == 'rescan':
+            _pending_rescan = _pending_rescan or event.path == sandbox
+        for path in (event.path, event.dest_path):
+            if (event.kind != 'rescan' and path and os.path.dirname(path) == sandbox
+                    and not os.path.basename(path).startswith('.')):
+                _pending.add(os.path.basename(path))
+        if not _pending and not _pending_rescan:
+            return
+    pending_reconciler.schedule(time.time() + Config.FILES_RECONCILE_SETTLE + 0.1)
@@ -0,0 +1,287 @@
+import os
+import sys
+import errno
+import select
+import struct
+import ctypes
+import ctypes.util
+import logging
+import threading
+from collections import namedtuple
+from utils.background import is_worker_process
+from config import Config
+
+# Change notifications for the sandbox and recycle bin directories, so
+# in-process caches can drop exactly what changed instead of re-statting.
+# On Linux the kernel's inotify API is used through ctypes; elsewhere (or
+# if inotify is unavailable) the directories are rescanned every
+# poll_interval seconds and diffed.
+#
+# Subscribers are called on the watcher thread with one FileEvent at a
+# time. kind is 'created', 'modified', 'deleted' or 'moved' (dest_path set),
+# or 'rescan' when events were lost and everything under path (a watched
+# directory) must be treated as changed. Only regular files are reported,
+# hidden temp files included.
+FileEvent = namedtuple('FileEvent', ['kind', 'path', 'dest_path'])
+
+# <sys/inotify.h>
+IN_MODIFY = 0x00000002
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+IN_ISDIR = 0x40000000
+IN_NONBLOCK = os.O_NONBLOCK
+IN_CLOEXEC = getattr(os, 'O_CLOEXEC', 0o2000000)
+
+_WATCH_MASK = (IN_MODIFY | IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE
+               | IN_DELETE_SELF | IN_MOVE_SELF | IN_ONLYDIR)
+
+# struct inotify_event { int wd; uint32_t mask, cookie, len; char name[]; }
+_EVENT_HEADER = struct.Struct('iIII')
+_READ_SIZE = 64 * 1024
+
+
+def _load_libc():
+    """libc with the inotify calls, or None if this platform has none"""
+    if not sys.platform.startswith('linux'):
+        return None
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+        libc.inotify_init1.argtypes = [ctypes.c_int]
+        libc.inotify_add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+        return libc
+    except (OSError, AttributeError):
+        return None
+
+
+def _coalesce(events):
+    """Drop repeats of the previous event (a large write yields many modifies)"""
+    result = []
+    for event in events:
+        if not result or result[-1] != event:
+            result.append(event)
+    return result
+
+
+def _snapshot(path):
+    """name -> (inode, size, mtime_ns) of the regular files in a directory"""
+    found = {}
+    try:
+        with os.scandir(path) as it:
+            for entry in it:
+                try:
+                    if entry.is_file(follow_symlinks=False):
+                        stats = entry.stat(follow_symlinks=False)
+                        found[entry.name] = (stats.st_ino, stats.st_size, stats.st_mtime_ns)
+                except FileNotFoundError:
+                    continue
+    except FileNotFoundError:
+        pass
+    return found
+
+
+class DirectoryWatcher:
+    """Publish file changes in a set of directories to in-process subscribers"""
+
+    def __init__(self, name, poll_interval, backend='auto'):
+        self.name = name
+        self.backend = None  # 'inotify' or 'polling' once started
+        self._requested_backend = backend
+        self._poll_interval = poll_interval
+        self._paths = []
+        self._subscribers = []
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def watch(self, path):
+        """Add a directory; takes effect when the watcher starts"""
+        real_path = os.path.realpath(path)
+        with self._lock:
+            if real_path not in self._paths:
+                self._paths.append(real_path)
+
+    def subscribe(self, callback):
+        with self._lock:
+            self._subscribers.append(callback)
+        return callback
+
+    def unsubscribe(self, callback):
+        with self._lock:
+            if callback in self._subscribers:
+                self._subscribers.remove(callback)
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def publish(self, events):
+        with self._lock:
+            subscribers = list(self._subscribers)
+        for event in events:
+            for callback in subscribers:
+                try:
+                    callback(event)
+                except Exception:
+                    logging.exception(f"{self.name} subscriber failed on {event}")
+
+    def start(self):
+        """Start watching; a no-op when already running and in worker processes"""
+        with self._lock:
+            if self._thread is not None or is_worker_process():
+                return False
+            libc = _load_libc() if self._requested_backend in ('auto', 'inotify') else None
+            fd = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC) if libc else -1
+            if fd >= 0:
+                self.backend = 'inotify'
+                target, args = self._run_inotify, (libc, fd)
+            else:
+                if libc:
+                    logging.warning(f"inotify unavailable ({os.strerror(ctypes.get_errno())}), polling instead")
+                self.backend = 'polling'
+                target, args = self._run_polling, ()
+            self._stop.clear()
+            self._thread = threading.Thread(target=target, args=args, name=self.name, daemon=True)
+            self._thread.start()
+            return True
+
+    def stop(self, timeout=5):
+        self._stop.set()
+        thread = self._thread
+        if thread is not None:
+            thread.join(timeout)
+        self._thread = None
+
+    # inotify backend
+
+    def _add_watches(self, libc, fd, watches):
+        """Watch directories not watched yet (e.g. created since); returns those added"""
+        added = []
+        watched = set(watches.values())
+        for path in list(self._paths):
+            if path in watched or not os.path.isdir(path):
+                continue
+            wd = libc.inotify_add_watch(fd, os.fsencode(path), _WATCH_MASK)
+            if wd < 0:
+                err = ctypes.get_errno()
+                if err != errno.ENOENT:
+                    logging.warning(f"Cannot watch {path}: {os.strerror(err)}")
+                continue
+            watches[wd] = path
+            added.append(path)
+        return added
+
+    def _run_inotify(self, libc, fd):
+        watches = {}
+        try:
+            self._add_watches(libc, fd, watches)
+            poller = select.poll()
+            poller.register(fd, select.POLLIN)
+            while not self._stop.is_set():
+                if len(watches) < len(self._paths):
+                    # A directory that was missing (or removed) may exist now
+                    self.publish(FileEvent('rescan', path, None) for path in self._add_watches(libc, fd, watches))
+                if not poller.poll(1000):
+                    continue
+                try:
+                    data = os.read(fd, _READ_SIZE)
+                except BlockingIOError:
+                    continue
+                self.publish(self._parse(data, watches))
+        except Exception:
+            logging.exception(f"{self.name} stopped")
+        finally:
+            os.close(fd)
+
+    def _parse(self, data, watches):
+        events = []
+        moved_from = {}  # cookie -> path, paired with the IN_MOVED_TO that follows
+        offset = 0
+        while offset + _EVENT_HEADER.size <= len(data):
+            wd, mask, cookie, length = _EVENT_HEADER.unpack_from(data, offset)
+            name = data[offset + _EVENT_HEADER.size:offset + _EVENT_HEADER.size + length].rstrip(b'\0')
+            offset += _EVENT_HEADER.size + length
+
+            if mask & IN_Q_OVERFLOW:
+                events.extend(FileEvent('rescan', path, None) for path in watches.values())
+                continue
+            directory = watches.get(wd)
+            if directory is None:
+                continue
+            if mask & IN_IGNORED:
+                # The directory itself went away; re-added when it comes back
+                del watches[wd]
+                events.append(FileEvent('rescan', directory, None))
+                continue
+            if mask & IN_ISDIR or not name:
+                continue
+
+            path = os.path.join(directory, os.fsdecode(name))
+            if mask & IN_MOVED_FROM:
+                moved_from[cookie] = path
+            elif mask & IN_MOVED_TO:
+                source = moved_from.pop(cookie, None)
+                events.append(FileEvent('moved', source, path) if source else FileEvent('created', path, None))
+            elif mask & IN_CREATE:
+                events.append(FileEvent('created', path, None))
+            elif mask & IN_DELETE:
+                events.append(FileEvent('deleted', path, None))
+            elif mask & (IN_MODIFY | IN_CLOSE_WRITE | IN_ATTRIB):
+                events.append(FileEvent('modified', path, None))
+
+        # Moved out of the watched directories
+        events.extend(FileEvent('deleted', path, None) for path in moved_from.values())
+        return _coalesce(events)
+
+    # Polling backend
+
+    def _run_polling(self):
+        snapshots = {path: _snapshot(path) for path in list(self._paths)}
+        while not self._stop.wait(self._poll_interval):
+            try:
+                current = {path: _snapshot(path) for path in list(self._paths)}
+                self.publish(self._diff(snapshots, current))
+                snapshots = current
+            except Exception:
+                logging.exception(f"{self.name} poll failed")
+
+    @staticmethod
+    def _diff(old, new):
+        removed = {}  # inode -> path that no longer has it
+        for directory, entries in old.items():
+            for name, (ino, _, _) in entries.items():
+                if new.get(directory, {}).get(name, (None,))[0] != ino:
+                    removed[ino] = os.path.join(directory, name)
+
+        events = []
+        for directory, entries in new.items():
+            before = old.get(directory, {})
+            for name, info in entries.items():
+                path = os.path.join(directory, name)
+                previous = before.get(name)
+                if previous == info:
+                    continue
+                source = removed.pop(info[0], None) if previous is None or previous[0] != info[0] else None
+                if source:
+                    events.append(FileEvent('moved', source, path))
+                elif previous is None:
+                    events.append(FileEvent('created', path, None))
+                else:
+                    events.append(FileEvent('modified', path, None))
+
+        for path in removed.values():
+            if os.path.basename(path) not in new.get(os.path.dirname(path), {}):
+                events.append(FileEvent('deleted', path, None))
+        return events
+
+
+# Shared watcher; app.py adds the sandbox and recycle bin and starts it
+watcher = DirectoryWatcher('fs-watcher', Config.FS_WATCH_POLL_INTERVAL, Config.FS_WATCH_BACKEND)
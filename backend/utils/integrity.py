@@ -0,0 +1,215 @@
+import os
+import time
+import hashlib
+import logging
+from database.db_connection import Database
+from utils.secure_ops import SANDBOX_DIR, log_secure_action
+from config import Config
+
+db = Database(Config.DATABASE_PATH)
+
+# Every sandbox file (encrypted .enc uploads included) has the size and
+# sha256 of its stored bytes in the files table. verify_batch() re-hashes
+# the least recently verified files at a limited rate and reports any
+# that no longer match; files indexed without a hash get one the first
+# time they are read.
+
+_FAILURE_COLUMNS = '''id, filename, reason, expected_sha256, actual_sha256, expected_size, actual_size,
+                      detected_at, resolved_at, resolved_by'''
+
+
+class _Throttle:
+    """Sleeps as needed to keep reads under bytes_per_sec (0 = unlimited)"""
+
+    def __init__(self, bytes_per_sec):
+        self._rate = bytes_per_sec
+        self._start = time.monotonic()
+        self._bytes = 0
+
+    def consumed(self, size):
+        if not self._rate:
+            return
+        self._bytes += size
+        ahead = self._bytes / self._rate - (time.monotonic() - self._start)
+        if ahead > 0:
+            time.sleep(ahead)
+
+
+def hash_file(path, throttle=None, chunk_size=None):
+    """
+    Return (size, sha256 hex digest) of a file, read sequentially into one
+    reused buffer. Not mmap: touching pages of a file truncated behind our
+    back would kill the process with SIGBUS.
+    """
+    chunk_size = chunk_size or Config.INTEGRITY_VERIFY_CHUNK_SIZE
+    digest = hashlib.sha256()
+    buffer = bytearray(chunk_size)
+    view = memoryview(buffer)
+    size = 0
+    with open(path, 'rb', buffering=0) as f:
+        if hasattr(os, 'posix_fadvise'):
+            os.posix_fadvise(f.fileno(), 0, 0, os.POSIX_FADV_SEQUENTIAL)
+        while True:
+            read = f.readinto(buffer)
+            if not read:
+                break
+            digest.update(view[:read])
+            size += read
+            if throttle:
+                throttle.consumed(read)
+    return size, digest.hexdigest()
+
+
+def report_failure(filename, reason, expected_sha256=None, actual_sha256=None, expected_size=None,
+                   actual_size=None):
+    """Record and audit-log an integrity failure unless it is already open"""
+    open_failure = db.execute_query(
+        '''SELECT id FROM integrity_failures
+           WHERE filename = ? AND reason = ? AND actual_sha256 IS ? AND actual_size IS ? AND resolved_at IS NULL''',
+        (filename, reason, actual_sha256, actual_size)
+    )
+    if open_failure:
+        return None
+
+    failure_id = db.execute_insert(
+        '''INSERT INTO integrity_failures (filename, reason, expected_sha256, actual_sha256, expected_size,
+                                           actual_size, detected_at)
+           VALUES (?, ?, ?, ?, ?, ?, ?)''',
+        (filename, reason, expected_sha256, actual_sha256, expected_size, actual_size, time.time())
+    )
+    log_secure_action(
+        None, 'integrity_failure', None, 'failure',
+        f'{filename}: {reason} (expected {expected_size} bytes, sha256 {expected_sha256}; '
+        f'found {actual_size} bytes, sha256 {actual_sha256})'
+    )
+    logging.warning(f"Integrity failure for {filename}: {reason}")
+    return failure_id
+
+
+def _defer(row):
+    """
+    Send a row that cannot be checked now (the file is gone or was rewritten
+    since it was indexed) to the back of the queue, so it does not fill
+    every batch until the reconciler, which resets verified_at, catches up.
+    """
+    db.execute_update(
+        'UPDATE files SET verified_at = ? WHERE filename = ? AND mtime_ns IS ? AND stored_size IS ?',
+        (time.time(), row['filename'], row['mtime_ns'], row['stored_size'])
+    )
+
+
+def _verify_row(row, throttle):
+    """Check one files row against the disk; returns 'ok', 'baseline', 'mismatch' or None if skipped"""
+    path = os.path.join(SANDBOX_DIR, row['filename'])
+    try:
+        before = os.stat(path)
+        # Rewritten since it was indexed: that is the reconciler's business
+        if before.st_size != row['stored_size'] or before.st_mtime_ns != row['mtime_ns']:
+            _defer(row)
+            return None
+        size, sha256 = hash_file(path, throttle)
+        after = os.stat(path)
+    except FileNotFoundError:
+        _defer(row)
+        return None
+    if (after.st_ino, after.st_size, after.st_mtime_ns) != (before.st_ino, before.st_size, before.st_mtime_ns):
+        _defer(row)
+        return None
+
+    now = time.time()
+    if row['sha256'] is None:
+        db.execute_update(
+            '''UPDATE files SET sha256 = ?, verified_at = ?
+               WHERE filename = ? AND sha256 IS NULL AND stored_size IS ? AND mtime_ns IS ?''',
+            (sha256, now, row['filename'], row['stored_size'], row['mtime_ns'])
+        )
+        return 'baseline'
+
+    # Either way the file goes to the back of the queue
+    changed = db.execute_update(
+        'UPDATE files SET verified_at = ? WHERE filename = ? AND sha256 IS ? AND mtime_ns IS ?',
+        (now, row['filename'], row['sha256'], row['mtime_ns'])
+    )
+    if sha256 == row['sha256'] and size == row['stored_size']:
+        return 'ok'
+    if not changed:
+        # Rewritten through the app while we were hashing
+        return None
+    report_failure(row['filename'], 'checksum_mismatch', expected_sha256=row['sha256'], actual_sha256=sha256,
+                   expected_size=row['stored_size'], actual_size=size)
+    return 'mismatch'
+
+
+def verify_batch(limit=None):
+    """
+    Re-hash up to limit files (INTEGRITY_VERIFY_BATCH), least recently
+    verified first, reading at most INTEGRITY_VERIFY_BYTES_PER_SEC.
+    Returns a count per outcome.
+    """
+    rows = db.execute_query(
+        'SELECT filename, sha256, stored_size, mtime_ns FROM files ORDER BY verified_at LIMIT ?',
+        (limit or Config.INTEGRITY_VERIFY_BATCH,)
+    )
+    throttle = _Throttle(Config.INTEGRITY_VERIFY_BYTES_PER_SEC)
+    counts = {'ok': 0, 'baseline': 0, 'mismatch': 0, 'skipped': 0}
+    for row in rows:
+        outcome = _verify_row(row, throttle)
+        counts[outcome or 'skipped'] += 1
+    return counts
+
+
+def get_failures(include_resolved=False, limit=100):
+    where = '' if include_resolved else 'WHERE resolved_at IS NULL'
+    rows = db.execute_query(
+        f'SELECT {_FAILURE_COLUMNS} FROM integrity_failures {where} ORDER BY detected_at DESC LIMIT ?',
+        (limit,)
+    )
+    return [dict(row) for row in rows]
+
+
+def resolve_failure(failure_id, user_id, accept=False):
+    """
+    Close a failure. With accept, the file's current content becomes its
+    new reference (hash recomputed now). Returns the failure, or None.
+    """
+    rows = db.execute_query(f'SELECT {_FAILURE_COLUMNS} FROM integrity_failures WHERE id = ?', (failure_id,))
+    if not rows:
+        return None
+
+    filename = rows[0]['filename']
+    if accept:
+        path = os.path.join(SANDBOX_DIR, filename)
+        stats = os.stat(path)
+        size, sha256 = hash_file(path)
+        db.execute_update(
+            '''UPDATE files SET sha256 = ?, stored_size = ?, mtime_ns = ?, verified_at = ?
+               WHERE filename = ?''',
+            (sha256, size, stats.st_mtime_ns, time.time(), filename)
+        )
+
+    db.execute_update(
+        'UPDATE integrity_failures SET resolved_at = ?, resolved_by = ? WHERE id = ? AND resolved_at IS NULL',
+        (time.time(), user_id, failure_id)
+    )
+    return dict(db.execute_query(f'SELECT {_FAILURE_COLUMNS} FROM integrity_failures WHERE id = ?',
+                                 (failure_id,))[0])
+
+
+def integrity_status():
+    row = db.execute_query(
+        '''SELECT COUNT(*) AS files,
+                  SUM(CASE WHEN sha256 IS NULL THEN 1 ELSE 0 END) AS without_checksum,
+                  SUM(CASE WHEN verified_at IS NULL THEN 1 ELSE 0 END) AS never_verified,
+                  MIN(verified_at) AS oldest_verification
+           FROM files'''
+    )[0]
+    status = dict(row)
+    status['open_failures'] = db.execute_query(
+        'SELECT COUNT(*) AS n FROM integrity_failures WHERE resolved_at IS NULL'
+    )[0]['n']
+    status['verifier'] = {
+        'interval': Config.INTEGRITY_VERIFY_INTERVAL,
+        'batch': Config.INTEGRITY_VERIFY_BATCH,
+        'bytes_per_sec': Config.INTEGRITY_VERIFY_BYTES_PER_SEC
+    }
+    return status
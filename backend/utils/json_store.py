@@ -0,0 +1,15 @@
+import os
+import copy
+import json
+
+# The JSON files that permissions and the recycle bin were kept in before
+# they moved to SQLite. They are only read, once, by the legacy importers.
+
+
+def read_json(path, default=None):
+    """Load a JSON file; default (or {}) if it does not exist"""
+    if not os.path.exists(path):
+        return copy.deepcopy({} if default is None else default)
+    # A damaged file raises ValueError rather than passing for an empty store
+    with open(path, 'r') as f:
+        return json.load(f)
@@ -0,0 +1,10 @@
+import hashlib
+
+# Runs in the key derivation pool's worker processes (see
+# utils/key_derivation.py). Workers import this module to unpickle the
+# function, so it must import nothing beyond the standard library.
+
+
+def pbkdf2(password_bytes, salt, iterations, key_length):
+    """PBKDF2-HMAC-SHA256"""
+    return hashlib.pbkdf2_hmac('sha256', password_bytes, salt, iterations, key_length)
@@ -0,0 +1,149 @@
+import os
+import hmac
+import time
+import atexit
+import hashlib
+import logging
+import threading
+import multiprocessing
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from utils.kdf_worker import pbkdf2
+from config import Config
+
+PBKDF2_ITERATIONS = 600_000
+KEY_LENGTH = 32
+
+# Keys are cached under (salt, HMAC of the passcode with a per-process
+# secret), so the cache never holds passcodes or plain passcode hashes.
+_cache_secret = os.urandom(32)
+_cache = OrderedDict()  # cache key -> (bytearray derived key, expires_at)
+_cache_lock = threading.Lock()
+
+# Derivations currently running, so concurrent requests for the same key
+# wait for one result instead of each burning a worker
+_inflight = {}
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def _get_pool():
+    """Create the bounded worker pool on first use"""
+    global _pool
+    with _pool_lock:
+        if _pool is None and Config.KDF_WORKERS > 0:
+            # spawn rather than fork: forking a threaded server can deadlock.
+            # Workers re-run the main script as __mp_main__, so app.py keeps
+            # its startup in create_app()
+            _pool = ProcessPoolExecutor(
+                max_workers=Config.KDF_WORKERS,
+                mp_context=multiprocessing.get_context('spawn')
+            )
+        return _pool
+
+
+def _reset_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(wait=False, cancel_futures=True)
+        _pool = None
+
+
+def _run_pbkdf2(password_bytes, salt):
+    """Derive in the worker pool, falling back to the calling thread"""
+    pool = _get_pool()
+    if pool is not None:
+        try:
+            return pool.submit(pbkdf2, password_bytes, salt, PBKDF2_ITERATIONS, KEY_LENGTH).result()
+        except (BrokenProcessPool, OSError, RuntimeError) as e:
+            logging.error(f"Key derivation pool failed, deriving inline: {e}")
+            _reset_pool()
+    return pbkdf2(password_bytes, salt, PBKDF2_ITERATIONS, KEY_LENGTH)
+
+
+def _zeroize(key):
+    for i in range(len(key)):
+        key[i] = 0
+
+
+def _evict(cache_key):
+    """Remove a cache entry and overwrite its key material (lock held)"""
+    key, _ = _cache.pop(cache_key)
+    _zeroize(key)
+
+
+def _purge_expired(now):
+    expired = [k for k, (_, expires_at) in _cache.items() if expires_at <= now]
+    for cache_key in expired:
+        _evict(cache_key)
+
+
+def derive_key(password, salt, use_cache=True):
+    """
+    Derive a raw 32-byte key from password and salt with PBKDF2-SHA256.
+
+    Runs in a bounded process pool so the work does not hold the GIL.
+    With use_cache, keys are kept for KDF_CACHE_TTL seconds (up to
+    KDF_CACHE_SIZE entries, least recently used evicted first), so
+    repeated decryption of the same file skips the derivation. Fresh
+    random salts (encryption) gain nothing from caching.
+    """
+    password_bytes = password.encode()
+    if not use_cache or Config.KDF_CACHE_SIZE <= 0:
+        return _run_pbkdf2(password_bytes, salt)
+
+    cache_key = (bytes(salt), hmac.new(_cache_secret, password_bytes, hashlib.sha256).digest())
+
+    with _cache_lock:
+        now = time.monotonic()
+        _purge_expired(now)
+        entry = _cache.get(cache_key)
+        if entry is not None:
+            _cache.move_to_end(cache_key)
+            return bytes(entry[0])
+
+        event = _inflight.get(cache_key)
+        owner = event is None
+        if owner:
+            event = _inflight[cache_key] = threading.Event()
+
+    if not owner:
+        event.wait()
+        with _cache_lock:
+            entry = _cache.get(cache_key)
+            if entry is not None:
+                return bytes(entry[0])
+        # The owner failed or the entry was already evicted
+        return _run_pbkdf2(password_bytes, salt)
+
+    try:
+        key = _run_pbkdf2(password_bytes, salt)
+        with _cache_lock:
+            if cache_key in _cache:
+                _evict(cache_key)
+            _cache[cache_key] = (bytearray(key), time.monotonic() + Config.KDF_CACHE_TTL)
+            while len(_cache) > Config.KDF_CACHE_SIZE:
+                _evict(next(iter(_cache)))
+        return key
+    finally:
+        with _cache_lock:
+            _inflight.pop(cache_key, None)
+        event.set()
+
+
+def clear_key_cache():
+    """Zeroize and drop every cached key"""
+    with _cache_lock:
+        for cache_key in list(_cache):
+            _evict(cache_key)
+
+
+def _shutdown():
+    clear_key_cache()
+    _reset_pool()
+
+
+atexit.register(_shutdown)
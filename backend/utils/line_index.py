@@ -0,0 +1,153 @@
+import os
+import codecs
+import threading
+from array import array
+from bisect import bisect_right
+from collections import OrderedDict
+from utils.compression import open_stored
+from utils.fs_watcher import watcher
+
+# Only this much of a file is inspected to decide whether it is text
+SNIFF_SIZE = 8192
+SCAN_BLOCK_SIZE = 1024 * 1024
+MAX_CACHED_INDEXES = 32
+
+# realpath -> ((st_ino, st_size, st_mtime_ns), array of line start offsets)
+_cache = OrderedDict()
+_cache_lock = threading.Lock()
+
+
+def is_binary_file(path, compression=None):
+    """Guess whether a file is binary from its first SNIFF_SIZE bytes"""
+    with open_stored(path, compression) as f:
+        head = f.read(SNIFF_SIZE)
+    if b'\x00' in head:
+        return True
+    try:
+        # Not final: the sniff may end in the middle of a multi-byte character
+        codecs.getincrementaldecoder('utf-8')().decode(head, final=False)
+    except UnicodeDecodeError:
+        return True
+    return False
+
+
+def _build_index(path, compression):
+    """Byte offset of the start of every line, from one streaming scan"""
+    starts = array('Q', [0])
+    position = 0
+    with open_stored(path, compression) as f:
+        while True:
+            block = f.read(SCAN_BLOCK_SIZE)
+            if not block:
+                break
+            i = block.find(b'\n')
+            while i != -1:
+                starts.append(position + i + 1)
+                i = block.find(b'\n', i + 1)
+            position += len(block)
+
+    # A trailing newline does not open another line
+    if len(starts) > 1 and starts[-1] == position:
+        starts.pop()
+    return starts
+
+
+def get_line_index(path, compression=None):
+    """Line start offsets (in uncompressed content), rebuilt only when the file changes"""
+    real_path = os.path.realpath(path)
+    stats = os.stat(real_path)
+    version = (stats.st_ino, stats.st_size, stats.st_mtime_ns)
+
+    with _cache_lock:
+        cached = _cache.get(real_path)
+        if cached and cached[0] == version:
+            _cache.move_to_end(real_path)
+            return cached[1]
+
+    starts = _build_index(real_path, compression)
+    with _cache_lock:
+        _cache[real_path] = (version, starts)
+        _cache.move_to_end(real_path)
+        while len(_cache) > MAX_CACHED_INDEXES:
+            _cache.popitem(last=False)
+    return starts
+
+
+@watcher.subscribe
+def _on_file_event(event):
+    """Free the index of a file that changed or went away"""
+    with _cache_lock:
+        if event.kind == 'rescan':
+            for path in [path for path in _cache if os.path.dirname(path) == event.path]:
+                del _cache[path]
+        elif event.kind != 'created':
+            _cache.pop(event.path, None)
+
+
+def _continuation_bytes(data):
+    """Number of leading UTF-8 continuation bytes in data"""
+    skip = 0
+    while skip < min(3, len(data)) and 0x80 <= data[skip] <= 0xBF:
+        skip += 1
+    return skip
+
+
+def _align_end(data):
+    """Drop a multi-byte character cut off at the end of data"""
+    for back in range(1, min(4, len(data)) + 1):
+        byte = data[-back]
+        if byte < 0x80:
+            return data
+        if byte >= 0xC0:
+            width = 2 if byte < 0xE0 else 3 if byte < 0xF0 else 4
+            return data if back >= width else data[:-back]
+    return data
+
+
+def read_window(path, offset=0, length=None, line=None, lines=None, max_bytes=1024 * 1024,
+                compression=None, size=None):
+    """
+    Read part of a text file.
+
+    Either a byte window (offset, length) or a line window (line is
+    1-based, lines is a count) is returned, never more than max_bytes.
+    Byte windows are adjusted to whole UTF-8 characters, so the returned
+    offset and length should be used to request the next window.
+    Compressed files need their compression and uncompressed size.
+    """
+    total_size = os.path.getsize(path) if size is None else size
+    starts = get_line_index(path, compression) if total_size else array('Q')
+    line_count = len(starts)
+
+    with open_stored(path, compression) as f:
+        if line is not None:
+            first = min(max(line, 1), line_count + 1) - 1
+            last = first + (lines if lines is not None else line_count)
+            start = starts[first] if first < line_count else total_size
+            stop = starts[last] if last < line_count else total_size
+            stop = min(stop, start + max_bytes)
+        else:
+            start = min(max(offset, 0), total_size)
+            stop = total_size if length is None else start + max(length, 0)
+            stop = min(stop, start + max_bytes, total_size)
+
+        # Only seek forward: compressed files cannot seek back cheaply
+        f.seek(start)
+        data = f.read(stop - start)
+        if line is None:
+            skip = _continuation_bytes(data)
+            start, data = start + skip, data[skip:]
+        if stop < total_size:
+            data = _align_end(data)
+
+    end = start + len(data)
+    return {
+        'content': data.decode('utf-8', errors='replace'),
+        'offset': start,
+        'length': len(data),
+        'total_size': total_size,
+        'line_count': line_count,
+        'start_line': bisect_right(starts, start) if line_count else 0,
+        'end_line': bisect_right(starts, end - 1) if data else 0,
+        'has_more': end < total_size
+    }
@@ -0,0 +1,209 @@
+import time
+import bisect
+import threading
+from functools import wraps
+from config import Config
+
+# Process-local metrics in Prometheus text format, served by routes/metrics.py.
+# Everything is installed only when METRICS_ENABLED is set: otherwise the
+# request hooks are not registered, Database is not wrapped and timed()
+# returns functions unchanged, so disabled metrics cost nothing. With
+# several worker processes each one reports its own numbers.
+
+ENABLED = Config.METRICS_ENABLED
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200)
+
+_lock = threading.Lock()
+_metrics = []
+
+
+def _format_labels(names, values, extra=''):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_value(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    def __init__(self, name, help_text, labels=()):
+        self.name = name
+        self.help = help_text
+        self.labels = tuple(labels)
+        self._values = {}
+        _metrics.append(self)
+
+    def inc(self, *label_values, amount=1):
+        with _lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} counter']
+        for label_values, value in sorted(self._values.items()):
+            lines.append(f'{self.name}{_format_labels(self.labels, label_values)} {_format_value(value)}')
+        return lines
+
+
+class Histogram:
+    def __init__(self, name, help_text, labels=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.labels = tuple(labels)
+        self.buckets = tuple(buckets)
+        # label values -> [per-bucket counts (last is +Inf), sum, count]
+        self._series = {}
+        _metrics.append(self)
+
+    def observe(self, value, *label_values):
+        index = bisect.bisect_left(self.buckets, value)
+        with _lock:
+            series = self._series.get(label_values)
+            if series is None:
+                series = self._series[label_values] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} histogram']
+        for label_values, (counts, total, count) in sorted(self._series.items()):
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + ('+Inf',), counts):
+                cumulative += bucket_count
+                le = f'le="{bound}"'
+                lines.append(f'{self.name}_bucket{_format_labels(self.labels, label_values, le)} {cumulative}')
+            labels = _format_labels(self.labels, label_values)
+            lines.append(f'{self.name}_sum{labels} {_format_value(total)}')
+            lines.append(f'{self.name}_count{labels} {count}')
+        return lines
+
+
+REQUESTS = Counter(
+    'ssci_http_requests_total', 'HTTP requests by route and status.',
+    ('blueprint', 'endpoint', 'method', 'status')
+)
+REQUEST_SECONDS = Histogram(
+    'ssci_http_request_duration_seconds', 'Time to produce a response (streamed bodies excluded).',
+    ('blueprint', 'endpoint', 'method')
+)
+REQUEST_DB_QUERIES = Histogram(
+    'ssci_http_request_db_queries', 'Database calls made while handling a request.',
+    ('blueprint', 'endpoint'), COUNT_BUCKETS
+)
+REQUEST_DB_SECONDS = Histogram(
+    'ssci_http_request_db_seconds', 'Time spent in database calls per request.',
+    ('blueprint', 'endpoint')
+)
+DB_QUERIES = Counter('ssci_db_queries_total', 'Database calls by kind.', ('operation',))
+DB_SECONDS = Histogram('ssci_db_query_duration_seconds', 'Database call latency by kind.', ('operation',))
+SUBPROCESS_SECONDS = Histogram(
+    'ssci_subprocess_duration_seconds', 'Execution time of allowed system commands.', ('command',)
+)
+AUDIT_SECONDS = Histogram(
+    'ssci_audit_log_write_seconds', 'Latency of writing one audit record (database and audit file).'
+)
+
+# Per-thread accumulators for the request being handled: [db calls, db seconds]
+_local = threading.local()
+
+
+def timed(histogram, label=None):
+    """
+    Decorator recording a function's duration in histogram; label(*args)
+    gives the label values. Returns the function unchanged when disabled.
+    """
+    def decorator(func):
+        if not ENABLED:
+            return func
+
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                histogram.observe(time.perf_counter() - start, *(label(*args) if label else ()))
+        return wrapper
+    return decorator
+
+
+def _wrap_db_call(func, operation):
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            elapsed = time.perf_counter() - start
+            DB_QUERIES.inc(operation)
+            DB_SECONDS.observe(elapsed, operation)
+            request_db = getattr(_local, 'request_db', None)
+            if request_db is not None:
+                request_db[0] += 1
+                request_db[1] += elapsed
+    wrapper._metrics_wrapped = True
+    return wrapper
+
+
+def _instrument_database():
+    from database.db_connection import Database
+    for method, operation in (('execute_query', 'query'), ('execute_insert', 'insert'),
+                              ('execute_update', 'update'), ('execute_many', 'many')):
+        func = getattr(Database, method)
+        if not getattr(func, '_metrics_wrapped', False):
+            setattr(Database, method, _wrap_db_call(func, operation))
+
+
+def _route_labels(request):
+    return request.blueprint or 'app', request.endpoint or 'unmatched'
+
+
+def install(app):
+    """Hook request timing into app and wrap Database; no-op when disabled"""
+    if not ENABLED:
+        return False
+    from flask import request
+
+    _instrument_database()
+
+    def start_timer():
+        _local.request_start = time.perf_counter()
+        _local.request_db = [0, 0.0]
+
+    def record(response):
+        start = getattr(_local, 'request_start', None)
+        if start is None:
+            return response
+        elapsed = time.perf_counter() - start
+        blueprint, endpoint = _route_labels(request)
+        REQUESTS.inc(blueprint, endpoint, request.method, str(response.status_code))
+        REQUEST_SECONDS.observe(elapsed, blueprint, endpoint, request.method)
+        queries, db_seconds = _local.request_db
+        REQUEST_DB_QUERIES.observe(queries, blueprint, endpoint)
+        REQUEST_DB_SECONDS.observe(db_seconds, blueprint, endpoint)
+        _local.request_start = None
+        _local.request_db = None
+        return response
+
+    # First, so requests rejected by other before_request hooks are timed too
+    app.before_request_funcs.setdefault(None, []).insert(0, start_timer)
+    app.after_request(record)
+    return True
+
+
+def render():
+    """All metrics in the Prometheus text exposition format"""
+    lines = []
+    with _lock:
+        for metric in _metrics:
+            lines.extend(metric.render())
+    return '\n'.join(lines) + '\n'
@@ -0,0 +1,230 @@
+import os
+import time
+import logging
+import threading
+from database.db_connection import Database
+from utils.json_store import read_json
+from config import Config
+
+db = Database(Config.DATABASE_PATH)
+
+# Legacy store, read once by migrate_legacy_permissions()
+LEGACY_PERMISSIONS_FILE = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'file_permissions.json')
+
+DEFAULT_PERMISSIONS = {
+    'view': True,
+    'download': True,
+    'edit': False,
+    'delete': False,
+    'owner': None
+}
+
+# In-process read cache: filename -> permissions dict, or None when the file
+# has no stored entry. Entries are dropped whenever this process writes them;
+# the generation counter stops a slow reader from re-caching a stale row.
+# Writes from other processes bump the table's cache version (a trigger),
+# which is checked at most every PERMISSIONS_CACHE_CHECK_INTERVAL seconds.
+_cache = {}
+_cache_lock = threading.Lock()
+_generation = 0
+_cache_version = None
+_version_checked_at = 0.0
+
+_SELECT_COLUMNS = 'filename, can_view, can_download, can_edit, can_delete, owner, is_locked, lock_hash'
+
+
+def _row_to_permissions(row):
+    """Convert a file_permissions row to the dict shape used by the routes"""
+    return {
+        'view': bool(row['can_view']),
+        'download': bool(row['can_download']),
+        'edit': bool(row['can_edit']),
+        'delete': bool(row['can_delete']),
+        'owner': row['owner'],
+        'is_locked': bool(row['is_locked']),
+        'lock_hash': row['lock_hash']
+    }
+
+
+def invalidate_permissions(filenames):
+    """Drop cached entries; callers writing through their own connection call this after committing"""
+    global _generation
+    with _cache_lock:
+        _generation += 1
+        for filename in filenames:
+            _cache.pop(filename, None)
+
+
+def _check_cache_version():
+    """Drop the whole cache if file_permissions changed since it was filled"""
+    global _generation, _cache_version, _version_checked_at
+    now = time.monotonic()
+    if now - _version_checked_at < Config.PERMISSIONS_CACHE_CHECK_INTERVAL:
+        return
+    version = db.cache_version('file_permissions')
+    with _cache_lock:
+        _version_checked_at = now
+        if version != _cache_version:
+            _cache_version = version
+            _generation += 1
+            _cache.clear()
+
+
+def get_file_permissions(filename):
+    """Get permissions for a file, falling back to the defaults"""
+    _check_cache_version()
+    with _cache_lock:
+        if filename in _cache:
+            cached = _cache[filename]
+            return dict(cached) if cached else dict(DEFAULT_PERMISSIONS)
+        generation = _generation
+
+    rows = db.execute_query(
+        f'SELECT {_SELECT_COLUMNS} FROM file_permissions WHERE filename = ?',
+        (filename,)
+    )
+    permissions = _row_to_permissions(rows[0]) if rows else None
+
+    with _cache_lock:
+        if generation == _generation:
+            _cache[filename] = permissions
+
+    return dict(permissions) if permissions else dict(DEFAULT_PERMISSIONS)
+
+
+def get_permissions_map(filenames):
+    """Get permissions for many files with as few queries as possible"""
+    result = {}
+    missing = []
+
+    _check_cache_version()
+    with _cache_lock:
+        for filename in filenames:
+            if filename in _cache:
+                cached = _cache[filename]
+                result[filename] = dict(cached) if cached else dict(DEFAULT_PERMISSIONS)
+            else:
+                missing.append(filename)
+        generation = _generation
+
+    # Stay well below SQLite's bound-parameter limit
+    for start in range(0, len(missing), 500):
+        batch = missing[start:start + 500]
+        placeholders = ','.join('?' * len(batch))
+        rows = db.execute_query(
+            f'SELECT {_SELECT_COLUMNS} FROM file_permissions WHERE filename IN ({placeholders})',
+            tuple(batch)
+        )
+        found = {row['filename']: _row_to_permissions(row) for row in rows}
+
+        with _cache_lock:
+            for filename in batch:
+                permissions = found.get(filename)
+                if generation == _generation:
+                    _cache[filename] = permissions
+                result[filename] = dict(permissions) if permissions else dict(DEFAULT_PERMISSIONS)
+
+    return result
+
+
+def save_file_permissions(filename, permissions, user_id, is_locked=False, lock_hash=None):
+    """Save file permissions and lock status"""
+    set_file_permissions(filename, {
+        'view': permissions.get('view', True),
+        'download': permissions.get('download', True),
+        'edit': permissions.get('edit', False),
+        'delete': permissions.get('delete', False),
+        'owner': user_id,
+        'is_locked': is_locked,
+        'lock_hash': lock_hash
+    })
+
+
+def _permissions_params(filename, permissions):
+    return (
+        filename,
+        1 if permissions.get('view', True) else 0,
+        1 if permissions.get('download', True) else 0,
+        1 if permissions.get('edit', False) else 0,
+        1 if permissions.get('delete', False) else 0,
+        permissions.get('owner'),
+        1 if permissions.get('is_locked', False) else 0,
+        permissions.get('lock_hash')
+    )
+
+
+# Conflict clause is REPLACE for writes and IGNORE for the legacy import
+_INSERT_SQL = '''INSERT OR {} INTO file_permissions
+                 (filename, can_view, can_download, can_edit, can_delete, owner, is_locked, lock_hash)
+                 VALUES (?, ?, ?, ?, ?, ?, ?, ?)'''
+
+
+def set_file_permissions(filename, permissions):
+    """Store a complete permissions dict (e.g. one saved in recycle bin metadata)"""
+    db.execute_insert(_INSERT_SQL.format('REPLACE'), _permissions_params(filename, permissions))
+    invalidate_permissions([filename])
+
+
+def delete_file_permissions(filename):
+    """Remove the permissions entry for a file"""
+    db.execute_update('DELETE FROM file_permissions WHERE filename = ?', (filename,))
+    invalidate_permissions([filename])
+
+
+def set_permissions_many(permissions_by_file):
+    """Store complete permissions dicts for many files in one transaction"""
+    if not permissions_by_file:
+        return
+    db.execute_many(
+        _INSERT_SQL.format('REPLACE'),
+        [_permissions_params(filename, permissions) for filename, permissions in permissions_by_file.items()]
+    )
+    invalidate_permissions(list(permissions_by_file))
+
+
+def delete_permissions_many(filenames, conn=None):
+    """Remove the permissions entries for many files in one transaction
+
+    With conn the deletes join the caller's transaction, and the caller
+    calls invalidate_permissions() once it has committed.
+    """
+    if not filenames:
+        return
+    params = [(filename,) for filename in filenames]
+    if conn is not None:
+        conn.executemany('DELETE FROM file_permissions WHERE filename = ?', params)
+        return
+    db.execute_many('DELETE FROM file_permissions WHERE filename = ?', params)
+    invalidate_permissions(filenames)
+
+
+def migrate_legacy_permissions():
+    """One-time import of file_permissions.json into the file_permissions table.
+
+    Existing rows win over the JSON file, so running this from several
+    processes at once is harmless.
+    """
+    if db.migration_applied('file_permissions_json'):
+        return 0
+
+    try:
+        all_permissions = read_json(LEGACY_PERMISSIONS_FILE)
+    except (OSError, ValueError) as e:
+        # Leave the migration unrecorded so it is retried on next start
+        logging.error(f"Failed to read legacy permissions file: {e}")
+        return 0
+
+    rows = [
+        _permissions_params(filename, permissions)
+        for filename, permissions in all_permissions.items()
+        if isinstance(permissions, dict)
+    ]
+    if rows:
+        db.execute_many(_INSERT_SQL.format('IGNORE'), rows)
+
+    db.mark_migration('file_permissions_json')
+    invalidate_permissions([row[0] for row in rows])
+    return len(rows)
+
+
+migrate_legacy_permissions()
@@ -0,0 +1,292 @@
+import os
+import re
+import sys
+import time
+import random
+import cProfile
+import logging
+import tempfile
+import threading
+from collections import Counter
+from config import Config
+
+# On-demand request profiling. An admin starts a session (routes/profiling.py)
+# that profiles a sampled fraction of requests, optionally only some routes,
+# until it expires or has captured max_profiles requests. Each profiled
+# request leaves one file in PROFILE_DIR:
+#   cprofile - a pstats dump (python -m pstats, snakeviz, ...)
+#   sample   - collapsed stacks ("a;b;c count" lines, for flamegraph.pl or
+#              speedscope), from sampling the request thread's stack every
+#              PROFILE_SAMPLE_INTERVAL seconds
+#
+# Nothing is installed unless PROFILING_ENABLED is set; with no session
+# running, the only cost is one check in a before_request hook. Sessions
+# are process-local.
+
+MODES = ('cprofile', 'sample')
+
+# {created ms}-{pid}-{method}-{endpoint}-{status}-{duration}ms.{pstats|folded}
+_PROFILE_NAME = re.compile(r'^(\d+)-(\d+)-([A-Z]+)-([\w.]+)-(\d+)-(\d+)ms\.(pstats|folded)$')
+
+_session = None
+_session_lock = threading.Lock()
+# cProfile cannot run on two threads at once from Python 3.12 (it uses
+# sys.monitoring, which is process-wide), so cprofile requests take turns
+_cprofile_lock = threading.Lock()
+_local = threading.local()
+
+
+class _StackSampler:
+    """Samples the stacks of registered threads on a background thread"""
+
+    def __init__(self, interval, until):
+        self._interval = interval
+        self._until = until
+        self._threads = {}  # thread ident -> Counter of collapsed stacks
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='profile-sampler', daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def add(self, ident):
+        with self._lock:
+            self._threads[ident] = Counter()
+
+    def remove(self, ident):
+        with self._lock:
+            return self._threads.pop(ident, Counter())
+
+    def _run(self):
+        while not self._stop.wait(self._interval) and time.time() < self._until:
+            frames = sys._current_frames()
+            with self._lock:
+                for ident, stacks in self._threads.items():
+                    frame = frames.get(ident)
+                    if frame is not None:
+                        stacks[_collapse(frame)] += 1
+
+
+def _collapse(frame):
+    names = []
+    while frame is not None:
+        code = frame.f_code
+        name = getattr(code, 'co_qualname', code.co_name)
+        names.append(f'{name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})')
+        frame = frame.f_back
+    return ';'.join(reversed(names))
+
+
+class _Session:
+    def __init__(self, mode, sample_rate, endpoints, duration, max_profiles, started_by):
+        self.mode = mode
+        self.sample_rate = sample_rate
+        self.endpoints = frozenset(endpoints)
+        self.started_at = time.time()
+        self.expires_at = self.started_at + duration
+        self.max_profiles = max_profiles
+        self.started_by = started_by
+        self.captured = 0
+        self.sampler = _StackSampler(Config.PROFILE_SAMPLE_INTERVAL, self.expires_at) if mode == 'sample' else None
+
+    def to_dict(self):
+        return {
+            'mode': self.mode,
+            'sample_rate': self.sample_rate,
+            'endpoints': sorted(self.endpoints),
+            'started_at': self.started_at,
+            'expires_at': self.expires_at,
+            'max_profiles': self.max_profiles,
+            'captured': self.captured,
+            'started_by': self.started_by
+        }
+
+
+def start_session(mode, sample_rate, endpoints, duration, max_profiles, started_by):
+    """Start profiling, replacing any running session; returns its settings"""
+    global _session
+    session = _Session(mode, sample_rate, endpoints, duration, max_profiles, started_by)
+    with _session_lock:
+        previous, _session = _session, session
+    if previous and previous.sampler:
+        previous.sampler.stop()
+    if session.sampler:
+        session.sampler.start()
+    return session.to_dict()
+
+
+def stop_session():
+    """Stop the running session; returns its final settings, or None"""
+    global _session
+    with _session_lock:
+        session, _session = _session, None
+    if session is None:
+        return None
+    if session.sampler:
+        session.sampler.stop()
+    return session.to_dict()
+
+
+def session_status():
+    session = _session
+    if session is not None and time.time() >= session.expires_at:
+        stop_session()
+        session = None
+    return session.to_dict() if session else None
+
+
+def _selected(session, request):
+    """Whether to profile this request; reserves one of the session's captures"""
+    if request.blueprint == 'profiling':
+        return False
+    if session.endpoints and request.endpoint not in session.endpoints and (
+            request.url_rule is None or request.url_rule.rule not in session.endpoints):
+        return False
+    if session.sample_rate < 1 and random.random() >= session.sample_rate:
+        return False
+    with _session_lock:
+        if session.captured >= session.max_profiles:
+            return False
+        session.captured += 1
+        return True
+
+
+def _begin(request):
+    session = _session
+    if session is None:
+        return
+    if time.time() >= session.expires_at or session.captured >= session.max_profiles:
+        stop_session()
+        return
+    if not _selected(session, request):
+        return
+
+    if session.sampler:
+        session.sampler.add(threading.get_ident())
+        handle = session.sampler
+    else:
+        if not _cprofile_lock.acquire(blocking=False):
+            return
+        handle = cProfile.Profile()
+        try:
+            handle.enable()
+        except ValueError:
+            # Another profiler (a debugger, coverage) owns the interpreter
+            _cprofile_lock.release()
+            return
+    _local.active = (session.mode, handle, time.perf_counter(), request.method, request.endpoint)
+    _local.status = None
+
+
+def _finish():
+    active = getattr(_local, 'active', None)
+    if active is None:
+        return
+    _local.active = None
+    mode, handle, start, method, endpoint = active
+    if mode == 'cprofile':
+        handle.disable()
+        _cprofile_lock.release()
+    else:
+        stacks = handle.remove(threading.get_ident())
+    elapsed_ms = int((time.perf_counter() - start) * 1000)
+
+    name = (f'{int(time.time() * 1000)}-{os.getpid()}-{method}-{endpoint or "unmatched"}-'
+            f'{_local.status or 500}-{elapsed_ms}ms.{"pstats" if mode == "cprofile" else "folded"}')
+    try:
+        os.makedirs(Config.PROFILE_DIR, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=Config.PROFILE_DIR, prefix='.profile-')
+        os.close(fd)
+        try:
+            if mode == 'cprofile':
+                handle.dump_stats(tmp_path)
+            else:
+                with open(tmp_path, 'w', encoding='utf-8') as f:
+                    for stack, count in stacks.most_common():
+                        f.write(f'{stack} {count}\n')
+            os.replace(tmp_path, os.path.join(Config.PROFILE_DIR, name))
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+        _prune()
+    except Exception:
+        logging.exception(f"Failed to save profile {name}")
+
+
+def _prune():
+    """Delete the oldest profiles beyond PROFILE_MAX_FILES"""
+    names = sorted((name for name in os.listdir(Config.PROFILE_DIR) if _PROFILE_NAME.match(name)),
+                   key=lambda name: int(name.split('-', 1)[0]))
+    for name in names[:max(0, len(names) - Config.PROFILE_MAX_FILES)]:
+        try:
+            os.remove(os.path.join(Config.PROFILE_DIR, name))
+        except FileNotFoundError:
+            pass
+
+
+def install(app):
+    """Hook profiling into app's requests; no-op when disabled"""
+    if not Config.PROFILING_ENABLED:
+        return False
+    from flask import request
+
+    def begin():
+        _begin(request)
+
+    def record_status(response):
+        if getattr(_local, 'active', None) is not None:
+            _local.status = response.status_code
+        return response
+
+    def finish(exc):
+        _finish()
+
+    # First, so the other before_request hooks (validation, auth) are included
+    app.before_request_funcs.setdefault(None, []).insert(0, begin)
+    app.after_request(record_status)
+    app.teardown_request(finish)
+    return True
+
+
+def list_profiles(limit=100):
+    """Saved profiles, newest first"""
+    try:
+        names = os.listdir(Config.PROFILE_DIR)
+    except FileNotFoundError:
+        return []
+
+    profiles = []
+    for name in names:
+        match = _PROFILE_NAME.match(name)
+        if not match:
+            continue
+        try:
+            size = os.path.getsize(os.path.join(Config.PROFILE_DIR, name))
+        except FileNotFoundError:
+            continue
+        created, pid, method, endpoint, status, duration, kind = match.groups()
+        profiles.append({
+            'name': name,
+            'created_at': int(created) / 1000,
+            'pid': int(pid),
+            'method': method,
+            'endpoint': endpoint,
+            'status': int(status),
+            'duration_ms': int(duration),
+            'format': kind,
+            'size': size
+        })
+    profiles.sort(key=lambda profile: profile['created_at'], reverse=True)
+    return profiles[:limit]
+
+
+def profile_path(name):
+    """Path of a saved profile, or None if name is not one"""
+    if not _PROFILE_NAME.match(name):
+        return None
+    path = os.path.join(Config.PROFILE_DIR, name)
+    return path if os.path.isfile(path) else None
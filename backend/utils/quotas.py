@@ -0,0 +1,121 @@
+from database.db_connection import Database
+from utils.files_index import get_record
+from utils.helpers import error_response
+from config import Config
+
+db = Database(Config.DATABASE_PATH)
+
+# Storage quotas. Each user may own up to users.quota_bytes, or their
+# role's ROLE_QUOTAS entry when that is NULL (None means unlimited), in
+# logical file bytes. Usage is read from storage_usage, which triggers on
+# the files table keep current, so a check is two primary key lookups.
+
+
+def _format_size(size):
+    for unit in ('bytes', 'KB', 'MB'):
+        if size < 1024:
+            return f'{size:g} {unit}' if unit == 'bytes' else f'{size:.1f} {unit}'
+        size /= 1024
+    return f'{size:.1f} GB'
+
+
+def get_usage(user_id):
+    rows = db.execute_query('SELECT bytes_used, file_count FROM storage_usage WHERE user_id = ?', (user_id,))
+    if not rows:
+        return {'bytes_used': 0, 'file_count': 0}
+    return dict(rows[0])
+
+
+def get_quota(user_id):
+    """A user's quota in bytes, or None if unlimited"""
+    rows = db.execute_query('SELECT role, quota_bytes FROM users WHERE id = ?', (user_id,))
+    if not rows:
+        return None
+    if rows[0]['quota_bytes'] is not None:
+        return rows[0]['quota_bytes']
+    return Config.ROLE_QUOTAS.get(rows[0]['role'])
+
+
+def quota_error(filename, user_id, new_size=None, added=0, take_ownership=False, owner_id=None):
+    """
+    Error response if writing filename would take its owner over quota.
+
+    new_size is the file's size after the write; when it is not known in
+    advance (partial edits), added bounds the growth instead. The bytes
+    the file already counts are credited back, so shrinking a file is
+    always allowed. owner_id names the owner when the write gives the file
+    to someone other than user_id (restores). Returns None when the write
+    fits.
+    """
+    record = get_record(filename)
+    if owner_id is None:
+        owner_id = user_id
+        if record and record['user_id'] is not None and not take_ownership:
+            owner_id = record['user_id']
+
+    quota = get_quota(owner_id)
+    if quota is None:
+        return None
+
+    current = 0
+    if record:
+        current = record['file_size'] if record['file_size'] is not None else record['stored_size'] or 0
+    if new_size is None:
+        new_size = current + added
+    credited = current if record and record['user_id'] == owner_id else 0
+
+    used = get_usage(owner_id)['bytes_used']
+    if new_size <= credited or used - credited + new_size <= quota:
+        return None
+    whose = 'your' if owner_id == user_id else "the file owner's"
+    return error_response(
+        f'This would exceed {whose} storage quota ({_format_size(used)} of {_format_size(quota)} used).',
+        413,
+        {'quota_bytes': quota, 'bytes_used': used, 'requested_bytes': new_size - credited}
+    )
+
+
+def exceeds_quota(user_id):
+    """
+    True if a user now owns more than their quota. quota_error runs before
+    a write, so writes racing each other can all pass it before any of them
+    is counted; restores check again once their bytes are and undo the
+    restore if this is true.
+    """
+    quota = get_quota(user_id)
+    return quota is not None and get_usage(user_id)['bytes_used'] > quota
+
+
+def top_consumers(limit):
+    rows = db.execute_query(
+        '''SELECT s.user_id, u.username, u.role, u.quota_bytes, s.bytes_used, s.file_count
+           FROM storage_usage s LEFT JOIN users u ON u.id = s.user_id
+           ORDER BY s.bytes_used DESC LIMIT ?''',
+        (limit,)
+    )
+    consumers = []
+    for row in rows:
+        consumer = dict(row)
+        quota = row['quota_bytes'] if row['quota_bytes'] is not None else Config.ROLE_QUOTAS.get(row['role'])
+        consumer['quota_bytes'] = quota
+        consumers.append(consumer)
+    return consumers
+
+
+def recount_usage():
+    """Rebuild storage_usage from the files table in one transaction"""
+    with db.get_connection() as conn:
+        conn.execute('DELETE FROM storage_usage')
+        conn.execute(
+            '''INSERT INTO storage_usage (user_id, bytes_used, file_count)
+               SELECT user_id, SUM(COALESCE(file_size, stored_size, 0)), COUNT(*)
+               FROM files WHERE user_id IS NOT NULL GROUP BY user_id'''
+        )
+        conn.commit()
+        return conn.execute('SELECT COUNT(*) AS n FROM storage_usage').fetchone()['n']
+
+
+# Databases that had files before the usage triggers start from a recount
+if not db.migration_applied('storage_usage_counts'):
+    recount_usage()
+    db.mark_migration('storage_usage_counts')
@@ -0,0 +1,125 @@
+import os
+import re
+import secrets
+from flask import Response
+
+# More ranges than this in one request are refused (416) rather than served
+MAX_RANGES = 16
+READ_CHUNK_SIZE = 64 * 1024
+
+# first-last, first- or -suffix_length
+_RANGE_SPEC = re.compile(r'([0-9]*)-([0-9]*)')
+
+
+def resolve_byte_ranges(range_header, length):
+    """
+    Resolve a Range header against a resource length.
+
+    Returns a list of (start, stop) pairs with stop exclusive, sorted, with
+    overlapping and adjacent ranges merged; an empty list if no range is
+    satisfiable, or None if the header is absent or invalid. Unlike
+    werkzeug's parser, ranges may overlap or come in any order (RFC 7233).
+    """
+    units, _, specs = (range_header or '').partition('=')
+    if units.strip().lower() != 'bytes':
+        return None
+
+    ranges = []
+    found = False
+    for spec in specs.split(','):
+        spec = spec.strip()
+        if not spec:
+            continue
+        match = _RANGE_SPEC.fullmatch(spec)
+        if match is None or not (match.group(1) or match.group(2)):
+            return None
+        found = True
+        first, last = match.groups()
+        if not first:
+            start, stop = max(0, length - int(last)), length
+        else:
+            start = int(first)
+            if last and int(last) < start:
+                return None
+            stop = length if not last else min(int(last) + 1, length)
+        if start < stop:
+            ranges.append((start, stop))
+    if not found:
+        return None
+    return _coalesce(ranges)
+
+
+def _coalesce(ranges):
+    """Sort ranges and merge those that overlap or touch (RFC 7233 allows either)"""
+    merged = []
+    for start, stop in sorted(ranges):
+        if merged and start <= merged[-1][1]:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], stop))
+        else:
+            merged.append((start, stop))
+    return merged
+
+
+def _read_range(f, start, stop):
+    """Yield bytes start..stop of f; Content-Length is already sent, so a short read fails"""
+    f.seek(start)
+    remaining = stop - start
+    while remaining > 0:
+        chunk = f.read(min(READ_CHUNK_SIZE, remaining))
+        if not chunk:
+            raise OSError(f'File ended {remaining} bytes before the end of range {start}-{stop - 1}')
+        remaining -= len(chunk)
+        yield chunk
+
+
+def _open_for_ranges(file_path, ranges):
+    """Open the file, failing before any headers are sent if it no longer covers every range"""
+    f = open(file_path, 'rb')
+    try:
+        size = os.fstat(f.fileno()).st_size
+        if size < max(stop for _, stop in ranges):
+            raise OSError(f'File is {size} bytes, shorter than the requested ranges')
+    except BaseException:
+        f.close()
+        raise
+    return f
+
+
+def byteranges_response(file_path, ranges, length, mimetype):
+    """Build a streamed 206 response: a single range as is, several as multipart/byteranges"""
+    f = _open_for_ranges(file_path, ranges)
+
+    if len(ranges) == 1:
+        start, stop = ranges[0]
+        response = Response(_read_range(f, start, stop), status=206, mimetype=mimetype)
+        response.call_on_close(f.close)
+        response.headers['Content-Range'] = f'bytes {start}-{stop - 1}/{length}'
+        response.headers['Content-Length'] = str(stop - start)
+        response.headers['Accept-Ranges'] = 'bytes'
+        return response
+
+    boundary = secrets.token_hex(16)
+    parts = []
+    for start, stop in ranges:
+        part_header = (
+            f'--{boundary}\r\n'
+            f'Content-Type: {mimetype}\r\n'
+            f'Content-Range: bytes {start}-{stop - 1}/{length}\r\n\r\n'
+        ).encode()
+        parts.append((part_header, start, stop))
+    closing = f'--{boundary}--\r\n'.encode()
+
+    content_length = sum(len(h) + (stop - start) + 2 for h, start, stop in parts) + len(closing)
+
+    def generate():
+        for part_header, start, stop in parts:
+            yield part_header
+            yield from _read_range(f, start, stop)
+            yield b'\r\n'
+        yield closing
+
+    response = Response(generate(), status=206, mimetype=f'multipart/byteranges; boundary={boundary}')
+    response.call_on_close(f.close)
+    response.headers['Content-Length'] = str(content_length)
+    response.headers['Accept-Ranges'] = 'bytes'
+    return response
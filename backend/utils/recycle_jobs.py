@@ -0,0 +1,140 @@
+import time
+import secrets
+import logging
+import threading
+from database.db_connection import Database
+from utils.recycle_store import claim_entries, purge_entry
+from config import Config
+
+db = Database(Config.DATABASE_PATH)
+
+# Emptying the recycle bin runs as a job: entries deleted up to the job's
+# cutoff (and, for users other than admins, deleted by its owner) are
+# claimed and purged RECYCLE_EMPTY_BATCH at a time. Progress is stored
+# after every batch, so a job whose process died is picked up again by
+# resume_stale_jobs() and simply carries on with what is left.
+
+_JOB_COLUMNS = '''id, owner_id, requested_by, cutoff, status, total, processed, purged,
+                  error, created_at, updated_at, finished_at'''
+
+# Job ids running in this process
+_running = set()
+_running_lock = threading.Lock()
+
+
+def _scope(owner_id):
+    """WHERE clause and params selecting the entries a job may purge"""
+    if owner_id is None:
+        return 'deleted_at <= ?', ()
+    return 'deleted_at <= ? AND deleted_by_id = ?', (owner_id,)
+
+
+def _row_to_job(row):
+    job = dict(row)
+    job['remaining'] = max(0, job['total'] - job['processed'])
+    return job
+
+
+def get_job(job_id):
+    rows = db.execute_query(f'SELECT {_JOB_COLUMNS} FROM recycle_jobs WHERE id = ?', (job_id,))
+    return _row_to_job(rows[0]) if rows else None
+
+
+def start_empty_job(owner_id, requested_by):
+    """
+    Queue emptying the bin (or one user's part of it) and start it.
+
+    A job already queued or running for the same scope is returned instead
+    of starting a second one.
+    """
+    active = db.execute_query(
+        f'''SELECT {_JOB_COLUMNS} FROM recycle_jobs
+            WHERE owner_id IS ? AND status IN ('pending', 'running') ORDER BY created_at LIMIT 1''',
+        (owner_id,)
+    )
+    if active:
+        return _row_to_job(active[0]), False
+
+    now = time.time()
+    cutoff = int(now)
+    where, params = _scope(owner_id)
+    total = db.execute_query(f'SELECT COUNT(*) AS n FROM recycle_bin WHERE {where}', (cutoff,) + params)[0]['n']
+
+    job_id = secrets.token_urlsafe(12)
+    db.execute_insert(
+        '''INSERT INTO recycle_jobs (id, owner_id, requested_by, cutoff, status, total, created_at, updated_at)
+           VALUES (?, ?, ?, ?, 'pending', ?, ?, ?)''',
+        (job_id, owner_id, requested_by, cutoff, total, now, now)
+    )
+    _launch(job_id)
+    return get_job(job_id), True
+
+
+def _acquire(job_id):
+    """Mark a job as running in this process unless another one holds it"""
+    stale_before = time.time() - Config.RECYCLE_JOB_STALE_AFTER
+    return db.execute_update(
+        '''UPDATE recycle_jobs SET status = 'running', updated_at = ?
+           WHERE id = ? AND (status = 'pending' OR (status = 'running' AND updated_at < ?))''',
+        (time.time(), job_id, stale_before)
+    ) == 1
+
+
+def _launch(job_id):
+    with _running_lock:
+        if job_id in _running or not _acquire(job_id):
+            return False
+        _running.add(job_id)
+    threading.Thread(target=_run, args=(job_id,), name=f'recycle-empty-{job_id}', daemon=True).start()
+    return True
+
+
+def _run(job_id):
+    try:
+        job = get_job(job_id)
+        where, params = _scope(job['owner_id'])
+        while True:
+            rows = db.execute_query(
+                f'SELECT recycle_name FROM recycle_bin WHERE {where} ORDER BY deleted_at LIMIT ?',
+                (job['cutoff'],) + params + (Config.RECYCLE_EMPTY_BATCH,)
+            )
+            if not rows:
+                break
+
+            # Entries restored or reaped meanwhile are not claimed and not counted
+            purged = sum(1 for entry in claim_entries([row['recycle_name'] for row in rows], job['owner_id'])
+                         if purge_entry(entry))
+            db.execute_update(
+                '''UPDATE recycle_jobs SET processed = processed + ?, purged = purged + ?, updated_at = ?
+                   WHERE id = ?''',
+                (len(rows), purged, time.time(), job_id)
+            )
+            # Throttle so a large bin does not saturate the disk
+            if len(rows) == Config.RECYCLE_EMPTY_BATCH:
+                time.sleep(Config.RECYCLE_EMPTY_BATCH_DELAY)
+
+        db.execute_update(
+            '''UPDATE recycle_jobs SET status = 'completed', processed = MAX(processed, total),
+               updated_at = ?, finished_at = ? WHERE id = ?''',
+            (time.time(), time.time(), job_id)
+        )
+    except Exception as e:
+        logging.exception(f"Recycle bin job {job_id} failed")
+        db.execute_update(
+            "UPDATE recycle_jobs SET status = 'failed', error = ?, updated_at = ?, finished_at = ? WHERE id = ?",
+            (str(e), time.time(), time.time(), job_id)
+        )
+    finally:
+        with _running_lock:
+            _running.discard(job_id)
+
+
+def resume_stale_jobs():
+    """Restart queued jobs and running jobs whose process stopped reporting progress"""
+    stale_before = time.time() - Config.RECYCLE_JOB_STALE_AFTER
+    rows = db.execute_query(
+        '''SELECT id FROM recycle_jobs
+           WHERE status = 'pending' OR (status = 'running' AND updated_at < ?)''',
+        (stale_before,)
+    )
+    return sum(1 for row in rows if _launch(row['id']))
@@ -0,0 +1,323 @@
+import os
+import json
+import time
+import logging
+from database.db_connection import Database
+from utils.json_store import read_json
+from utils.secure_ops import SANDBOX_DIR
+from utils.blob_store import blob_path, release_blob
+from utils.file_versions import purge_versions
+from utils.background import DeadlineTask
+from utils.dir_listing import encode_cursor, decode_cursor
+from config import Config
+
+db = Database(Config.DATABASE_PATH)
+
+RECYCLE_BIN_DIR = os.path.join(os.path.dirname(SANDBOX_DIR), 'recycle_bin')
+
+# Legacy store, read once by migrate_legacy_metadata()
+LEGACY_METADATA_FILE = os.path.join(RECYCLE_BIN_DIR, 'metadata.json')
+
+_SELECT_COLUMNS = '''recycle_name, original_name, deleted_at, deleted_by, deleted_by_id, expires_at, size, sha256,
+                     permissions, file_record'''
+
+
+def _row_to_entry(row):
+    """Convert a recycle_bin row to the dict shape used by the routes"""
+    return {
+        'recycle_name': row['recycle_name'],
+        'original_name': row['original_name'],
+        'deleted_at': row['deleted_at'],
+        'deleted_by': row['deleted_by'],
+        'deleted_by_id': row['deleted_by_id'],
+        'expires_at': row['expires_at'],
+        'size': row['size'],
+        'sha256': row['sha256'],
+        'permissions': json.loads(row['permissions']) if row['permissions'] else None,
+        'file_record': json.loads(row['file_record']) if row['file_record'] else None
+    }
+
+
+def _entry_params(entry):
+    permissions = entry.get('permissions')
+    return (
+        entry['recycle_name'],
+        entry['original_name'],
+        entry['deleted_at'],
+        entry.get('deleted_by'),
+        entry.get('deleted_by_id'),
+        entry['expires_at'],
+        entry.get('size', 0),
+        entry.get('sha256'),
+        json.dumps(permissions) if permissions is not None else None,
+        json.dumps(entry['file_record']) if entry.get('file_record') else None
+    )
+
+
+# Conflict clause is ABORT for new entries and IGNORE for the legacy import
+_INSERT_SQL = '''INSERT OR {} INTO recycle_bin
+                 (recycle_name, original_name, deleted_at, deleted_by, deleted_by_id, expires_at, size, sha256,
+                  permissions, file_record)
+                 VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)'''
+
+
+def unique_recycle_name(filename, timestamp):
+    """Internal recycle bin name; a file deleted again within the same second gets a counter"""
+    recycle_name = f"{timestamp}_{filename}"
+    counter = 1
+    while get_entry(recycle_name) or os.path.exists(os.path.join(RECYCLE_BIN_DIR, recycle_name)):
+        recycle_name = f"{timestamp}_{counter}_{filename}"
+        counter += 1
+    return recycle_name
+
+
+def new_entry(recycle_name, original_name, deleted_by, permissions, size, sha256=None, deleted_at=None,
+              deleted_by_id=None, file_record=None):
+    """Build an entry for a file that is being moved to the recycle bin
+
+    size is taken at delete time so listings never stat the bin;
+    file_record is the file's files row, restored along with it.
+    """
+    deleted_at = int(time.time()) if deleted_at is None else deleted_at
+    return {
+        'recycle_name': recycle_name,
+        'original_name': original_name,
+        'deleted_at': deleted_at,
+        'deleted_by': deleted_by,
+        'deleted_by_id': deleted_by_id,
+        'expires_at': deleted_at + Config.RECYCLE_BIN_RETENTION,
+        'size': size,
+        'sha256': sha256,
+        'permissions': permissions,
+        'file_record': file_record
+    }
+
+
+def add_entries(entries, conn=None):
+    """Record recycled files in one transaction and schedule their expiry
+
+    With conn the inserts join the caller's transaction.
+    """
+    if not entries:
+        return
+    params = [_entry_params(entry) for entry in entries]
+    if conn is not None:
+        conn.executemany(_INSERT_SQL.format('ABORT'), params)
+    else:
+        db.execute_many(_INSERT_SQL.format('ABORT'), params)
+    reaper.schedule(min(entry['expires_at'] for entry in entries))
+
+
+def get_entry(recycle_name):
+    rows = db.execute_query(f'SELECT {_SELECT_COLUMNS} FROM recycle_bin WHERE recycle_name = ?', (recycle_name,))
+    return _row_to_entry(rows[0]) if rows else None
+
+
+def get_entries(recycle_names):
+    """recycle_name -> entry for the names that are in the bin"""
+    entries = {}
+    # Stay well below SQLite's bound-parameter limit
+    for start in range(0, len(recycle_names), 500):
+        batch = recycle_names[start:start + 500]
+        placeholders = ','.join('?' * len(batch))
+        rows = db.execute_query(
+            f'SELECT {_SELECT_COLUMNS} FROM recycle_bin WHERE recycle_name IN ({placeholders})',
+            tuple(batch)
+        )
+        entries.update((row['recycle_name'], _row_to_entry(row)) for row in rows)
+    return entries
+
+
+def _escape_like(value):
+    return value.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+
+
+def list_page(owner_id=None, deleted_by=None, prefix='', since=None, until=None, cursor=None, limit=100):
+    """
+    One page of unexpired entries, newest deletion first.
+
+    owner_id limits the page to one user's deletions (served by the owner
+    index); deleted_by filters by username, prefix by original name and
+    since/until by deletion time, inclusive. Returns (entries, next_cursor,
+    total); cursors are keyset-based as in dir_listing.
+    """
+    conditions = ['expires_at > ?']
+    params = [int(time.time())]
+    if owner_id is not None:
+        conditions.append('deleted_by_id = ?')
+        params.append(owner_id)
+    if deleted_by:
+        conditions.append('deleted_by = ?')
+        params.append(deleted_by)
+    if prefix:
+        conditions.append("original_name LIKE ? ESCAPE '\\'")
+        params.append(_escape_like(prefix) + '%')
+    if since is not None:
+        conditions.append('deleted_at >= ?')
+        params.append(since)
+    if until is not None:
+        conditions.append('deleted_at <= ?')
+        params.append(until)
+
+    where = ' AND '.join(conditions)
+    total = db.execute_query(f'SELECT COUNT(*) AS n FROM recycle_bin WHERE {where}', tuple(params))[0]['n']
+
+    if cursor:
+        deleted_at, recycle_name = decode_cursor(cursor, 'deleted_at')
+        where += ' AND (deleted_at < ? OR (deleted_at = ? AND recycle_name < ?))'
+        params += [deleted_at, deleted_at, recycle_name]
+
+    rows = db.execute_query(
+        f'''SELECT {_SELECT_COLUMNS} FROM recycle_bin WHERE {where}
+            ORDER BY deleted_at DESC, recycle_name DESC LIMIT ?''',
+        tuple(params) + (limit + 1,)
+    )
+    entries = [_row_to_entry(row) for row in rows[:limit]]
+    next_cursor = None
+    if len(rows) > limit:
+        last = entries[-1]
+        next_cursor = encode_cursor('deleted_at', {'deleted_at': last['deleted_at'], 'name': last['recycle_name']})
+    return entries, next_cursor, total
+
+
+def claim_entries(recycle_names, owner_id=None):
+    """
+    Remove entries from the index and return the ones this call removed.
+
+    Whoever claims an entry owns its bytes (to restore or purge them), so
+    a restore racing the reaper or another request cannot act twice. With
+    owner_id, other users' entries are left alone.
+    """
+    entries = get_entries(recycle_names)
+    claimed = []
+    with db.get_connection() as conn:
+        for recycle_name in recycle_names:
+            entry = entries.get(recycle_name)
+            if entry is None or (owner_id is not None and entry['deleted_by_id'] != owner_id):
+                continue
+            cursor = conn.execute('DELETE FROM recycle_bin WHERE recycle_name = ?', (recycle_name,))
+            if cursor.rowcount:
+                claimed.append(entries[recycle_name])
+        conn.commit()
+    return claimed
+
+
+def claim_entry(recycle_name, owner_id=None):
+    claimed = claim_entries([recycle_name], owner_id)
+    return claimed[0] if claimed else None
+
+
+def release_claim(entry):
+    """Put back an entry that was claimed but could not be restored"""
+    db.execute_insert(_INSERT_SQL.format('IGNORE'), _entry_params(entry))
+    reaper.schedule(entry['expires_at'])
+
+
+def entry_path(entry):
+    """Where a recycled file's bytes live: its blob, or a file in the bin"""
+    if entry.get('sha256'):
+        return blob_path(entry['sha256'])
+    return os.path.join(RECYCLE_BIN_DIR, entry['recycle_name'])
+
+
+def purge_entry(entry):
+    """Permanently delete a claimed entry's bytes and versions; returns False if the bytes were already gone"""
+    purge_versions(entry['recycle_name'])
+    if entry.get('sha256'):
+        release_blob(entry['sha256'])
+        return True
+    try:
+        os.remove(entry_path(entry))
+        return True
+    except FileNotFoundError:
+        return False
+
+
+def purge_expired():
+    """
+    Purge expired entries, RECYCLE_PURGE_BATCH at a time, then schedule
+    the reaper for the next expiry. Returns the number of entries purged.
+    """
+    purged = 0
+    while True:
+        rows = db.execute_query(
+            'SELECT recycle_name FROM recycle_bin WHERE expires_at <= ? ORDER BY expires_at LIMIT ?',
+            (time.time(), Config.RECYCLE_PURGE_BATCH)
+        )
+        if not rows:
+            break
+        for entry in claim_entries([row['recycle_name'] for row in rows]):
+            purge_entry(entry)
+            purged += 1
+
+    rows = db.execute_query('SELECT MIN(expires_at) AS next_expiry FROM recycle_bin')
+    if rows[0]['next_expiry'] is not None:
+        reaper.schedule(rows[0]['next_expiry'])
+    if purged:
+        logging.info(f"Recycle bin reaper purged {purged} expired file(s)")
+    return purged
+
+
+# Wakes at the earliest expiry; started by app.py
+reaper = DeadlineTask('recycle-reaper', purge_expired, Config.RECYCLE_REAPER_MAX_SLEEP)
+
+
+def migrate_legacy_metadata():
+    """One-time import of recycle_bin/metadata.json into the recycle_bin table.
+
+    Entries whose bytes are already gone are skipped. Existing rows win, so
+    running this from several processes at once is harmless.
+    """
+    if db.migration_applied('recycle_metadata_json'):
+        return 0
+
+    try:
+        metadata = read_json(LEGACY_METADATA_FILE)
+    except (OSError, ValueError) as e:
+        # Leave the migration unrecorded so it is retried on next start
+        logging.error(f"Failed to read legacy recycle bin metadata: {e}")
+        return 0
+
+    user_ids = {row['username']: row['id'] for row in db.execute_query('SELECT id, username FROM users')}
+    entries = []
+    for recycle_name, info in metadata.items():
+        if not isinstance(info, dict):
+            continue
+        entry = new_entry(
+            recycle_name,
+            info.get('original_name', recycle_name),
+            info.get('deleted_by'),
+            info.get('permissions'),
+            0,
+            sha256=info.get('sha256'),
+            deleted_at=int(info.get('deleted_at', 0)),
+            deleted_by_id=user_ids.get(info.get('deleted_by'))
+        )
+        try:
+            entry['size'] = os.path.getsize(entry_path(entry))
+        except OSError:
+            continue
+        entries.append(entry)
+
+    if entries:
+        db.execute_many(_INSERT_SQL.format('IGNORE'), [_entry_params(entry) for entry in entries])
+
+    db.mark_migration('recycle_metadata_json')
+    return len(entries)
+
+
+def backfill_owner_ids():
+    """One-time fill of deleted_by_id for entries recorded with only a username"""
+    if db.migration_applied('recycle_bin_owner_ids'):
+        return 0
+    updated = db.execute_update(
+        '''UPDATE recycle_bin SET deleted_by_id = (SELECT id FROM users WHERE username = recycle_bin.deleted_by)
+           WHERE deleted_by_id IS NULL'''
+    )
+    db.mark_migration('recycle_bin_owner_ids')
+    return updated
+
+
+os.makedirs(RECYCLE_BIN_DIR, exist_ok=True)
+migrate_legacy_metadata()
+backfill_owner_ids()
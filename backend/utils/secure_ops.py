@@ -1,185 +1,502 @@
-import os
-import subprocess
-import shlex
-import base64
-from datetime import datetime
-from cryptography.fernet import Fernet
-from cryptography.hazmat.primitives.kdf.pbkdf2 import PBKDF2HMAC
-from cryptography.hazmat.primitives import hashes
-from database.db_connection import Database
-from config import Config
-from werkzeug.utils import secure_filename
-
-db = Database(Config.DATABASE_PATH)
-
-# Initialize encryption
-# Ensure key is valid base64 url-safe, if not generate one (for dev)
-try:
-    cipher_suite = Fernet(Config.ENCRYPTION_KEY.encode())
-except:
-    # Fallback for dev if key is invalid
-    key = Fernet.generate_key()
-    cipher_suite = Fernet(key)
-    print(f"WARNING: Generated new encryption key: {key.decode()}")
-
-SANDBOX_DIR = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'ssci_files')
-
-def encrypt_data(data):
-    """Encrypt string data"""
-    if not data:
-        return ""
-    return cipher_suite.encrypt(data.encode()).decode()
-
-def decrypt_data(data):
-    """Decrypt string data"""
-    if not data:
-        return ""
-    try:
-        return cipher_suite.decrypt(data.encode()).decode()
-    except:
-        return "[Decryption Failed]"
-
-def derive_key_from_password(password, salt):
-    """Derive encryption key from password using PBKDF2"""
-    kdf = PBKDF2HMAC(
-        algorithm=hashes.SHA256(),
-        length=32,
-        salt=salt,
-        iterations=600_000,
-    )
-    key = base64.urlsafe_b64encode(kdf.derive(password.encode()))
-    return key
-
-def encrypt_file_with_password(content, password):
-    """Encrypt file content with password-derived key"""
-    salt = os.urandom(16)
-    key = derive_key_from_password(password, salt)
-    cipher = Fernet(key)
-    encrypted_content = cipher.encrypt(content)
-    return salt + encrypted_content
-
-def decrypt_file_with_password(encrypted_content, password):
-    """Decrypt file content with password-derived key"""
-    salt = encrypted_content[:16]
-    ciphertext = encrypted_content[16:]
-    key = derive_key_from_password(password, salt)
-    cipher = Fernet(key)
-    return cipher.decrypt(ciphertext)
-
-def log_secure_action(user_id, action_type, ip_address, status, details):
-    """Log action with encrypted details to both database and append-only audit file"""
-    encrypted_details = encrypt_data(details)
-
-    # Log to database
-    db.execute_insert(
-        'INSERT INTO logs (user_id, action_type, ip_address, status, details) VALUES (?, ?, ?, ?, ?)',
-        (user_id, action_type, ip_address, status, encrypted_details)
-    )
-
-    # Also log to append-only audit file for durability and tamper-evidence
-    from utils.audit_logger import log_audit_event
-    log_audit_event(user_id, action_type, ip_address, status, details)
-
-def is_safe_path(path):
-    """Ensure path is within sandbox directory"""
-    if not os.path.exists(SANDBOX_DIR):
-        os.makedirs(SANDBOX_DIR)
-    
-    # Resolve absolute path
-    abs_path = os.path.abspath(os.path.join(SANDBOX_DIR, path))
-    # Check if it starts with sandbox path
-    return abs_path.startswith(os.path.abspath(SANDBOX_DIR))
-
-def secure_open(path, mode, user_id, ip_address):
-    """Securely open a file (conceptually, returns path if safe)"""
-    filename = secure_filename(path)
-    
-    if not is_safe_path(filename):
-        log_secure_action(user_id, 'secure_open', ip_address, 'failure', f'Path traversal attempt: {path}')
-        raise ValueError("Invalid filename or path traversal attempt.")
-    
-    return os.path.join(SANDBOX_DIR, filename)
-
-def secure_read(path, user_id, ip_address):
-    """Securely read a file"""
-    try:
-        file_path = secure_open(path, 'r', user_id, ip_address)
-        
-        if not os.path.exists(file_path):
-            log_secure_action(user_id, 'secure_read', ip_address, 'failure', f'File not found: {path}')
-            raise FileNotFoundError("File not found.")
-            
-        with open(file_path, 'r') as f:
-            content = f.read()
-            
-        log_secure_action(user_id, 'secure_read', ip_address, 'success', f'Read file: {path}')
-        return content
-    except Exception as e:
-        log_secure_action(user_id, 'secure_read', ip_address, 'failure', f'Error reading {path}: {str(e)}')
-        raise e
-
-def secure_write(path, content, user_id, ip_address):
-    """Securely write to a file"""
-    try:
-        file_path = secure_open(path, 'w', user_id, ip_address)
-        
-        with open(file_path, 'w') as f:
-            f.write(content)
-            
-        log_secure_action(user_id, 'secure_write', ip_address, 'success', f'Wrote to file: {path}')
-        return True
-    except Exception as e:
-        log_secure_action(user_id, 'secure_write', ip_address, 'failure', f'Error writing {path}: {str(e)}')
-        raise e
-
-def secure_delete(path, user_id, ip_address):
-    """Securely delete a file"""
-    try:
-        file_path = secure_open(path, 'd', user_id, ip_address)
-        
-        if not os.path.exists(file_path):
-            log_secure_action(user_id, 'secure_delete', ip_address, 'failure', f'File not found: {path}')
-            raise FileNotFoundError("File not found.")
-            
-        os.remove(file_path)
-        log_secure_action(user_id, 'secure_delete', ip_address, 'success', f'Deleted file: {path}')
-        return True
-    except Exception as e:
-        log_secure_action(user_id, 'secure_delete', ip_address, 'failure', f'Error deleting {path}: {str(e)}')
-        raise e
-
-def secure_execute(command, user_id, ip_address):
-    """Securely execute a command without shell injection"""
-    try:
-        cmd_parts = shlex.split(command)
-    except ValueError as e:
-        log_secure_action(user_id, 'secure_execute', ip_address, 'failure', f'Invalid command syntax: {str(e)}')
-        raise ValueError("Invalid command syntax.")
-
-    base_cmd = cmd_parts[0] if cmd_parts else ""
-
-    if base_cmd not in Config.ALLOWED_COMMANDS:
-        log_secure_action(user_id, 'secure_execute', ip_address, 'failure', f'Unauthorized command: {command}')
-        raise ValueError("Command not allowed.")
-
-    try:
-        result = subprocess.run(
-            cmd_parts,
-            capture_output=True,
-            text=True,
-            timeout=10
-        )
-
-        status = 'success' if result.returncode == 0 else 'failure'
-        output = result.stdout if result.returncode == 0 else result.stderr
-
-        log_secure_action(user_id, 'secure_execute', ip_address, status, f'Executed: {command}')
-
-        return {
-            'status': status,
-            'output': output,
-            'return_code': result.returncode
-        }
-    except Exception as e:
-        log_secure_action(user_id, 'secure_execute', ip_address, 'failure', f'Execution error: {str(e)}')
-        raise e
+import os
+import io
+import struct
+import subprocess
+import shlex
+import base64
+import hashlib
+import tempfile
+from datetime import datetime
+from cryptography.fernet import Fernet, InvalidToken
+from cryptography.exceptions import InvalidTag
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+from database.db_connection import Database
+from config import Config
+from werkzeug.utils import secure_filename
+from utils.dir_listing import invalidate_listing_cache
+from utils.key_derivation import derive_key
+from utils.line_index import get_line_index
+from utils.compression import stored_compression, open_stored
+from utils.metrics import timed, AUDIT_SECONDS, SUBPROCESS_SECONDS
+
+db = Database(Config.DATABASE_PATH)
+
+# Initialize encryption
+# Ensure key is valid base64 url-safe, if not generate one (for dev)
+try:
+    cipher_suite = Fernet(Config.ENCRYPTION_KEY.encode())
+except:
+    # Fallback for dev if key is invalid
+    key = Fernet.generate_key()
+    cipher_suite = Fernet(key)
+    print(f"WARNING: Generated new encryption key: {key.decode()}")
+
+SANDBOX_DIR = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'ssci_files')
+
+
+def _current_umask():
+    mask = os.umask(0)
+    os.umask(mask)
+    return mask
+
+
+# mkstemp creates files readable by the owner only; files renamed into the
+# sandbox get the mode a plain open() would have given them
+_FILE_MODE = 0o666 & ~_current_umask()
+
+
+def _sandbox_tempfile(prefix):
+    """Hidden temp file in the sandbox, to be renamed over its target"""
+    fd, tmp_path = tempfile.mkstemp(dir=SANDBOX_DIR, prefix=prefix)
+    os.fchmod(fd, _FILE_MODE)
+    return fd, tmp_path
+
+def encrypt_data(data):
+    """Encrypt string data"""
+    if not data:
+        return ""
+    return cipher_suite.encrypt(data.encode()).decode()
+
+def decrypt_data(data):
+    """Decrypt string data"""
+    if not data:
+        return ""
+    try:
+        return cipher_suite.decrypt(data.encode()).decode()
+    except:
+        return "[Decryption Failed]"
+
+# Chunked file encryption format (version 2)
+#
+#   header: magic "SSCE" | version (1) | chunk size (4) | salt (16)
+#           | nonce prefix (7) | chunk count (8)      -- integers big-endian
+#   body:   chunk count records of AES-256-GCM ciphertext + 16-byte tag,
+#           each covering chunk size plaintext bytes (the last may be shorter)
+#
+# Chunk nonce = nonce prefix | chunk index (4) | last-chunk flag (1), so
+# chunks cannot be reordered, dropped or truncated without failing
+# authentication. The header up to the chunk count is bound as associated
+# data. Files without the magic are legacy Fernet files: salt (16) | token.
+ENC_MAGIC = b'SSCE'
+ENC_VERSION = 2
+ENC_CHUNK_SIZE = 64 * 1024
+ENC_MAX_CHUNK_SIZE = 16 * 1024 * 1024
+ENC_TAG_SIZE = 16
+_ENC_HEADER = struct.Struct('>4sBI16s7sQ')
+_ENC_AAD_SIZE = _ENC_HEADER.size - 8
+
+def derive_key_from_password(password, salt, use_cache=True):
+    """Derive encryption key from password using PBKDF2 (see utils.key_derivation)"""
+    key = base64.urlsafe_b64encode(derive_key(password, salt, use_cache))
+    return key
+
+def _chunk_nonce(prefix, index, last):
+    return prefix + struct.pack('>IB', index, 1 if last else 0)
+
+def encrypt_stream_with_password(src, dst, password, chunk_size=ENC_CHUNK_SIZE):
+    """
+    Encrypt src into dst in the chunked format, one chunk in memory at a time.
+
+    dst must be seekable: the chunk count is written into the header once the
+    input is exhausted. Returns the number of plaintext bytes encrypted.
+    """
+    salt = os.urandom(16)
+    prefix = os.urandom(7)
+    aesgcm = AESGCM(derive_key(password, salt, use_cache=False))
+
+    header_start = dst.tell()
+    header = _ENC_HEADER.pack(ENC_MAGIC, ENC_VERSION, chunk_size, salt, prefix, 0)
+    aad = header[:_ENC_AAD_SIZE]
+    dst.write(header)
+
+    # Read one chunk ahead so the final chunk can be flagged as such
+    index = 0
+    total = 0
+    chunk = src.read(chunk_size)
+    while True:
+        following = src.read(chunk_size) if chunk else b''
+        last = not following
+        dst.write(aesgcm.encrypt(_chunk_nonce(prefix, index, last), chunk, aad))
+        total += len(chunk)
+        index += 1
+        if last:
+            break
+        chunk = following
+
+    end = dst.tell()
+    dst.seek(header_start)
+    dst.write(_ENC_HEADER.pack(ENC_MAGIC, ENC_VERSION, chunk_size, salt, prefix, index))
+    dst.seek(end)
+    return total
+
+def is_chunked_encryption(header):
+    """Check whether the leading bytes of an encrypted file use the chunked format"""
+    return len(header) >= 5 and header[:4] == ENC_MAGIC and header[4] == ENC_VERSION
+
+def iter_decrypt_stream(src, password):
+    """
+    Yield decrypted plaintext chunks from an encrypted file object.
+
+    Chunked files are decrypted one chunk at a time; legacy Fernet files are
+    decrypted in one piece. Raises ValueError if the passcode is wrong or the
+    data has been tampered with. Nothing is yielded before the first chunk
+    has been authenticated.
+    """
+    header = src.read(_ENC_HEADER.size)
+    if not is_chunked_encryption(header):
+        try:
+            yield _decrypt_legacy(header + src.read(), password)
+        except InvalidToken:
+            raise ValueError('Decryption failed: wrong passcode or corrupted file')
+        return
+
+    if len(header) < _ENC_HEADER.size:
+        raise ValueError('Decryption failed: truncated header')
+    _, _, chunk_size, salt, prefix, count = _ENC_HEADER.unpack(header)
+    if count < 1 or not 0 < chunk_size <= ENC_MAX_CHUNK_SIZE:
+        raise ValueError('Decryption failed: corrupted header')
+
+    aesgcm = AESGCM(derive_key(password, salt))
+    aad = header[:_ENC_AAD_SIZE]
+    for index in range(count):
+        last = index == count - 1
+        record = src.read(chunk_size + ENC_TAG_SIZE)
+        if len(record) < ENC_TAG_SIZE or (not last and len(record) < chunk_size + ENC_TAG_SIZE):
+            raise ValueError('Decryption failed: truncated file')
+        try:
+            yield aesgcm.decrypt(_chunk_nonce(prefix, index, last), record, aad)
+        except InvalidTag:
+            raise ValueError('Decryption failed: wrong passcode or corrupted file')
+
+    if src.read(1):
+        raise ValueError('Decryption failed: trailing data after final chunk')
+
+def decrypted_size(header, stored_size):
+    """Plaintext size of a chunked encrypted file, or None for legacy files"""
+    if not is_chunked_encryption(header) or len(header) < _ENC_HEADER.size:
+        return None
+    count = _ENC_HEADER.unpack(header[:_ENC_HEADER.size])[5]
+    return stored_size - _ENC_HEADER.size - count * ENC_TAG_SIZE
+
+def _decrypt_legacy(encrypted_content, password):
+    """Decrypt a legacy salt + Fernet token file"""
+    salt = encrypted_content[:16]
+    ciphertext = encrypted_content[16:]
+    key = derive_key_from_password(password, salt)
+    cipher = Fernet(key)
+    return cipher.decrypt(ciphertext)
+
+def encrypt_file_with_password(content, password):
+    """Encrypt file content with password-derived key"""
+    out = io.BytesIO()
+    encrypt_stream_with_password(io.BytesIO(content), out, password)
+    return out.getvalue()
+
+def decrypt_file_with_password(encrypted_content, password):
+    """Decrypt file content with password-derived key (chunked or legacy format)"""
+    return b''.join(iter_decrypt_stream(io.BytesIO(encrypted_content), password))
+
+@timed(AUDIT_SECONDS)
+def log_secure_action(user_id, action_type, ip_address, status, details):
+    """Log action with encrypted details to both database and append-only audit file"""
+    encrypted_details = encrypt_data(details)
+
+    # Log to database
+    db.execute_insert(
+        'INSERT INTO logs (user_id, action_type, ip_address, status, details) VALUES (?, ?, ?, ?, ?)',
+        (user_id, action_type, ip_address, status, encrypted_details)
+    )
+
+    # Also log to append-only audit file for durability and tamper-evidence
+    from utils.audit_logger import log_audit_event
+    log_audit_event(user_id, action_type, ip_address, status, details)
+
+def is_safe_path(path):
+    """Ensure path is within sandbox directory"""
+    if not os.path.exists(SANDBOX_DIR):
+        os.makedirs(SANDBOX_DIR)
+    
+    # Resolve absolute path
+    abs_path = os.path.abspath(os.path.join(SANDBOX_DIR, path))
+    # Check if it starts with sandbox path
+    return abs_path.startswith(os.path.abspath(SANDBOX_DIR))
+
+def secure_open(path, mode, user_id, ip_address):
+    """Securely open a file (conceptually, returns path if safe)"""
+    filename = secure_filename(path)
+    
+    if not is_safe_path(filename):
+        log_secure_action(user_id, 'secure_open', ip_address, 'failure', f'Path traversal attempt: {path}')
+        raise ValueError("Invalid filename or path traversal attempt.")
+    
+    return os.path.join(SANDBOX_DIR, filename)
+
+def secure_read(path, user_id, ip_address):
+    """Securely read a file"""
+    try:
+        file_path = secure_open(path, 'r', user_id, ip_address)
+        
+        if not os.path.exists(file_path):
+            log_secure_action(user_id, 'secure_read', ip_address, 'failure', f'File not found: {path}')
+            raise FileNotFoundError("File not found.")
+            
+        compression, _ = stored_compression(os.path.basename(file_path), file_path)
+        with io.TextIOWrapper(open_stored(file_path, compression)) as f:
+            content = f.read()
+            
+        log_secure_action(user_id, 'secure_read', ip_address, 'success', f'Read file: {path}')
+        return content
+    except Exception as e:
+        log_secure_action(user_id, 'secure_read', ip_address, 'failure', f'Error reading {path}: {str(e)}')
+        raise e
+
+def secure_write(path, content, user_id, ip_address):
+    """Securely write to a file"""
+    try:
+        file_path = secure_open(path, 'w', user_id, ip_address)
+        
+        # Write a new file rather than in place: the old one may be a
+        # hardlink shared with other names through the blob store
+        data = content if isinstance(content, bytes) else content.encode('utf-8')
+        fd, tmp_path = _sandbox_tempfile('.write-')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, file_path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        from utils.blob_store import detach_file
+        from utils.files_index import record_file
+        detach_file(os.path.basename(file_path))
+        record_file(os.path.basename(file_path), user_id, sha256=hashlib.sha256(data).hexdigest())
+        invalidate_listing_cache(SANDBOX_DIR)
+            
+        log_secure_action(user_id, 'secure_write', ip_address, 'success', f'Wrote to file: {path}')
+        return True
+    except Exception as e:
+        log_secure_action(user_id, 'secure_write', ip_address, 'failure', f'Error writing {path}: {str(e)}')
+        raise e
+
+def _resolve_edits(file_path, edits, compression, size):
+    """
+    Turn edits into sorted (start, stop, replacement bytes) byte ranges.
+
+    Each edit is {"offset", "length", "text"} in bytes or {"line", "lines",
+    "text"} with a 1-based line number; lines=0 inserts before the line.
+    """
+    starts = None
+    resolved = []
+    for edit in edits:
+        if not isinstance(edit, dict) or not isinstance(edit.get('text', ''), str):
+            raise ValueError('Each edit must be an object with a text string.')
+        text = edit.get('text', '').encode('utf-8')
+
+        if 'line' in edit:
+            line, lines = edit['line'], edit.get('lines', 1)
+            if not isinstance(line, int) or not isinstance(lines, int) or line < 1 or lines < 0:
+                raise ValueError('line must be >= 1 and lines >= 0.')
+            if starts is None:
+                starts = get_line_index(file_path, compression) if size else []
+            if line > len(starts) + 1:
+                raise ValueError(f'Line {line} is past the end of the file.')
+            first, last = line - 1, line - 1 + lines
+            start = starts[first] if first < len(starts) else size
+            stop = starts[last] if last < len(starts) else size
+        else:
+            start, length = edit.get('offset'), edit.get('length', 0)
+            if not isinstance(start, int) or not isinstance(length, int) or start < 0 or length < 0:
+                raise ValueError('offset and length must be non-negative integers.')
+            stop = start + length
+            if stop > size:
+                raise ValueError('Edit extends past the end of the file.')
+        resolved.append((start, stop, text))
+
+    resolved.sort(key=lambda r: (r[0], r[1]))
+    for (_, prev_stop, _), (start, _, _) in zip(resolved, resolved[1:]):
+        if start < prev_stop:
+            raise ValueError('Edits must not overlap.')
+    return resolved
+
+def secure_patch(path, edits, user_id, ip_address, chunk_size=None):
+    """
+    Apply range replacements to a file without loading it into memory.
+
+    Unchanged bytes are copied in chunks to a temp file that is renamed
+    over the original and indexed. Returns (new size, sha256 hex digest).
+    """
+    chunk_size = chunk_size or Config.UPLOAD_CHUNK_SIZE
+    try:
+        file_path = secure_open(path, 'w', user_id, ip_address)
+        if not os.path.exists(file_path):
+            raise FileNotFoundError("File not found.")
+
+        # Edits address the uncompressed content; the result is stored plain
+        compression, logical_size = stored_compression(os.path.basename(file_path), file_path)
+        ranges = _resolve_edits(file_path, edits, compression, logical_size)
+        digest = hashlib.sha256()
+        size = 0
+
+        def emit(data):
+            nonlocal size
+            out.write(data)
+            digest.update(data)
+            size += len(data)
+
+        def copy(src, remaining):
+            while remaining is None or remaining > 0:
+                chunk = src.read(chunk_size if remaining is None else min(chunk_size, remaining))
+                if not chunk:
+                    break
+                emit(chunk)
+                if remaining is not None:
+                    remaining -= len(chunk)
+
+        fd, tmp_path = _sandbox_tempfile('.write-')
+        try:
+            with open_stored(file_path, compression) as src, os.fdopen(fd, 'wb') as out:
+                position = 0
+                for start, stop, text in ranges:
+                    copy(src, start - position)
+                    emit(text)
+                    src.seek(stop)
+                    position = stop
+                copy(src, None)
+                out.flush()
+                os.fsync(out.fileno())
+            os.replace(tmp_path, file_path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        from utils.blob_store import detach_file
+        from utils.files_index import record_file
+        detach_file(os.path.basename(file_path))
+        record_file(os.path.basename(file_path), user_id, sha256=digest.hexdigest())
+        invalidate_listing_cache(SANDBOX_DIR)
+
+        log_secure_action(user_id, 'secure_patch', ip_address, 'success', f'Patched file: {path} ({len(ranges)} edits)')
+        return size, digest.hexdigest()
+    except Exception as e:
+        log_secure_action(user_id, 'secure_patch', ip_address, 'failure', f'Error patching {path}: {str(e)}')
+        raise e
+
+def _hash_stream(f, chunk_size):
+    """Return (size, sha256 hex digest) of the rest of file object f"""
+    digest = hashlib.sha256()
+    size = 0
+    while True:
+        chunk = f.read(chunk_size)
+        if not chunk:
+            break
+        digest.update(chunk)
+        size += len(chunk)
+    return size, digest.hexdigest()
+
+def stream_to_sandbox(stream, filename, chunk_size=None, password=None):
+    """
+    Stream data into the sandbox without buffering it in memory.
+
+    Data is copied in fixed-size chunks to a hidden temp file next to the
+    target, fsynced, then atomically renamed over SANDBOX_DIR/filename, so
+    readers never see a partial file. With a password the data is written
+    in the chunked encryption format. Returns (stored size, sha256 hex
+    digest of the stored bytes).
+    """
+    chunk_size = chunk_size or Config.UPLOAD_CHUNK_SIZE
+    if not os.path.exists(SANDBOX_DIR):
+        os.makedirs(SANDBOX_DIR)
+
+    fd, tmp_path = _sandbox_tempfile('.upload-')
+    try:
+        with os.fdopen(fd, 'w+b') as out:
+            if password:
+                encrypt_stream_with_password(stream, out, password)
+                out.seek(0)
+                size, sha256 = _hash_stream(out, chunk_size)
+            else:
+                digest = hashlib.sha256()
+                size = 0
+                while True:
+                    chunk = stream.read(chunk_size)
+                    if not chunk:
+                        break
+                    digest.update(chunk)
+                    size += len(chunk)
+                    out.write(chunk)
+                sha256 = digest.hexdigest()
+            out.flush()
+            os.fsync(out.fileno())
+        os.replace(tmp_path, os.path.join(SANDBOX_DIR, filename))
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+    invalidate_listing_cache(SANDBOX_DIR)
+    return size, sha256
+
+def secure_delete(path, user_id, ip_address):
+    """Securely delete a file"""
+    try:
+        file_path = secure_open(path, 'd', user_id, ip_address)
+        
+        if not os.path.exists(file_path):
+            log_secure_action(user_id, 'secure_delete', ip_address, 'failure', f'File not found: {path}')
+            raise FileNotFoundError("File not found.")
+            
+        os.remove(file_path)
+        from utils.blob_store import detach_file
+        from utils.files_index import remove_file
+        detach_file(os.path.basename(file_path))
+        remove_file(os.path.basename(file_path))
+        invalidate_listing_cache(SANDBOX_DIR)
+        log_secure_action(user_id, 'secure_delete', ip_address, 'success', f'Deleted file: {path}')
+        return True
+    except Exception as e:
+        log_secure_action(user_id, 'secure_delete', ip_address, 'failure', f'Error deleting {path}: {str(e)}')
+        raise e
+
+@timed(SUBPROCESS_SECONDS, label=lambda cmd_parts: (cmd_parts[0],))
+def _run_command(cmd_parts):
+    """Run an allowed command without a shell"""
+    return subprocess.run(
+        cmd_parts,
+        capture_output=True,
+        text=True,
+        timeout=10
+    )
+
+def secure_execute(command, user_id, ip_address):
+    """Securely execute a command without shell injection"""
+    try:
+        cmd_parts = shlex.split(command)
+    except ValueError as e:
+        log_secure_action(user_id, 'secure_execute', ip_address, 'failure', f'Invalid command syntax: {str(e)}')
+        raise ValueError("Invalid command syntax.")
+
+    base_cmd = cmd_parts[0] if cmd_parts else ""
+
+    if base_cmd not in Config.ALLOWED_COMMANDS:
+        log_secure_action(user_id, 'secure_execute', ip_address, 'failure', f'Unauthorized command: {command}')
+        raise ValueError("Command not allowed.")
+
+    try:
+        result = _run_command(cmd_parts)
+
+        status = 'success' if result.returncode == 0 else 'failure'
+        output = result.stdout if result.returncode == 0 else result.stderr
+
+        log_secure_action(user_id, 'secure_execute', ip_address, status, f'Executed: {command}')
+
+        return {
+            'status': status,
+            'output': output,
+            'return_code': result.returncode
+        }
+    except Exception as e:
+        log_secure_action(user_id, 'secure_execute', ip_address, 'failure', f'Execution error: {str(e)}')
+        raise e
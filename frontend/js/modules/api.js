@@ -150,8 +150,24 @@ const logsAPI = {
 
 // File Manager API
 const fileManagerAPI = {
-    async listFiles() {
-        return apiRequest('/files/');
+    async listFiles(params = {}) {
+        // params: sort, order, prefix, cursor, limit
+        const query = new URLSearchParams(params).toString();
+        return apiRequest(query ? `/files/?${query}` : '/files/');
+    },
+
+    async listAllFiles(params = {}) {
+        // Follows next_cursor through every page; resolves to the files array
+        const files = [];
+        let cursor = null;
+        do {
+            const page = { limit: 1000, ...params };
+            if (cursor) page.cursor = cursor;
+            const response = await this.listFiles(page);
+            files.push(...response.data.files);
+            cursor = response.data.next_cursor;
+        } while (cursor);
+        return files;
     },
 
     async createFile(filename, content) {
@@ -161,10 +177,21 @@ const fileManagerAPI = {
         });
     },
 
-    async readFile(filename, passcode = null) {
+    async unlockFile(filename, passcode) {
+        // Returns { unlock_token, expires_in }; send the token as X-Unlock-Token
+        return apiRequest(`/files/${encodeURIComponent(filename)}/unlock`, {
+            method: 'POST',
+            body: JSON.stringify({ passcode })
+        });
+    },
+
+    async readFile(filename, passcode = null, window = {}) {
+        // window: offset and length (bytes), or line and lines
         const headers = {};
         if (passcode) headers['X-File-Passcode'] = passcode;
-        return apiRequest(`/files/${encodeURIComponent(filename)}`, { headers });
+        const query = new URLSearchParams(window).toString();
+        const path = `/files/${encodeURIComponent(filename)}`;
+        return apiRequest(query ? `${path}?${query}` : path, { headers });
     },
 
     async updateFile(filename, content, passcode = null) {
@@ -177,6 +204,17 @@ const fileManagerAPI = {
         });
     },
 
+    async patchFile(filename, edits, etag, passcode = null) {
+        // edits: [{ offset, length, text }] or [{ line, lines, text }]
+        const headers = { 'If-Match': etag };
+        if (passcode) headers['X-File-Passcode'] = passcode;
+        return apiRequest(`/files/${encodeURIComponent(filename)}`, {
+            method: 'PUT',
+            headers: headers,
+            body: JSON.stringify({ edits })
+        });
+    },
+
     async deleteFile(filename, passcode = null) {
         const headers = {};
         if (passcode) headers['X-File-Passcode'] = passcode;
@@ -186,6 +224,27 @@ const fileManagerAPI = {
         });
     },
 
+    async bulkDelete(filenames, passcodes = {}) {
+        return apiRequest('/files/bulk/delete', {
+            method: 'POST',
+            body: JSON.stringify({ filenames, passcodes })
+        });
+    },
+
+    async bulkRestore(items) {
+        return apiRequest('/files/bulk/restore', {
+            method: 'POST',
+            body: JSON.stringify({ items })
+        });
+    },
+
+    async bulkSetPermissions(filenames, permissions) {
+        return apiRequest('/files/bulk/permissions', {
+            method: 'POST',
+            body: JSON.stringify({ filenames, permissions })
+        });
+    },
+
     async uploadFile(formData) {
         const token = localStorage.getItem('token');
         const response = await fetch(`${API_BASE_URL}/files/upload`, {
@@ -198,14 +257,21 @@ const fileManagerAPI = {
         return response.json();
     },
 
-    async downloadFile(filename, passcode = null) {
+    async downloadFile(filename, passcode = null, encryptionPasscode = null) {
         const token = localStorage.getItem('token');
         const headers = {
             'Authorization': `Bearer ${token}`
         };
         if (passcode) headers['X-File-Passcode'] = passcode;
 
-        const response = await fetch(`${API_BASE_URL}/files/download/${encodeURIComponent(filename)}`, {
+        // With an encryption passcode the server streams back the decrypted file
+        let query = '';
+        if (encryptionPasscode) {
+            headers['X-Encryption-Passcode'] = encryptionPasscode;
+            query = '?decrypt=true';
+        }
+
+        const response = await fetch(`${API_BASE_URL}/files/download/${encodeURIComponent(filename)}${query}`, {
             headers: headers
         });
 
@@ -223,8 +289,10 @@ const fileManagerAPI = {
 
 // Recycle Bin API
 const recycleBinAPI = {
-    async list() {
-        return apiRequest('/recycle-bin/');
+    async list(params = {}) {
+        // params: cursor, limit, prefix, since, until, deleted_by (admins)
+        const query = new URLSearchParams(params).toString();
+        return apiRequest(query ? `/recycle-bin/?${query}` : '/recycle-bin/');
     },
 
     async restore(filename) {
@@ -240,8 +308,92 @@ const recycleBinAPI = {
     },
 
     async empty() {
+        // Starts a background job; poll emptyStatus() with the returned job id
         return apiRequest('/recycle-bin/empty', {
-            method: 'POST'
+            method: 'POST',
+            body: JSON.stringify({ confirm: true })
+        });
+    },
+
+    async emptyStatus(jobId) {
+        return apiRequest(`/recycle-bin/empty/${encodeURIComponent(jobId)}`);
+    }
+};
+
+const quotasAPI = {
+    async me() {
+        return apiRequest('/quotas/me');
+    },
+
+    async top(limit = 20) {
+        return apiRequest(`/quotas/top?limit=${limit}`);
+    },
+
+    async setUserQuota(userId, quotaBytes) {
+        return apiRequest(`/quotas/users/${userId}`, {
+            method: 'PUT',
+            body: JSON.stringify({ quota_bytes: quotaBytes })
+        });
+    },
+
+    async recount() {
+        return apiRequest('/quotas/recount', {
+            method: 'POST',
+            body: JSON.stringify({ confirm: true })
         });
     }
 };
+
+const integrityAPI = {
+    async status() {
+        return apiRequest('/integrity/status');
+    },
+
+    async failures(includeResolved = false) {
+        return apiRequest(`/integrity/failures?all=${includeResolved}`);
+    },
+
+    async resolve(failureId, accept = false) {
+        return apiRequest(`/integrity/failures/${failureId}/resolve`, {
+            method: 'POST',
+            body: JSON.stringify({ accept })
+        });
+    }
+};
+
+const profilingAPI = {
+    async status() {
+        return apiRequest('/profiling/status');
+    },
+
+    async start(options = {}) {
+        // options: mode ('cprofile' or 'sample'), endpoints, sample_rate, duration, max_profiles
+        return apiRequest('/profiling/start', {
+            method: 'POST',
+            body: JSON.stringify({ mode: 'cprofile', ...options })
+        });
+    },
+
+    async stop() {
+        return apiRequest('/profiling/stop', {
+            method: 'POST',
+            body: JSON.stringify({ confirm: true })
+        });
+    },
+
+    async profiles(limit = 100) {
+        return apiRequest(`/profiling/profiles?limit=${limit}`);
+    },
+
+    async download(name) {
+        const token = localStorage.getItem('token');
+        const response = await fetch(`${API_BASE_URL}/profiling/profiles/${encodeURIComponent(name)}`, {
+            headers: { 'Authorization': `Bearer ${token}` }
+        });
+        if (!response.ok) {
+            const data = await response.json();
+            throw new Error(data.error || 'Download failed');
+        }
+        return response.blob();
+    }
+};
@@ -20,8 +20,7 @@ async function initializeDashboard() {
 async function loadStatsAndCharts() {
     try {
         // Fetch Files
-        const filesResponse = await fileManagerAPI.listFiles();
-        const files = filesResponse.data.files || [];
+        const files = await fileManagerAPI.listAllFiles();
 
         // Fetch Logs for stats
         const logsResponse = await logsAPI.getLogs(1000); // Get last 1000 logs
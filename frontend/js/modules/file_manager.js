@@ -161,8 +161,7 @@ async function loadFileList() {
     container.innerHTML = '<div class="text-center"><div class="spinner"></div><p>Loading files...</p></div>';
 
     try {
-        const response = await fileManagerAPI.listFiles();
-        let files = response.data.files;
+        let files = await fileManagerAPI.listAllFiles();
 
         if (files.length === 0) {
             container.innerHTML = '<div class="text-center text-muted"><p>No files found.</p></div>';